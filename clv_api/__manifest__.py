@@ -6,11 +6,14 @@
     'summary': "Mobile Warehouse Automation Kit",
     'website': "https://www.cleverence.com/solutions/welcome-wms-odoo-owners/",
     'category': 'Inventory',
-    'version': '18.0.1.333',
+    'version': '18.0.1.346',
     'depends': ['stock'],
     'data': [
+        'security/ir.model.access.csv',
+        'data/clv_api_cron.xml',
         'views/clv_stock_picking_view.xml',
-        'views/clv_api_settings.xml'
+        'views/clv_api_settings.xml',
+        'views/clv_profile_run_view.xml'
     ],
     'images': ['static/images/banner.png'],
     'installable': True,
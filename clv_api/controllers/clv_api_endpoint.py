@@ -1,11 +1,30 @@
+import io
 import json
+import logging
+import zlib
 from typing import Any
 from urllib import parse
 
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from odoo import api, SUPERUSER_ID
 from odoo.http import request, Response
 from odoo.release import version_info
 from odoo.tools import json_default
 
+from .conditional_result import ConditionalResult
+from .ndjson_stream import NdjsonStream, NDJSON_MIME_TYPE
+from ..utils.endpoint_metrics import EndpointMetrics
+from ..utils.request_profiler import ProfilingSettings, RequestProfiler
+from ..utils.response_compressor import DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE, ResponseCompressor
+
+_logger = logging.getLogger(__name__)
+
+# Default maximum size of the decompressed request body (in bytes)
+DEFAULT_MAX_DECOMPRESSED_BODY_SIZE = 64 * 1024 * 1024
+# Size of the compressed request body chunk read at once
+_REQUEST_BODY_CHUNK_SIZE = 64 * 1024
+
 
 def clv_api_endpoint(func):
     """
@@ -13,17 +32,123 @@ def clv_api_endpoint(func):
     """
 
     def wrapper(*args, **kwargs):
+        request.clv_api_metrics = EndpointMetrics.start(request.httprequest.path, '')
         _set_response_preprocessor(request, _preprocess_response)
 
         body = _extract_json_body(request)
         query_params = _extract_query_params(request)
+        request.clv_api_metrics['kind'] = _get_metrics_kind(body, query_params)
 
         new_args = args + (body,)
-        return func(*new_args, **query_params)
 
+        def call():
+            result = func(*new_args, **query_params)
+            if isinstance(result, ConditionalResult):
+                result.resolve(body, query_params, request.httprequest.headers.get('If-None-Match'))
+            return result
+
+        profiling_settings = request.env['clv_api.settings_cache'].get_profiling_settings()
+        if profiling_settings is None:
+            return call()
+        return _call_profiled(request, call, profiling_settings, body)
+
+    # Marks the endpoint to recognize it before the request is dispatched
+    wrapper.clv_api_endpoint = True
     return wrapper
 
 
+def _call_profiled(request, call, profiling_settings: ProfilingSettings, body: dict[str, Any]):
+    """
+    Calls the endpoint handler under profiler if the request is selected by profiling settings
+    and stores captured profile to 'clv_api.profile_run' model.
+    """
+    device_info = body.get('deviceInfo')
+    device_id = device_info.get('deviceId') if isinstance(device_info, dict) else None
+    user_id = request.env.uid
+    if not profiling_settings.is_profiled(user_id, device_id):
+        return call()
+
+    failed = True
+    profiler = RequestProfiler()
+    try:
+        with profiler:
+            result = call()
+        failed = False
+        return result
+    finally:
+        try:
+            # The transaction of the request may be rolled back
+            with request.env.registry.cursor() as cr:
+                api.Environment(cr, SUPERUSER_ID, {})['clv_api.profile_run'].create_from_profiler(
+                    profiler,
+                    request.httprequest.path,
+                    request.clv_api_metrics['kind'],
+                    user_id,
+                    device_id and str(device_id),
+                    failed)
+        except Exception:
+            _logger.warning('Storing of the request profile failed', exc_info=True)
+
+
+def is_clv_api_endpoint(endpoint) -> bool:
+    """
+    True if the routing endpoint is decorated by 'clv_api_endpoint'.
+    """
+    original_endpoint = getattr(endpoint, 'original_endpoint', endpoint)
+    return bool(getattr(original_endpoint, 'clv_api_endpoint', False))
+
+
+def decompress_request_body(request) -> None:
+    """
+    Replaces gzip (or deflate) compressed body of http-request by decompressed one.
+    Must be called before the body is read (parsed as json).
+    @raise BadRequest: If the body is not valid compressed data
+    @raise RequestEntityTooLarge: If the decompressed body exceeds 'clv_api.max_decompressed_body_size' bytes
+    """
+    httprequest = request.httprequest
+    encoding = (httprequest.headers.get('Content-Encoding') or '').strip().lower()
+    if encoding not in ('gzip', 'deflate'):
+        return
+
+    max_size = DEFAULT_MAX_DECOMPRESSED_BODY_SIZE
+    try:
+        max_size = int(request.env['ir.config_parameter'].sudo().get_param(
+            'clv_api.max_decompressed_body_size', DEFAULT_MAX_DECOMPRESSED_BODY_SIZE))
+    except ValueError:
+        pass
+
+    # Odoo (16+) wraps werkzeug request, the body has to be replaced in the wrapped one
+    wsgi_request = getattr(httprequest, '_HTTPRequest__wrapped', httprequest)
+
+    # 'gzip' has a header, 'deflate' is zlib format
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+    body = io.BytesIO()
+    try:
+        while True:
+            chunk = wsgi_request.stream.read(_REQUEST_BODY_CHUNK_SIZE)
+            if not chunk:
+                break
+            # Limits the output, so compression bombs are rejected without inflating them to the memory
+            data = decompressor.decompress(chunk, max_size + 1 - body.tell())
+            body.write(data)
+            if body.tell() > max_size or decompressor.unconsumed_tail:
+                raise RequestEntityTooLarge('Decompressed request body exceeds {} bytes'.format(max_size))
+        body.write(decompressor.flush())
+    except zlib.error as e:
+        raise BadRequest('Invalid {} request body: {}'.format(encoding, e))
+    if body.tell() > max_size:
+        raise RequestEntityTooLarge('Decompressed request body exceeds {} bytes'.format(max_size))
+
+    environ = wsgi_request.environ
+    environ['CONTENT_LENGTH'] = str(body.tell())
+    body.seek(0)
+    environ['wsgi.input'] = body
+    environ.pop('HTTP_CONTENT_ENCODING', None)
+    # Drops the stream and the data already cached by werkzeug
+    wsgi_request.__dict__.pop('stream', None)
+    wsgi_request.__dict__.pop('_cached_data', None)
+
+
 def _extract_json_body(request) -> dict[str, Any]:
     """
     Extracts json body from http-request object as python dictionary.
@@ -57,6 +182,21 @@ def _set_response_preprocessor(request, preprocessor) -> None:
         raise RuntimeError("Function 'set_response_preprocessor' is not implemented for Odoo v{} in the 'clv_api' module. Contact the Cleverence developers for details.".format(odoo_version))
 
 
+def _get_metrics_kind(body: dict[str, Any], query_params: dict[str, Any]) -> str:
+    """
+    Returns table name or document type name of the request used as the label of the metrics.
+    """
+    query = body.get('query')
+    if isinstance(query, dict) and query.get('from'):
+        return str(query['from']).lower()
+    document = body.get('document')
+    if isinstance(document, dict) and document.get('documentTypeName'):
+        return str(document['documentTypeName']).lower()
+    if query_params.get('documentTypeName'):
+        return str(query_params['documentTypeName']).lower()
+    return ''
+
+
 def _preprocess_response(request, result=None, error=None):
     """
     Preprocesses body of Odoo http-response object.
@@ -65,6 +205,58 @@ def _preprocess_response(request, result=None, error=None):
     @param error: error object
     @return:
     """
+    response = _make_response(request, result, error)
+
+    measurement = getattr(request, 'clv_api_metrics', None)
+    if measurement:
+        content_length = response.headers.get('Content-Length')
+        response_bytes = int(content_length) if content_length is not None else None
+        EndpointMetrics.finish(measurement, response_bytes, error is not None)
+        _flush_metrics(request)
+
+    return response
+
+
+def _flush_metrics(request) -> None:
+    """
+    Stores metrics of the worker to the database if it is enabled by 'clv_api.metrics_flush_interval'
+    system parameter (in seconds), so the metrics can be summed across the workers.
+    """
+    try:
+        interval = int(request.env['ir.config_parameter'].sudo().get_param('clv_api.metrics_flush_interval', 0))
+        if not EndpointMetrics.is_flush_due(interval):
+            return
+        # The transaction of the request may be rolled back
+        with request.env.registry.cursor() as cr:
+            api.Environment(cr, SUPERUSER_ID, {})['clv_api.metrics_snapshot'].flush_worker_metrics()
+    except Exception:
+        _logger.warning('Flushing of the endpoints metrics failed', exc_info=True)
+
+
+def _make_response(request, result=None, error=None):
+    """
+    Makes http-response object by the result or the error of the endpoint.
+    """
+    encoding = ResponseCompressor.choose_encoding(request.httprequest.headers.get('Accept-Encoding'))
+    min_size, level = _get_compression_settings(request)
+    endpoint = request.httprequest.path
+
+    if error is None and isinstance(result, NdjsonStream):
+        # Content length is unknown, the response is sent by chunks
+        headers = [('Content-Type', NDJSON_MIME_TYPE), ('Vary', 'Accept-Encoding')]
+        body = result.iter_lines()
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+            body = ResponseCompressor.compress_stream(endpoint, encoding, body, level)
+        return Response(body, status=200, headers=headers, direct_passthrough=True)
+
+    etag = None
+    if error is None and isinstance(result, ConditionalResult):
+        etag = result.etag
+        if result.not_modified:
+            return Response(status=304, headers=[('ETag', etag), ('Vary', 'Accept-Encoding')])
+        result = result.result
+
     default_http_code = 200
     response = {}
     if error is not None:
@@ -73,13 +265,33 @@ def _preprocess_response(request, result=None, error=None):
     if result is not None:
         response = result
     mime = 'application/json'
-    body = json.dumps(response, default=json_default)
+    body = json.dumps(response, default=json_default).encode('utf-8')
+    headers = [('Content-Type', mime), ('Vary', 'Accept-Encoding')]
+    if etag:
+        headers.append(('ETag', etag))
+    if encoding and len(body) >= min_size:
+        body = ResponseCompressor.compress(endpoint, encoding, body, level)
+        headers.append(('Content-Encoding', encoding))
+    headers.append(('Content-Length', len(body)))
     return Response(
         body, status=error and error.pop('http_status', default_http_code) or default_http_code,
-        headers=[('Content-Type', mime), ('Content-Length', len(body))]
+        headers=headers
     )
 
 
+def _get_compression_settings(request) -> tuple[int, int]:
+    """
+    Returns minimal size of the compressed response body and compression level
+    ('clv_api.compression_min_size' and 'clv_api.compression_level' system parameters),
+    the values are cached by 'clv_api.settings_cache' and read without database queries.
+    """
+    try:
+        return request.env['clv_api.settings_cache'].get_compression_settings()
+    except Exception:
+        # The transaction of the failed request is aborted and the values are not cached yet
+        return DEFAULT_COMPRESSION_MIN_SIZE, DEFAULT_COMPRESSION_LEVEL
+
+
 def _extract_pretty_error_test(error) -> str:
     """
     Extracts error message from Odoo error object.
@@ -23,28 +23,35 @@ class CommonUtils:
         DocumentTypeInfo("OUT", "Ship", BusinessLocationType.SRC, True, False, False, False)
     ]
 
-    def get_document_type_info_by_document(self, pick_doc) -> DocumentTypeInfo:
+    def get_document_type_info_by_document(self, env: OdooEnvWrapper, pick_doc) -> DocumentTypeInfo:
         """
         Returns DocumentTypeInfo description of the odoo document. None if not found
+        @param env: Environment
         @param pick_doc: stock.picking document
         @return: DocumentTypeInfo object describes passing odoo stock picking document
         """
         if not pick_doc:
             return None
+        return self._get_memoized(env, ('document_type_info', pick_doc.id),
+                                  lambda: self._compute_document_type_info(pick_doc))
+
+    # noinspection PyMethodMayBeStatic
+    def _compute_document_type_info(self, pick_doc) -> DocumentTypeInfo:
         for doc_type in CommonUtils.document_types:
             if doc_type.odoo_sequence_code == pick_doc.picking_type_id.sequence_code:
                 return doc_type
         return None
 
-    def get_location_parent_path_from_document(self, pick_doc):
+    def get_location_parent_path_from_document(self, env: OdooEnvWrapper, pick_doc):
         """
         Returns path to the parent location of the document location
 
+        @param env: Environment
         @param pick_doc: stock.picking document
         @return: None is it is impossible to determine valid parent path
                 location or string with parent path defined in the current document
         """
-        doc_type = self.get_document_type_info_by_document(pick_doc)
+        doc_type = self.get_document_type_info_by_document(env, pick_doc)
         if not doc_type:
             return None
 
@@ -77,6 +84,10 @@ class CommonUtils:
         @param odoo_doc: stock.picking odoo document
         @return: string with warehouse route
         """
+        return self._get_memoized(env, ('warehouse_route_steps', odoo_doc.id),
+                                  lambda: self._compute_warehouse_route_steps(env, odoo_doc))
+
+    def _compute_warehouse_route_steps(self, env: OdooEnvWrapper, odoo_doc):
         document_warehouse = self.get_document_warehouse(env, odoo_doc)
         if not document_warehouse:
             # raise RuntimeError('No warehouse found for the document')
@@ -84,7 +95,7 @@ class CommonUtils:
             # So route steps is empty.
             return None
 
-        doc_type = self.get_document_type_info_by_document(odoo_doc)
+        doc_type = self.get_document_type_info_by_document(env, odoo_doc)
         if not doc_type:
             raise RuntimeError('Not supported document type')
 
@@ -92,13 +103,18 @@ class CommonUtils:
             return document_warehouse.reception_steps
         return document_warehouse.delivery_steps
 
-    def get_doc_main_location(self, odoo_doc):
+    def get_doc_main_location(self, env: OdooEnvWrapper, odoo_doc):
         """
         Returns effective document location
+        @param env: Environment
         @param odoo_doc: stock.oicking odoo document
         @return: location object ofthe document depends on its type (IN/INT/PICK/SHIP/...)
         """
-        doc_type = self.get_document_type_info_by_document(odoo_doc)
+        return self._get_memoized(env, ('doc_main_location', odoo_doc.id),
+                                  lambda: self._compute_doc_main_location(env, odoo_doc))
+
+    def _compute_doc_main_location(self, env: OdooEnvWrapper, odoo_doc):
+        doc_type = self.get_document_type_info_by_document(env, odoo_doc)
         if not doc_type:
             return False
         doc_location = odoo_doc.location_id
@@ -113,11 +129,15 @@ class CommonUtils:
         @param odoo_doc: stock.picking odoo doc
         @return: stock.warehouse objects which coresponds to the document's source location
         """
-        doc_type = self.get_document_type_info_by_document(odoo_doc)
+        return self._get_memoized(env, ('document_warehouse', odoo_doc.id),
+                                  lambda: self._compute_document_warehouse(env, odoo_doc))
+
+    def _compute_document_warehouse(self, env: OdooEnvWrapper, odoo_doc):
+        doc_type = self.get_document_type_info_by_document(env, odoo_doc)
         if not doc_type:
             raise RuntimeError('Not supported document type')
 
-        doc_location = self.get_doc_main_location(odoo_doc).parent_path
+        doc_location = self.get_doc_main_location(env, odoo_doc).parent_path
 
         # lookup for the second level
         parent_ids = doc_location.split('/')
@@ -133,6 +153,49 @@ class CommonUtils:
             return None
         return finded_wh[0]
 
+    def prefetch_document_warehouses(self, env: OdooEnvWrapper, odoo_docs) -> None:
+        """
+        Resolves warehouses of several documents by two queries and memoizes them,
+        so get_document_warehouse and get_warehouse_route_steps_by_doc do not query the database for these documents.
+        Documents with invalid locations are skipped (they are reported by get_document_warehouse).
+        @param env: Environment
+        @param odoo_docs: stock.picking odoo documents
+        """
+        wh_location_ids = {}
+        for odoo_doc in odoo_docs:
+            if not self.get_document_type_info_by_document(env, odoo_doc):
+                continue
+            parent_ids = (self.get_doc_main_location(env, odoo_doc).parent_path or '').split('/')
+            if len(parent_ids) >= 2 and parent_ids[1].isdigit():
+                wh_location_ids[odoo_doc.id] = int(parent_ids[1])
+        if not wh_location_ids:
+            return
+
+        wh_location_names = {location['id']: location['name'] for location in env['stock.location'].search_read(
+            [('id', 'in', list(set(wh_location_ids.values())))], ['name'])}
+
+        # the first found warehouse is used for each code (the same as get_document_warehouse)
+        warehouses_by_code = {}
+        for warehouse in env['stock.warehouse'].search([('code', 'in', list(set(wh_location_names.values())))]):
+            warehouses_by_code.setdefault(warehouse.code, warehouse)
+
+        for odoo_doc_id, wh_location_id in wh_location_ids.items():
+            if wh_location_id in wh_location_names:
+                env.memo.put(('document_warehouse', odoo_doc_id),
+                             warehouses_by_code.get(wh_location_names[wh_location_id]))
+
+    @staticmethod
+    def _get_memoized(env: OdooEnvWrapper, key, compute):
+        """
+        Returns value from the memoization context of the request, computes it if it is not memoized yet
+        @param env: Environment (the value is always computed if it is not OdooEnvWrapper)
+        @param key: key of the value
+        @param compute: function without arguments computing the value
+        """
+        if not isinstance(env, OdooEnvWrapper):
+            return compute()
+        return env.memo.get_or_compute(key, compute)
+
     def get_odoo_doc_from_device_info(self, env: OdooEnvWrapper, device_info):
         """
         Returns odoo document from device info
@@ -0,0 +1,90 @@
+import hashlib
+import json
+from typing import Any, Callable, Optional
+
+from odoo.tools import json_default
+
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+class ConditionalResult:
+    """
+    Result of the endpoint which is sent only if it differs from the version cached by the client.
+    The version (ETag) is computed from the cheap fingerprint of the records used to build the result,
+    so the result is not built at all if the client sends matching 'If-None-Match' header.
+    """
+
+    def __init__(self, env: OdooEnvWrapper, fingerprint: Any, produce: Callable[[], Any]):
+        """
+        @param env: Environment
+        @param fingerprint: json-serializable value changing whenever the result changes
+        (e.g. the max 'write_date' and the count of the records)
+        @param produce: function without arguments building the result
+        """
+        self._env = env
+        self._fingerprint = fingerprint
+        self._produce = produce
+        self._etag = None
+        self._not_modified = False
+        self._result = None
+
+    @property
+    def etag(self) -> Optional[str]:
+        """
+        Returns ETag of the result (None before the result is resolved)
+        """
+        return self._etag
+
+    @property
+    def not_modified(self) -> bool:
+        """
+        True if the client has actual version of the result
+        """
+        return self._not_modified
+
+    @property
+    def result(self) -> Any:
+        """
+        Returns built result (None if the client has actual version of the result)
+        """
+        return self._result
+
+    def resolve(self, body: dict, query_params: dict, if_none_match: Optional[str]) -> None:
+        """
+        Computes ETag and builds the result if the client does not have it
+        @param body: json body of the request
+        @param query_params: query parameters of the request
+        @param if_none_match: value of 'If-None-Match' header
+        """
+        self._etag = self._compute_etag(body, query_params)
+        self._not_modified = self._etag_matches(if_none_match)
+        if not self._not_modified:
+            self._result = self._produce()
+
+    def _compute_etag(self, body: dict, query_params: dict) -> str:
+        # The result also depends on the request, the user, allowed companies and the settings
+        version = [
+            self._fingerprint,
+            body,
+            query_params,
+            self._env.uid,
+            sorted(self._env.companies.ids),
+            list(self._env.settings_snapshot)
+        ]
+        data = json.dumps(version, default=json_default, sort_keys=True).encode('utf-8')
+        # Weak validator: the body is the same but its encoding (compression) may differ
+        return 'W/"{}"'.format(hashlib.sha1(data).hexdigest())
+
+    def _etag_matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        etag_value = self._etag[2:]
+        for item in if_none_match.split(','):
+            item = item.strip()
+            if item.startswith('W/'):
+                item = item[2:]
+            if item == etag_value:
+                return True
+        return False
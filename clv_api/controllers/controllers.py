@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 from typing import Any
 
+from werkzeug.exceptions import Forbidden
+
 from odoo import http
 from odoo.http import request
 from odoo.release import version_info
 
 from .clv_api_endpoint import clv_api_endpoint
+from .conditional_result import ConditionalResult
 from .documents import DocumentImpl
 from .inventory import InventoryImpl
 from .tables import TablesImpl
+from ..utils.endpoint_metrics import EndpointMetrics
+from ..utils.response_compressor import ResponseCompressor
 from ..utils.type_checker import TypeChecker
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
@@ -71,11 +76,20 @@ class ClvApi(http.Controller):
         limit = TypeChecker.get_as_int(query_params.get('limit'))
         request_count = TypeChecker.get_as_bool(query_params.get('requestCount'))
 
+        if self._is_ndjson_stream_requested(query_params):
+            return self._inventory_impl.stream_items(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                     query_params.get('parentId'),
+                                                     offset,
+                                                     limit,
+                                                     request_count,
+                                                     query_params.get('continuationToken'))
+
         return self._inventory_impl.get_items(OdooEnvWrapper(http.request.env, version_info[0]),
                                               query_params.get('parentId'),
                                               offset,
                                               limit,
-                                              request_count)
+                                              request_count,
+                                              query_params.get('continuationToken'))
 
     @http.route('/Inventory/getItemsByString', type='json', auth='user', methods=['POST'])
     @clv_api_endpoint
@@ -89,11 +103,20 @@ class ClvApi(http.Controller):
         request_count = TypeChecker.get_as_bool(query_params.get('requestCount'))
         match_string = TypeChecker.get_as_str(query_params.get('matchString'))
 
+        if self._is_ndjson_stream_requested(query_params):
+            return self._inventory_impl.stream_items_by_string(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                               match_string,
+                                                               offset,
+                                                               limit,
+                                                               request_count,
+                                                               query_params.get('continuationToken'))
+
         return self._inventory_impl.get_items_by_string(OdooEnvWrapper(http.request.env, version_info[0]),
                                                         match_string,
                                                         offset,
                                                         limit,
-                                                        request_count)
+                                                        request_count,
+                                                        query_params.get('continuationToken'))
 
     @http.route('/Inventory/getItemsByIds', type='json', auth='user', methods=['POST'])
     @clv_api_endpoint
@@ -131,7 +154,8 @@ class ClvApi(http.Controller):
                                                      doc_type_name,
                                                      offset,
                                                      limit,
-                                                     request_count)
+                                                     request_count,
+                                                     query_params.get('continuationToken'))
 
     @http.route('/Documents/getDocument', auth='user', type='json', methods=['POST'])
     @clv_api_endpoint
@@ -143,19 +167,109 @@ class ClvApi(http.Controller):
         search_mode = TypeChecker.get_as_str(query_params.get('searchMode'))
         search_code = TypeChecker.get_as_str(query_params.get('searchCode'))
         doc_type_name = TypeChecker.get_as_str(query_params.get('documentTypeName'))
+        paged_lines = TypeChecker.get_as_bool(query_params.get('pagedLines'))
+
+        env = OdooEnvWrapper(http.request.env, version_info[0])
+        fingerprint = self._documents_impl.get_document_fingerprint(env, search_mode, search_code, doc_type_name)
+        if fingerprint is not None:
+            return ConditionalResult(env, fingerprint,
+                                     lambda: self._documents_impl.get_document(env,
+                                                                               search_mode,
+                                                                               search_code,
+                                                                               doc_type_name,
+                                                                               paged_lines))
 
-        return self._documents_impl.get_document(OdooEnvWrapper(http.request.env, version_info[0]),
+        return self._documents_impl.get_document(env,
                                                  search_mode,
                                                  search_code,
-                                                 doc_type_name)
+                                                 doc_type_name,
+                                                 paged_lines)
+
+    @http.route('/Documents/getDocumentExpectedLines', auth='user', type='json', methods=['POST'])
+    @clv_api_endpoint
+    def get_document_expected_lines(self, body: dict[str, Any], **query_params):
+        """
+        '/Documents/getDocumentExpectedLines' endpoint implementation. Used to get expected lines of stock taking
+        document requested by '/Documents/getDocument' with 'pagedLines=true'.
+        @return: Dictionary with the page of lines and the token of the next page
+        """
+        location_id = TypeChecker.get_as_int(query_params.get('locationId'))
+        return self._documents_impl.get_expected_lines(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                       TypeChecker.get_as_str(query_params.get('searchCode')),
+                                                       TypeChecker.get_as_str(query_params.get('documentTypeName')),
+                                                       location_id or None,
+                                                       TypeChecker.get_as_int(query_params.get('limit')),
+                                                       query_params.get('continuationToken'),
+                                                       self._is_ndjson_stream_requested(query_params))
 
     @http.route('/Documents/setDocument', auth='user', type='json', methods=['POST'])
     @clv_api_endpoint
     def set_document(self, body: dict[str, Any], **query_params):
         """
         '/Documents/setDocument' endpoint implementation. Used to process finished document in odoo.
+        With 'async=true' the document is processed in background and id of the job is returned at once.
+        Repeated requests with the same idempotency key ('Idempotency-Key' header or derived from the document)
+        return the result of the first one.
+        """
+        env = OdooEnvWrapper(http.request.env, version_info[0])
+        async_mode = TypeChecker.get_as_bool(query_params.get('async'))
+        key = self._documents_impl.get_idempotency_key(env,
+                                                       body.get('document'),
+                                                       body.get('deviceInfo'),
+                                                       http.request.httprequest.headers.get('Idempotency-Key'),
+                                                       async_mode)
+        if async_mode:
+            return self._documents_impl.process_idempotent(
+                env, key, lambda: self._documents_impl.enqueue_set_document(env,
+                                                                            body.get('document'),
+                                                                            body.get('deviceInfo')))
+
+        return self._documents_impl.process_idempotent(
+            env, key, lambda: self._documents_impl.set_document(env, body.get('document'), body.get('deviceInfo')))
+
+    @http.route('/Documents/openUploadSession', auth='user', type='json', methods=['POST'])
+    @clv_api_endpoint
+    def open_upload_session(self, body: dict[str, Any], **query_params):
+        """
+        '/Documents/openUploadSession' endpoint implementation. Starts upload of the large document,
+        which actual lines are sent by '/Documents/appendUploadSessionLines' in several batches.
+        @return: Dictionary with id of the session
+        """
+        return self._documents_impl.open_upload_session(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                        body.get('document'),
+                                                        body.get('deviceInfo'))
+
+    @http.route('/Documents/appendUploadSessionLines', auth='user', type='json', methods=['POST'])
+    @clv_api_endpoint
+    def append_upload_session_lines(self, body: dict[str, Any], **query_params):
+        """
+        '/Documents/appendUploadSessionLines' endpoint implementation. Adds batch of actual lines to the upload session.
+        @return: Dictionary with numbers of received and stored lines of the session
+        """
+        return self._documents_impl.append_upload_session_lines(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                                TypeChecker.get_as_int(query_params.get('sessionId')),
+                                                                body.get('actualLines'))
+
+    @http.route('/Documents/commitUploadSession', auth='user', type='json', methods=['POST'])
+    @clv_api_endpoint
+    def commit_upload_session(self, body: dict[str, Any], **query_params):
+        """
+        '/Documents/commitUploadSession' endpoint implementation. Processes the uploaded document
+        the same way as '/Documents/setDocument'.
+        """
+        return self._documents_impl.commit_upload_session(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                          TypeChecker.get_as_int(query_params.get('sessionId')))
+
+    @http.route('/Documents/getSetDocumentStatus', auth='user', type='json', methods=['POST'])
+    @clv_api_endpoint
+    def get_set_document_status(self, body: dict[str, Any], **query_params):
+        """
+        '/Documents/getSetDocumentStatus' endpoint implementation. Used to get progress of the document processing
+        started by '/Documents/setDocument' in async mode.
+        @return: Dictionary with state of the job and the error if processing failed
         """
-        return self._documents_impl.set_document(OdooEnvWrapper(http.request.env, version_info[0]), body.get('document'), body.get('deviceInfo'))
+        return self._documents_impl.get_set_document_status(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                            TypeChecker.get_as_int(query_params.get('jobId')))
 
     @http.route('/Tables/getTable', auth='user', type='json', methods=['POST'])
     @clv_api_endpoint
@@ -168,9 +282,67 @@ class ClvApi(http.Controller):
         limit = TypeChecker.get_as_int(query_params.get('limit'))
         request_count = TypeChecker.get_as_bool(query_params.get('requestCount'))
 
-        return self._tables_impl.get_rows(OdooEnvWrapper(http.request.env, version_info[0]),
+        if self._is_ndjson_stream_requested(query_params):
+            return self._tables_impl.stream_rows(OdooEnvWrapper(http.request.env, version_info[0]),
+                                                 body.get('query'),
+                                                 body.get('deviceInfo'),
+                                                 offset,
+                                                 limit,
+                                                 request_count,
+                                                 query_params.get('continuationToken'))
+
+        env = OdooEnvWrapper(http.request.env, version_info[0])
+        fingerprint = self._tables_impl.get_fingerprint(env, body.get('query'), body.get('deviceInfo'))
+        if fingerprint is not None:
+            return ConditionalResult(env, fingerprint,
+                                     lambda: self._tables_impl.get_rows(env,
+                                                                        body.get('query'),
+                                                                        body.get('deviceInfo'),
+                                                                        offset,
+                                                                        limit,
+                                                                        request_count,
+                                                                        query_params.get('continuationToken')))
+
+        return self._tables_impl.get_rows(env,
                                           body.get('query'),
                                           body.get('deviceInfo'),
                                           offset,
                                           limit,
-                                          request_count)
+                                          request_count,
+                                          query_params.get('continuationToken'))
+
+    @http.route('/Tables/getTableChanges', auth='user', type='json', methods=['POST'])
+    @clv_api_endpoint
+    def tables_get_changes(self, body: dict[str, Any], **query_params):
+        """
+        '/Tables/getTableChanges' endpoint implementation. Used to get table's rows changed since the last sync.
+        @return: Dictionary with upserted rows, deleted rows ids and the next sync token
+        """
+        limit = TypeChecker.get_as_int(query_params.get('limit'))
+        sync_token = TypeChecker.get_as_str(query_params.get('syncToken'))
+
+        return self._tables_impl.get_changes(OdooEnvWrapper(http.request.env, version_info[0]),
+                                             body.get('query'),
+                                             body.get('deviceInfo'),
+                                             sync_token,
+                                             limit)
+
+    @http.route('/clv_api/metrics', auth='user', type='http', methods=['GET'])
+    def metrics(self, **kwargs):
+        """
+        '/clv_api/metrics' endpoint implementation. Returns metrics of the Inventory API endpoints
+        in Prometheus text format (available to administrators only).
+        """
+        if not request.env.user.has_group('base.group_system'):
+            raise Forbidden()
+
+        endpoints, compression = request.env['clv_api.metrics_snapshot'].sudo().get_merged_metrics()
+        body = EndpointMetrics.to_prometheus(endpoints) + ResponseCompressor.to_prometheus(compression)
+        return request.make_response(body, headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+
+    @staticmethod
+    def _is_ndjson_stream_requested(query_params) -> bool:
+        """
+        True if the rows have to be returned as NDJSON stream ('stream=ndjson' query parameter)
+        """
+        return TypeChecker.get_as_str(query_params.get('stream')) == 'ndjson'
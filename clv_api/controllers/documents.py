@@ -1,8 +1,13 @@
+import hashlib
+import json
+from typing import Any, Callable, List, Optional
+
 from .documents_allocation import DocumentAllocationImpl
 from .documents_pick import DocumentPickImpl
 from .documents_receiving import DocumentReceivingImpl
 from .documents_ship import DocumentShipImpl
 from .documents_stock_taking import DocumentStockTakingImpl
+from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -20,7 +25,16 @@ class DocumentImpl:
         'stocktaking': DocumentStockTakingImpl()
     }
 
-    def get_descriptions(self, env: OdooEnvWrapper, document_type_name: str, offset, limit, request_count: bool):
+    # Inventory API names of the document types based on stock.picking (by lower case names)
+    _picking_doc_type_names = {
+        'receiving': 'Receiving',
+        'allocation': 'Allocation',
+        'pick': 'Pick',
+        'ship': 'Ship'
+    }
+
+    def get_descriptions(self, env: OdooEnvWrapper, document_type_name: str, offset, limit, request_count: bool,
+                         continuation_token: str = None):
         """
         Returns document's headers page by passed arguments
         @param env: Environment
@@ -28,27 +42,101 @@ class DocumentImpl:
         @param offset: offset of the requesting page
         @param limit:  maximum number of the records in returning result
         @param request_count: need to return total number of records in filter?
+        @param continuation_token: token of the keyset pagination (offset pagination is used if it is None)
         @return:
         """
         if not document_type_name.lower() in self._doc_processors:
             return {'result': []}
         return self._doc_processors[document_type_name.lower()].get_descriptions(env, document_type_name, offset, limit,
-                                                                                 request_count)
+                                                                                 request_count, continuation_token)
+
+    def refresh_document_descriptions(self, env: OdooEnvWrapper, limit: int = None,
+                                      picking_ids: Optional[List[int]] = None) -> bool:
+        """
+        Refreshes materialized descriptions of the changed stock.picking documents
+        @param env: Environment
+        @param limit: the maximum number of refreshed pickings
+        @param picking_ids: only these pickings are refreshed if they are queued (None - any queued pickings)
+        @return: True if any queued pickings were refreshed
+        """
+        descriptions_model = env['clv_api.document_description'].sudo()
+        if limit:
+            picking_ids = descriptions_model.claim_queued(limit, picking_ids)
+        else:
+            picking_ids = descriptions_model.claim_queued(picking_ids=picking_ids)
+        if not picking_ids:
+            return False
+
+        # Descriptions are stored for all users, so they are built in the fixed language of the main company
+        main_company = descriptions_model.env['res.company'].search([], order='id', limit=1)
+        descriptions_env = descriptions_model.with_context(lang=main_company.partner_id.lang or 'en_US').env
+        sudo_env = OdooEnvWrapper(descriptions_env, env.odoo_version)
+        pickings = sudo_env['stock.picking'].browse(picking_ids).exists()
+        descriptions = {}
+        for document_type_name in self._picking_doc_type_names.values():
+            processor = self._doc_processors[document_type_name.lower()]
+            matched_pickings = pickings.filtered_domain(processor.get_stock_picking_filter(sudo_env, document_type_name))
+            docs = processor.get_model_converter().stock_pickings_to_doc_descriptions(sudo_env, matched_pickings,
+                                                                                      document_type_name)
+            for picking, doc in zip(matched_pickings, docs):
+                descriptions[picking.id] = (document_type_name.lower(), picking.company_id.id or None, doc)
 
-    def get_document(self, env: OdooEnvWrapper, search_mode: str, search_code: str, document_type_name: str):
+        descriptions_model.store(picking_ids, descriptions)
+        return True
+
+    def get_document(self, env: OdooEnvWrapper, search_mode: str, search_code: str, document_type_name: str,
+                     paged_lines: bool = False):
         """
         Returns document with expected and actual(optional) lines
         @param env: Environment
         @param search_mode: How to find document
         @param search_code: Identifier using for the search process
         @param document_type_name: the document's type name
+        @param paged_lines: return stock taking document without expected lines, they are requested by pages
         @return:
         """
         if not document_type_name.lower() in self._doc_processors:
             return {'document': None}
 
         return self._doc_processors[document_type_name.lower()].get_document(env, search_mode, search_code,
-                                                                             document_type_name)
+                                                                             document_type_name, paged_lines)
+
+    def get_expected_lines(self, env: OdooEnvWrapper, search_code: str, document_type_name: str, location_id,
+                           limit, continuation_token: str = None, stream: bool = False):
+        """
+        Returns the page of expected lines of stock taking document
+        @param env: Environment
+        @param search_code: id of the document
+        @param document_type_name: the document's type name (only stock taking is supported)
+        @param location_id: only lines of this location and its children are returned (all lines if not set)
+        @param limit: the maximum number of lines
+        @param continuation_token: token of the page (the first page if not set)
+        @param stream: return all the lines starting from the token as NDJSON stream
+        @return: Dictionary with lines and the token of the next page
+        """
+        if (document_type_name or '').lower() != 'stocktaking':
+            raise RuntimeError('Expected lines by pages are supported only for stock taking documents')
+
+        processor = self._doc_processors['stocktaking']
+        if stream:
+            return processor.stream_expected_lines(env, search_code, location_id, limit, continuation_token)
+        return processor.get_expected_lines(env, search_code, location_id, limit, continuation_token)
+
+    def get_document_fingerprint(self, env: OdooEnvWrapper, search_mode: str, search_code: str,
+                                 document_type_name: str):
+        """
+        Returns version fingerprint of the document (None if the document does not support conditional responses)
+        @param env: Environment
+        @param search_mode: How to find document
+        @param search_code: Identifier using for the search process
+        @param document_type_name: the document's type name
+        @return:
+        """
+        if not document_type_name.lower() in self._doc_processors:
+            return None
+
+        return self._doc_processors[document_type_name.lower()].get_document_fingerprint(env, search_mode, search_code,
+                                                                                         document_type_name)
 
     def set_document(self, env: OdooEnvWrapper, doc, device_info):
         """
@@ -61,3 +149,140 @@ class DocumentImpl:
         if not document_type_name.lower() in self._doc_processors:
             return 200
         return self._doc_processors[document_type_name.lower()].set_document(env, doc, device_info)
+
+    # noinspection PyMethodMayBeStatic
+    def get_idempotency_key(self, env: OdooEnvWrapper, doc, device_info, client_key: Optional[str],
+                            async_mode: bool) -> Optional[str]:
+        """
+        Returns idempotency key of setDocument request
+        @param env: Environment
+        @param doc: Inventory API document
+        @param device_info: Inventory API DeviceInfo
+        @param client_key: key passed by the client in 'Idempotency-Key' header
+        @param async_mode: True if the document is processed in background
+        @return: the client key or the key derived from document id, device id and the hash of the payload
+                 (both prefixed with the user id, so the keys of different users never collide)
+        """
+        if client_key:
+            return 'user:{}:client:{}'.format(env.uid, client_key.strip()[:200])
+        if doc is None:
+            return None
+
+        payload_hash = hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        device_id = device_info.get('deviceId') if device_info else None
+        return 'user:{}:doc:{}:{}:{}:{}'.format(env.uid, doc.get('id'), device_id or '',
+                                               'async' if async_mode else 'sync', payload_hash)
+
+    # noinspection PyMethodMayBeStatic
+    def process_idempotent(self, env: OdooEnvWrapper, key: Optional[str], process: Callable[[], Any]):
+        """
+        Processes setDocument request once per idempotency key, repeated requests get the stored result
+        @param env: Environment
+        @param key: idempotency key (None disables the check)
+        @param process: function processing the document
+        @return: result of the first processing of the key
+        """
+        if not key:
+            return process()
+
+        results = env['clv_api.set_document_result'].sudo()
+        claimed, result = results.claim(key)
+        if not claimed:
+            return result
+
+        result = process()
+        results.store_result(key, result)
+        return result
+
+    # noinspection PyMethodMayBeStatic
+    def enqueue_set_document(self, env: OdooEnvWrapper, doc, device_info):
+        """
+        Stores finished document to be processed in background by cron workers
+        @param env: Environment
+        @param doc: Inventory API document
+        @param device_info: Inventory API DeviceInfo
+        @return: Dictionary with id of the created job
+        """
+        job = env['clv_api.document_job'].enqueue(env, doc, device_info)
+        return {'jobId': str(job.id)}
+
+    # noinspection PyMethodMayBeStatic
+    def open_upload_session(self, env: OdooEnvWrapper, doc, device_info):
+        """
+        Starts upload of the document which actual lines are sent by several requests
+        @param env: Environment
+        @param doc: Inventory API document (without actual lines)
+        @param device_info: Inventory API DeviceInfo
+        @return: Dictionary with id of the session
+        """
+        session = env['clv_api.upload_session'].open_session(env, doc, device_info)
+        return {'sessionId': str(session.id)}
+
+    def append_upload_session_lines(self, env: OdooEnvWrapper, session_id, actual_lines):
+        """
+        Adds batch of actual lines to the upload session. The lines are grouped the same way
+        as the document processing groups them, so only aggregated lines are stored.
+        @param env: Environment
+        @param session_id: id of the session
+        @param actual_lines: list of Inventory API document lines
+        @return: Dictionary with numbers of received and stored lines of the session
+        """
+        session = self._get_upload_session(env, session_id)
+        processor = self._doc_processors.get((session.document_type_name or '').lower())
+        if processor is None:
+            raise RuntimeError('Document type is not supported')
+
+        grouped_lines = {}
+        for actual_line in actual_lines or []:
+            line_wrapper = ClvDocLineWrapper(actual_line)
+            group_key = processor.get_actual_line_group_key(env, line_wrapper)
+            if group_key in grouped_lines:
+                grouped_lines[group_key][2] += line_wrapper.actual_quantity
+            else:
+                grouped_lines[group_key] = [group_key, actual_line, line_wrapper.actual_quantity]
+
+        session.append_lines(grouped_lines.values(), len(actual_lines or []))
+        return {
+            'sessionId': str(session.id),
+            'receivedLineCount': session.received_line_count,
+            'storedLineCount': session.get_line_count()
+        }
+
+    def commit_upload_session(self, env: OdooEnvWrapper, session_id):
+        """
+        Processes the document of the upload session in odoo (repeated commits return the result of the first one)
+        @param env: Environment
+        @param session_id: id of the session
+        @return: result of setDocument processing
+        """
+        session = self._get_upload_session(env, session_id)
+
+        def commit():
+            doc, device_info = session.build_document()
+            result = self.set_document(env, doc, device_info)
+            session.mark_committed()
+            return result
+
+        # A commit retried after the lost response returns the result of the first one
+        return self.process_idempotent(env, 'user:{}:upload_session:{}'.format(env.uid, session.id), commit)
+
+    # noinspection PyMethodMayBeStatic
+    def _get_upload_session(self, env: OdooEnvWrapper, session_id):
+        session = env['clv_api.upload_session'].sudo().browse(session_id).exists() if session_id else None
+        if not session or session.user_id.id != env.uid:
+            raise RuntimeError('Upload session not found')
+        return session
+
+    # noinspection PyMethodMayBeStatic
+    def get_set_document_status(self, env: OdooEnvWrapper, job_id):
+        """
+        Returns progress of the document processing started by setDocument in async mode
+        @param env: Environment
+        @param job_id: id of the job returned by setDocument
+        @return: Dictionary with state of the job
+        """
+        job = env['clv_api.document_job'].sudo().browse(job_id).exists() if job_id else None
+        # Only own jobs are visible to the users except administrators
+        if not job or (job.user_id.id != env.uid and not env.user.has_group('base.group_system')):
+            raise RuntimeError('Document job not found')
+        return job.get_status()
@@ -1,11 +1,14 @@
 import logging
 import threading
 from abc import abstractmethod
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from .common_utils import CommonUtils
-from .document_type_info import BusinessLocationType, DocumentTypeInfo
+from .document_type_info import DocumentTypeInfo
 from .model_converter import ModelConverter
+from ..utils.continuation_token import ContinuationToken
+from ..utils.document_payload_cache import DocumentPayloadCache
+from ..utils.move_line_matching_engine import MoveLineMatchingEngine
 from ..utils.stock_picking_by_actual_doc_factory import StockPickingByActualDocFactory
 from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
 from ..wrappers.clv_doc_wrapper import ClvDocWrapper
@@ -16,6 +19,12 @@ try:
 except ImportError:
     from ..custom.default import after_get_document, after_get_document_descriptions
 
+# Fields of actual lines which differ in the lines of the same goods scanned several times
+_ACTUAL_LINE_VOLATILE_FIELDS = ('uid', 'actualQuantity', 'lastChangeDate', 'registrationDate')
+
+# Minimal number of descriptions read at once when they are filtered by record rules
+DESCRIPTIONS_BATCH_SIZE = 100
+
 
 class DocumentStockPickingImplBase:
     """
@@ -34,51 +43,146 @@ class DocumentStockPickingImplBase:
         """
         pass
 
-    def get_descriptions(self, env: OdooEnvWrapper, document_type_name: str, offset, limit, request_count: bool):
+    # noinspection PyMethodMayBeStatic
+    def get_actual_line_group_key(self, env: OdooEnvWrapper, actual_line: ClvDocLineWrapper) -> tuple:
+        """
+        Returns the key of actual lines which quantities can be summed up before document processing
+        (used to pre-aggregate lines of upload sessions).
+        Lines are matched to stock.move.lines by all their fields, so only the lines equal
+        in everything except quantity and uid are grouped.
+        @param env: Environment
+        @param actual_line: actual line of the document
+        """
+        return tuple(sorted((name, str(value)) for name, value in actual_line.items()
+                            if name not in _ACTUAL_LINE_VOLATILE_FIELDS))
+
+    def get_descriptions(self, env: OdooEnvWrapper, document_type_name: str, offset, limit, request_count: bool,
+                         continuation_token: str = None):
         """
-        Returns list of the document's headers
+        Returns list of the document's headers (materialized in 'clv_api.document_description' model)
         @param env: Environment
         @param document_type_name: document's type name
         @param offset: offset in selected documents page
         @param limit: the maximum number of records in the result
         @param request_count: if need to return the total number of records in query
+        @param continuation_token: token of the keyset pagination (offset pagination is used if it is None)
         @return:
         """
-        filter_list = self.get_stock_picking_filter(env, document_type_name)
-        documents = env['stock.picking'].search(filter_list, limit=limit, offset=offset, order='id DESC')
+        cursor = ContinuationToken.decode(continuation_token)
+        if cursor is not None:
+            offset = 0
+        before_picking_id = int(cursor['id']) if cursor and cursor.get('id') is not None else None
+        descriptions_model = env['clv_api.document_description'].sudo()
+        company_ids = env.companies.ids
+        if env.odoo_version >= 18:
+            env['stock.picking'].check_access('read')
+        else:
+            env['stock.picking'].check_access_rights('read')
+
+        # Descriptions are read as superuser, so record rules of stock.picking are applied to the read rows
+        has_record_rules = bool(env['ir.rule']._compute_domain('stock.picking', 'read'))
+
+        def read_rows():
+            if has_record_rules:
+                return self._read_visible_descriptions(env, descriptions_model, document_type_name, company_ids,
+                                                       offset, limit, before_picking_id)
+            return descriptions_model.read_page(document_type_name, company_ids, offset, limit, before_picking_id)
+
+        rows = read_rows()
+        # The queue is drained by cron, only the queued pickings of the page are refreshed by the request
+        if descriptions_model.refresh_queued([picking_id for picking_id, _ in rows]):
+            rows = read_rows()
         result = {}
         if request_count:
-            result['totalCount'] = len(env['stock.picking'].search(filter_list))
-        docs = [self._model_converter.stock_picking_to_doc_description(env, doc, document_type_name) for doc in documents]
-        result = {'result': after_get_document_descriptions(env, {}, docs) }
+            if has_record_rules:
+                result['totalCount'] = env['stock.picking'].search_count([
+                    ('id', 'in', descriptions_model.read_picking_ids(document_type_name, company_ids))
+                ])
+            else:
+                result['totalCount'] = descriptions_model.read_count(document_type_name, company_ids)
+        docs = [doc for _, doc in rows]
+        result['result'] = after_get_document_descriptions(env, {}, docs)
+        if cursor is not None:
+            result['continuationToken'] = ContinuationToken.encode(
+                {'id': rows[-1][0]} if limit and len(rows) >= limit else None)
         return result
 
-    def get_document(self, env: OdooEnvWrapper, search_mode: str, search_code: str, document_type_name: str):
+    # noinspection PyMethodMayBeStatic
+    def _read_visible_descriptions(self, env: OdooEnvWrapper, descriptions_model, document_type_name: str,
+                                   company_ids, offset, limit, before_picking_id):
+        """
+        Returns the page of descriptions of the pickings visible by record rules of the user.
+        Descriptions are read by batches larger than the page, and the batches are read until the page is filled.
+        @return: list of (picking id, description)
+        """
+        rows = []
+        skip_count = offset or 0
+        batch_size = max((limit or 0) * 2, DESCRIPTIONS_BATCH_SIZE)
+        while True:
+            batch = descriptions_model.read_page(document_type_name, company_ids, 0, batch_size, before_picking_id)
+            pickings = env['stock.picking'].browse([picking_id for picking_id, _ in batch])
+            if env.odoo_version >= 18:
+                visible_ids = set(pickings._filter_access('read').ids)
+            else:
+                visible_ids = set(pickings._filter_access_rules('read').ids)
+            for row in batch:
+                if row[0] not in visible_ids:
+                    continue
+                if skip_count:
+                    skip_count -= 1
+                    continue
+                rows.append(row)
+                if limit and len(rows) >= limit:
+                    return rows
+            if len(batch) < batch_size:
+                return rows
+            before_picking_id = batch[-1][0]
+
+    def get_model_converter(self) -> ModelConverter:
+        """
+        Returns converter of odoo documents to Inventory API objects
+        """
+        return self._model_converter
+
+    def get_document(self, env: OdooEnvWrapper, search_mode: str, search_code: str, document_type_name: str,
+                     paged_lines: bool = False):
         """
         Returns particular document with expected and actual lines
         @param env: Environment
         @param search_mode: how to search document
         @param search_code: the data to search document
         @param document_type_name: expected document's type name
+        @param paged_lines: ignored, lines of stock.picking documents are always returned within the document
         @return:
         """
         doc_result_container = {'document': None}
-        if not search_code:
+        pick_doc = self._find_document(env, search_mode, search_code, document_type_name)
+        if not pick_doc:
             return doc_result_container
 
-        # Ignore document type name for now - not essential for odoo
-        if search_mode.lower() == 'byCode'.lower():
-            stock_picking_id = CommonUtils.decode_stock_picking_id(search_code)
-            pick_docs = env['stock.picking'].search([('id', '=', stock_picking_id)])
-        else:
-            search_domain = self.get_stock_picking_filter(env, document_type_name)
-            search_domain.append(('name', 'ilike', search_code))
-            pick_docs = env['stock.picking'].search(search_domain)
-        if not pick_docs or len(pick_docs) != 1:
-            return doc_result_container
+        # The cached payload is shared by the users, so the version includes everything the payload depends on
+        version = DocumentPayloadCache.make_version(
+            self._get_memoized_version_rows(env, pick_doc),
+            document_type_name,
+            env.lang,
+            sorted(env.companies.ids),
+            list(env.settings_snapshot)
+        )
+        doc = DocumentPayloadCache.get_or_build(env, pick_doc.id, version,
+                                                lambda: self._build_document(env, pick_doc, document_type_name))
+        # The hook runs on every request, the cache stores the payload before customization
+        doc_result_container['document'] = after_get_document(env, {}, doc)
+        return doc_result_container
 
-        pick_doc = pick_docs[0]
-        doc_type = self._cutils.get_document_type_info_by_document(pick_doc)
+    def _build_document(self, env: OdooEnvWrapper, pick_doc, document_type_name: str):
+        """
+        Returns Inventory API document with expected and actual lines assembled from stock.picking
+        @param env: Environment
+        @param pick_doc: stock.picking document
+        @param document_type_name: expected document's type name
+        @return:
+        """
+        doc_type = self._cutils.get_document_type_info_by_document(env, pick_doc)
         doc = self._model_converter.stock_picking_to_doc_description(env, pick_doc, document_type_name)
         doc['expectedLines'] = self._model_converter.stock_picking_to_expected_lines(env, pick_doc)
         ignore_zero_qty_done_actuals = doc_type.actual_lines_ignores_zero_qty_done
@@ -87,8 +191,149 @@ class DocumentStockPickingImplBase:
         actual_lines = self._model_converter.stock_picking_to_actual_lines(env, pick_doc, ignore_zero_qty_done_actuals)
         if actual_lines and len(actual_lines) > 0:
             doc['actualLines'] = actual_lines
-        doc_result_container['document'] = after_get_document(env, {}, doc)
-        return doc_result_container
+        return doc
+
+    def get_document_fingerprint(self, env: OdooEnvWrapper, search_mode: str, search_code: str,
+                                 document_type_name: str):
+        """
+        Returns version fingerprint of the document: the max 'write_date' and the count of the document,
+        its moves, move lines and products
+        @param env: Environment
+        @param search_mode: how to search document
+        @param search_code: the data to search document
+        @param document_type_name: expected document's type name
+        @return: fingerprint or None if the document is not found
+        """
+        pick_doc = self._find_document(env, search_mode, search_code, document_type_name)
+        if not pick_doc:
+            return None
+
+        return self._get_memoized_version_rows(env, pick_doc)
+
+    def _get_memoized_version_rows(self, env: OdooEnvWrapper, pick_doc):
+        """
+        Returns version rows of the document computed once per request
+        (conditional getDocument uses them both for the fingerprint and for the payload cache version)
+        """
+        return env.memo.get_or_compute(('document_version_rows', pick_doc.id),
+                                       lambda: self._get_document_version_rows(env, pick_doc))
+
+    def _get_document_version_rows(self, env: OdooEnvWrapper, pick_doc):
+        """
+        Returns the max 'write_date' and the count of every record the document payload is built from:
+        the document, its moves, move lines, products, templates, units of measure, lots, partner,
+        operation type, warehouse, locations and sales order (if Sales module is installed)
+        @param env: Environment
+        @param pick_doc: stock.picking document
+        @return: list of [model name, max write date, count]
+        """
+        main_location = self._cutils.get_doc_main_location(env, pick_doc)
+        params = {
+            'picking_id': pick_doc.id,
+            'main_location_id': main_location.id if main_location else None
+        }
+        queries = ["""
+            SELECT 'stock.picking', max(write_date), count(*) FROM stock_picking WHERE id = %(picking_id)s
+            UNION ALL
+            SELECT 'stock.move', max(write_date), count(*) FROM stock_move WHERE picking_id = %(picking_id)s
+            UNION ALL
+            SELECT 'stock.move.line', max(write_date), count(*) FROM stock_move_line WHERE picking_id = %(picking_id)s
+            UNION ALL
+            SELECT 'product.product', max(product.write_date), count(*)
+            FROM product_product product WHERE product.id IN (SELECT product_id FROM document_product)
+            UNION ALL
+            SELECT 'product.template', max(template.write_date), count(*)
+            FROM product_template template
+            WHERE template.id IN (SELECT product_tmpl_id FROM product_product
+                                  WHERE id IN (SELECT product_id FROM document_product))
+            UNION ALL
+            SELECT 'product.template.attribute.value', max(value.write_date), count(*)
+            FROM product_template_attribute_value value
+            JOIN product_variant_combination combination ON combination.product_template_attribute_value_id = value.id
+            WHERE combination.product_product_id IN (SELECT product_id FROM document_product)
+            UNION ALL
+            SELECT 'uom.uom', max(uom.write_date), count(*)
+            FROM uom_uom uom
+            WHERE uom.id IN (SELECT template.uom_id FROM product_template template
+                             JOIN product_product product ON product.product_tmpl_id = template.id
+                             WHERE product.id IN (SELECT product_id FROM document_product))
+            UNION ALL
+            SELECT 'stock.lot', max(lot.write_date), count(*)
+            FROM {lot_table} lot
+            WHERE lot.id IN (SELECT lot_id FROM stock_move_line WHERE picking_id = %(picking_id)s)
+            UNION ALL
+            SELECT 'res.partner', max(partner.write_date), count(*)
+            FROM res_partner partner JOIN stock_picking picking ON picking.partner_id = partner.id
+            WHERE picking.id = %(picking_id)s
+            UNION ALL
+            SELECT 'stock.picking.type', max(picking_type.write_date), count(*)
+            FROM stock_picking_type picking_type JOIN stock_picking picking ON picking.picking_type_id = picking_type.id
+            WHERE picking.id = %(picking_id)s
+            UNION ALL
+            SELECT 'stock.warehouse', max(warehouse.write_date), count(*)
+            FROM stock_warehouse warehouse
+            JOIN stock_picking_type picking_type ON picking_type.warehouse_id = warehouse.id
+            JOIN stock_picking picking ON picking.picking_type_id = picking_type.id
+            WHERE picking.id = %(picking_id)s
+            UNION ALL
+            SELECT 'stock.location', max(location.write_date), count(*)
+            FROM stock_location location JOIN stock_picking picking
+                ON location.id IN (picking.location_id, picking.location_dest_id)
+            WHERE picking.id = %(picking_id)s
+            UNION ALL
+            SELECT 'stock.location.children', max(child.write_date), count(*)
+            FROM stock_location child JOIN stock_location parent ON parent.id = %(main_location_id)s
+            WHERE child.active AND child.complete_name LIKE parent.complete_name || '/%%'
+        """.format(lot_table=env.lots._table)]
+
+        sale_field = env['stock.picking']._fields.get('sale_id')
+        if sale_field is not None and sale_field.store:
+            # 'sale_id' and 'payment_term_id' are fields from Sales module
+            queries.append("""
+                SELECT 'sale.order', max(sale.write_date), count(*)
+                FROM sale_order sale JOIN stock_picking picking ON picking.sale_id = sale.id
+                WHERE picking.id = %(picking_id)s
+                UNION ALL
+                SELECT 'account.payment.term', max(term.write_date), count(*)
+                FROM account_payment_term term
+                JOIN sale_order sale ON sale.payment_term_id = term.id
+                JOIN stock_picking picking ON picking.sale_id = sale.id
+                WHERE picking.id = %(picking_id)s
+            """)
+
+        env.cr.execute("""
+            WITH document_product AS (
+                SELECT product_id FROM stock_move WHERE picking_id = %(picking_id)s
+                UNION
+                SELECT product_id FROM stock_move_line WHERE picking_id = %(picking_id)s
+            )
+        """ + " UNION ALL ".join(queries), params)
+        return [[res_model, max_write_date and max_write_date.isoformat(), count]
+                for res_model, max_write_date, count in env.cr.fetchall()]
+
+    def _find_document(self, env: OdooEnvWrapper, search_mode: str, search_code: str, document_type_name: str):
+        """
+        Returns stock.picking document found by search code
+        @param env: Environment
+        @param search_mode: how to search document
+        @param search_code: the data to search document
+        @param document_type_name: expected document's type name
+        @return: found document or None if there is no single document
+        """
+        if not search_code:
+            return None
+
+        # Ignore document type name for now - not essential for odoo
+        if search_mode.lower() == 'byCode'.lower():
+            stock_picking_id = CommonUtils.decode_stock_picking_id(search_code)
+            pick_docs = env['stock.picking'].search([('id', '=', stock_picking_id)])
+        else:
+            search_domain = self.get_stock_picking_filter(env, document_type_name)
+            search_domain.append(('name', 'ilike', search_code))
+            pick_docs = env['stock.picking'].search(search_domain)
+        if not pick_docs or len(pick_docs) != 1:
+            return None
+        return pick_docs[0]
 
     def set_document(self, env: OdooEnvWrapper, doc, device_info):
         """
@@ -101,6 +346,7 @@ class DocumentStockPickingImplBase:
             return 200
 
         odoo_doc = None
+        move_ids_by_key = None
         doc_wrapper = ClvDocWrapper(doc)
 
         if not doc_wrapper.actual_lines:
@@ -112,33 +358,14 @@ class DocumentStockPickingImplBase:
             if not odoo_doc:
                 raise RuntimeError('Odoo document not found')
         else:
-            odoo_doc = StockPickingByActualDocFactory.create(env, doc_wrapper)
+            odoo_doc, move_ids_by_key = StockPickingByActualDocFactory.create_with_moves(env, doc_wrapper)
 
-        doc_type = self._cutils.get_document_type_info_by_document(odoo_doc)
+        doc_type = self._cutils.get_document_type_info_by_document(env, odoo_doc)
 
         with_locations = doc_wrapper.scan_locations
 
         self._logger.debug('Processing document %s, id = %s', odoo_doc.name, str(odoo_doc.id))
-
-        not_processed = {}
-        self._logger.debug('Stage 1 (edit existing lines)')
-        for line in doc_wrapper.actual_lines:
-            if not self._process_set_document_line(env, doc_type, odoo_doc, line,
-                                                   add_to_any_line=False,
-                                                   add_new_line_if_not_declared=False,
-                                                   assign_new_barcodes=True,
-                                                   with_locations=with_locations):
-                not_processed[line.uid] = line
-        self._logger.debug('Stage 1 done')
-
-        self._logger.debug('Stage 2 (less lines need to be added)')
-        for (line_uid, line) in not_processed.items():
-            self._process_set_document_line(env, doc_type, odoo_doc, line,
-                                            add_to_any_line=True,
-                                            add_new_line_if_not_declared=True,
-                                            assign_new_barcodes=False,
-                                            with_locations=with_locations)
-        self._logger.debug('Stage 2 done')
+        self._process_actual_lines(env, doc_type, odoo_doc, doc_wrapper.actual_lines, with_locations, move_ids_by_key)
 
         need_backorder = self._get_auto_create_backorder_setting(env)
         new_ctx = odoo_doc \
@@ -156,285 +383,61 @@ class DocumentStockPickingImplBase:
         new_ctx.button_validate()
         return 200
 
-    def _create_not_picking_backorder_lines(self, odoo_doc):
-        """
-        All lines not need to be back ordered
+    def _process_actual_lines(self, env: OdooEnvWrapper, doc_type: DocumentTypeInfo, odoo_doc,
+                              actual_lines: List[ClvDocLineWrapper], with_locations: bool,
+                              move_ids_by_key: Optional[Dict[Tuple[int, int], int]] = None):
         """
-        result = []
-        for pick_line in odoo_doc:
-            result.append(pick_line.id)
-        return result
-
-    def _log_processing_line(self, line):
-
-        inventory_item_id_str = self._model_converter.clear_to_str(line.get('inventoryItemId'))
-        if inventory_item_id_str:
-            inventory_item_id_str = ' inventory item id = ' + inventory_item_id_str
-
-        inventory_item_name_str = self._model_converter.clear_to_str(line.get('inventoryItemName'))
-        if inventory_item_name_str:
-            inventory_item_name_str = ' inventory item name = ' + inventory_item_name_str
-
-        serial_number_str = self._model_converter.clear_to_str(line.get('serialNumber'))
-        if serial_number_str:
-            serial_number_str = ' serial = ' + serial_number_str
-
-        series_name_str = self._model_converter.clear_to_str(line.get('seriesName'))
-        if series_name_str:
-            series_name_str = ' series = ' + series_name_str
-
-        qty_str = self._model_converter.clear_to_str(line.get('actualQuantity'))
-        if qty_str:
-            qty_str = 'qty = ' + qty_str
-
-        self._logger.debug('Processing line:%s',
-                           inventory_item_id_str, inventory_item_name_str,
-                           serial_number_str,
-                           series_name_str,
-                           qty_str)
-
-    def _process_set_document_line(self,
-                                   env: OdooEnvWrapper,
-                                   doc_type: DocumentTypeInfo,
-                                   odoo_doc,
-                                   line : ClvDocLineWrapper,
-                                   add_to_any_line: bool,
-                                   add_new_line_if_not_declared: bool,
-                                   assign_new_barcodes: bool,
-                                   with_locations: bool) -> bool:
-        """
-        The core of the processing document line. It either modifies an existing odoo's line or
-        creates new one.
+        Applies actual lines to the move lines of the odoo document in two stages:
+        at first the lines are applied to the matching existing lines only,
+        then the rest of lines are applied to any line of the product or added as the new lines
         @param env: Environment
         @param doc_type: documentTypeInfo object which describes odoo doc
         @param odoo_doc: the odoo's document stock.picking object
-        @param line: Inventory API line dictionary object
-        @param add_to_any_line: Can we apply modifications to any found line?
-        @param add_new_line_if_not_declared: Can we add new line if there is no appropriate line to modify
-        @param assign_new_barcodes: Assign barcode to the odoo product if it filled in line and absent in odoo?
+        @param actual_lines: Inventory API actual lines
         @param with_locations: Apply location's filter to find appropriate odoo's document line?
-        @return:
+        @param move_ids_by_key: ids of the document moves by (product id, uom id) (the document created by the device)
         """
+        queries_before = MoveLineMatchingEngine.get_sql_query_count(env)
 
-        self._log_processing_line(line)
+        matching_engine = MoveLineMatchingEngine(env, doc_type, odoo_doc, with_locations, move_ids_by_key)
+        matching_engine.prepare(actual_lines)
 
-        if line.actual_quantity == 0:
-            return False
-
-        odoo_product = env['product.product'].search([('id', '=', int(line.inventory_item_id))])
-        if not odoo_product:
-            raise RuntimeError("Product with id='{}' not found".format(line.inventory_item_id))
-
-        self._logger.debug('Processing product:%s', odoo_product.name)
-
-        if assign_new_barcodes:
-            self._assign_line_barcode_to_odoo_product(odoo_product, line)
-
-        with_serial = odoo_product.product_tmpl_id.tracking == 'serial'
-        if with_serial and not line.serial_number:
-            if doc_type.generate_fake_serial_if_empty and env.w15_settings.scan_serials_on_allocation:
-                line.serial_number = CommonUtils.create_random_fake_serial_number()
-            else:
-                raise RuntimeError('No serial number specified to serial tracking odoo product.')
-
-        with_series = odoo_product.product_tmpl_id.tracking == 'lot'
-        if with_series and not line.series_name:
-            raise RuntimeError('No series specified to the line with series tracking')
-
-        # Trying to find an exactly matching line
-
-        exactly_matching_line_filter = [
-            ('picking_id', '=', odoo_doc.id),
-            ('product_id', '=', odoo_product.id),
-            ('picked', '=', False)
-        ]
-
-        if with_serial:
-            sn = line.serial_number
-            exactly_matching_line_filter.append('|')
-            exactly_matching_line_filter.append(('lot_name', '=', sn))
-            exactly_matching_line_filter.append(('lot_id.name', '=', sn))
-        elif with_series:
-            lot = line.series_name
-            exactly_matching_line_filter.append('|')
-            exactly_matching_line_filter.append(('lot_name', '=', lot))
-            exactly_matching_line_filter.append(('lot_id.name', '=', lot))
-
-        if with_locations:
-            if doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
-                exactly_matching_line_filter.append(('location_dest_id', '=', line.to_location_id))
-            elif doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
-                exactly_matching_line_filter.append(('location_id', '=', line.from_location_id))
-
-        found_lines = env['stock.move.line'].search(exactly_matching_line_filter)
-        if found_lines and len(found_lines) == 1:
-            exact_line = found_lines[0]
-            if self._get_quantity_done(env, exact_line) >= self._get_product_uom_qty(env, exact_line):
-                return True
-
-        if not found_lines and (with_serial or with_series):
-            # Trying to find lines with lot not specified
-            lot_not_specified_line_filter = [
-                ('picking_id', '=', odoo_doc.id),
-                ('product_id', '=', odoo_product.id),
-                ('lot_id', '=', False),
-                '|',
-                ('lot_name', '=', False),
-                ('lot_name', '=', ''),
-                ('picked', '=', False)
-            ]
-            found_lines = env['stock.move.line'].search(lot_not_specified_line_filter)
-
-            # Trying to fine lines with any lot and with zero qty done to replace lot
-            if not found_lines and add_to_any_line:
-                any_zero_qty_line_filter = [
-                    ('picking_id', '=', odoo_doc.id),
-                    ('product_id', '=', odoo_product.id),
-                    '|',
-                    (self._get_quantity_done_name(env), '=', 0),
-                    ('picked', '=', False)
-                ]
-                found_lines = env['stock.move.line'].search(any_zero_qty_line_filter)
-        elif not found_lines:
-            if self._has_valid_bound_move_line(line):
-                found_lines = env['stock.move.line'].search([
-                    ('picking_id', '=', odoo_doc.id),
-                    ('product_id', '=', odoo_product.id),
-                    ('move_id', '=', int(line.bound_document_line_uid))
-                ])
-
-            # Trying to find any containing product line
-            if not found_lines and add_to_any_line:
-                found_lines = env['stock.move.line'].search([
-                    ('picking_id', '=', odoo_doc.id),
-                    ('product_id', '=', odoo_product.id)
-                ])
-
-        self._logger.debug('Found %d possible existing lines to update', len(found_lines))
-
-        # distribute quantity per lines
-        while line.actual_quantity > 0:
-            if found_lines:
-                found_lines = found_lines.filtered(
-                    lambda odoo_line: self._get_product_uom_qty(env, odoo_line) > self._get_quantity_done(env, odoo_line)
-                )
-
-            if found_lines and with_locations:
-                location_id = False
-                if doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
-                    location_id = line.to_location_id
-                elif doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
-                    location_id = line.from_location_id
-
-                found_lines = found_lines.filtered(
-                    lambda odoo_line: self._get_odoo_line_location_id(odoo_doc, odoo_line) == location_id
-                )
-
-            if not found_lines:
-                self._logger.debug('No line find to update')
-                if not add_new_line_if_not_declared:
-                    return False
-                self._logger.debug('Adding new line to the document')
-                self._add_new_move_line(env, odoo_doc, odoo_product, line)
-                break
-
-            found_line = found_lines[0]
-            self._logger.debug('Updating odoo line %d', found_line.id)
-            less_qty = self._get_product_uom_qty(env, found_line) - self._get_quantity_done(env, found_line)
-            add_qty = min(less_qty, line.actual_quantity)
-            self._logger.debug('Found exact line to update id = %d, serial = %s', found_line.id, found_line.lot_name)
-            self._logger.debug('Adding quantity=%f, serial=%s, location_id=%s, location_dest_id=%s',
-                               add_qty,
-                               line.serial_number,
-                               line.from_location_id,
-                               line.to_location_id)
-
-            updating_dict = {
-                self._get_quantity_done_name(env): self._get_quantity_done(env, found_line) + add_qty,
-                'picked': True,
-                'company_id': odoo_doc.company_id.id
-            }
-
-            if with_serial and \
-                    found_line.lot_name != line.serial_number and \
-                    found_line.lot_id.name != line.serial_number:
-                self._process_fake_serial_number_in_lot_storage(env, odoo_doc, found_line, line)
-                self._set_lot_id_or_name_to_update_dict(updating_dict, env, line.serial_number, odoo_product.id)
-            elif with_series and \
-                    found_line.lot_name != line.series_name and \
-                    found_line.lot_id.name != line.series_name:
-                self._set_lot_id_or_name_to_update_dict(updating_dict, env, line.series_name, odoo_product.id)
-            else:
-                self._logger.debug('pass through odoo line lot_id = %s, lot_name = %s',
-                                   self._model_converter.clear_to_str(found_line.lot_id),
-                                   self._model_converter.clear_to_str(found_line.lot_name))
-
-            if with_locations:
-                self._add_line_location_to_line_update_dict(env, odoo_doc, line, updating_dict)
-
-            found_line.write(updating_dict)
-            line.actual_quantity = line.actual_quantity - add_qty
+        not_processed = {}
+        self._logger.debug('Stage 1 (edit existing lines)')
+        for line in actual_lines:
+            if not matching_engine.process_line(line,
+                                                add_to_any_line=False,
+                                                add_new_line_if_not_declared=False,
+                                                assign_new_barcodes=True):
+                not_processed[line.uid] = line
+        self._logger.debug('Stage 1 done')
 
-            if line.actual_quantity > 0:
-                self._logger.debug('We have to add %f more quantity by this line', line.actual_quantity)
+        self._logger.debug('Stage 2 (less lines need to be added)')
+        for (line_uid, line) in not_processed.items():
+            matching_engine.process_line(line,
+                                         add_to_any_line=True,
+                                         add_new_line_if_not_declared=True,
+                                         assign_new_barcodes=False)
+        self._logger.debug('Stage 2 done')
 
-            if with_serial \
-                    and line.actual_quantity > 0 \
-                    and CommonUtils.is_fake_serial_number(line.serial_number):
-                line.serial_number = CommonUtils.create_random_fake_serial_number()
+        matching_engine.flush()
 
-        return True
+        queries_after = MoveLineMatchingEngine.get_sql_query_count(env)
+        if queries_before is not None and queries_after is not None:
+            self._logger.debug('Matching of %d lines done with %d queries (%.2f per line)',
+                               len(actual_lines),
+                               queries_after - queries_before,
+                               (queries_after - queries_before) / len(actual_lines))
+        self._logger.debug('Request memo: %d hits, %d misses', env.memo.hits, env.memo.misses)
 
-    def _set_lot_id_or_name_to_update_dict(self, update_dict, env: OdooEnvWrapper, new_lot: str, product_id: Optional[int] = None):
-        """
-        Sets either existing lot_id or new new_lot name to update dict
-        @param update_dict: update dictionary or the odoo line
-        @param env: Environment
-        @param new_lot: new lot name (series or serial number)
-        @return:
+    def _create_not_picking_backorder_lines(self, odoo_doc):
         """
-        domain_filter = [('name', '=', new_lot)]
-        if product_id:
-            domain_filter.append(('product_id', '=', product_id))
-        if update_dict.get('company_id'):
-            domain_filter.extend(['|', ('company_id', '=', update_dict.get('company_id')), ('company_id', '=', False)])
-        found_lot = env.lots.search(domain_filter)
-        if found_lot:
-            update_dict['lot_id'] = found_lot[0].id
-            update_dict['lot_name'] = None
-            self._logger.debug('line setted existing lot = %s with id = %s', new_lot, str(found_lot[0].id))
-        else:
-            lot = env.lots.create({
-                'product_id': product_id,
-                'name': new_lot,
-                'company_id': update_dict.get('company_id') or False
-            })
-            update_dict['lot_id'] = lot.id
-            update_dict['lot_name'] = None
-            self._logger.debug('line creating new lot = %s', new_lot)
-
-    def _process_fake_serial_number_in_lot_storage(self, env: OdooEnvWrapper, odoo_doc, odoo_line, line: ClvDocLineWrapper):
-        """
-        Processes case when current odoo_line contains fake serial number.
-        It replaces lots and serial table storage.
-        Returns True if proceeded
-        @param env: Environment
-        @param odoo_doc: odoo document
-        @param odoo_line: odoo line
-        @param line: Inventory API line (dictionary)
-        @return:
+        All lines not need to be back ordered
         """
-
-        doc_type = self._cutils.get_document_type_info_by_document(odoo_doc)
-        if not doc_type.can_overwrite_fake_serial_numbers:
-            return
-
-        new_serial = line.serial_number
-        if not new_serial or not odoo_line.lot_id or not CommonUtils.is_fake_serial_number(odoo_line.lot_id.name):
-            return
-
-        self._logger.debug('fake serial number ' + str(odoo_line.lot_id.name) + ' updating to ' + new_serial)
-        odoo_line.lot_id.update({'name': new_serial})
+        result = []
+        for pick_line in odoo_doc:
+            result.append(pick_line.id)
+        return result
 
     def _get_auto_create_backorder_setting(self, env: OdooEnvWrapper) -> bool:
         """
@@ -444,108 +447,6 @@ class DocumentStockPickingImplBase:
         """
         return not env.w15_settings.auto_create_backorders
 
-    def _add_line_location_to_line_update_dict(self, env: OdooEnvWrapper, odoo_doc, line: ClvDocLineWrapper, update_dict):
-        """
-        Adds location id to update dictionary
-        @param env: Environment
-        @param odoo_doc: odoo document
-        @param line: Inventory API line
-        @param update_dict: odoo's line update dictionary
-        @return:
-        """
-        doc_type = self._cutils.get_document_type_info_by_document(odoo_doc)
-        line_storage_id = False
-        if doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
-            line_storage_id = line.to_location_id
-        elif doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
-            line_storage_id = line.from_location_id
-
-        if not line_storage_id:
-            return
-
-        line_location = env['stock.location'].search([('id', '=', int(line_storage_id))])
-        if not line_location:
-            return
-        line_location = line_location[0]
-
-        doc_location = self._cutils.get_doc_main_location(odoo_doc)
-
-        # Verify if line's first storage id corresponds to the document location
-
-        if not line_location.parent_path.startswith(doc_location.parent_path):
-            raise RuntimeError('Document location=%s does not contain line location=%s',
-                               doc_location.parent_path, line_location.parent_path)
-
-        if doc_type.main_location_type == BusinessLocationType.DEST:
-            update_dict['location_dest_id'] = line_location.id
-        else:
-            update_dict['location_id'] = line_location.id
-
-    def _get_odoo_line_location_id(self, odoo_doc, odoo_line):
-        """
-        Returns expected ood's line location id (depends on the document type).
-        @param odoo_doc: odoo document
-        @param odoo_line: odoo's line
-        @return:
-        """
-        doc_type = self._cutils.get_document_type_info_by_document(odoo_doc)
-        if doc_type.main_location_type == BusinessLocationType.DEST:
-            return odoo_line.location_dest_id.id
-        else:
-            return odoo_line.location_id.id
-
-    def _assign_line_barcode_to_odoo_product(self, odoo_product, line: ClvDocLineWrapper):
-        """
-        Assignes barcode to the odoo's product if it is not assigned yet.
-        @param odoo_product: odoo product object
-        @param line: Inventory API line
-        @return:
-        """
-        barcode = line.barcode
-        if not barcode:
-            return
-        if odoo_product.barcode:
-            if odoo_product.barcode != barcode:
-                raise RuntimeError('Can not assign new barcode value to the product.')
-            return
-        odoo_product.write({'barcode': barcode})
-
-    def _add_new_move_line(self, env: OdooEnvWrapper, odoo_doc, odoo_product, line: ClvDocLineWrapper):
-        """
-        Creates and ads new stock.move.line to the odoo stock.picking document
-        @param env: Environment
-        @param odoo_doc: odoo document
-        @param odoo_product: odoo product corresponds to adding line
-        @param line: Inventory API line object
-        @return:
-        """
-        new_item = {
-            'picking_id': odoo_doc.id,
-            'product_id': odoo_product.id,
-            'product_uom_id': odoo_product.uom_id.id,
-            'location_id': odoo_doc.location_id.id,
-            'location_dest_id': odoo_doc.location_dest_id.id,
-            'picked': True,
-            self._get_quantity_done_name(env): line.actual_quantity,
-            'company_id': odoo_doc.company_id.id
-        }
-        if self._has_valid_bound_move_line(line):
-            new_item['move_id'] = int(line.bound_document_line_uid)
-        if odoo_product.product_tmpl_id.tracking == 'serial' and line.serial_number:
-            self._set_lot_id_or_name_to_update_dict(new_item, env, line.serial_number, odoo_product.id)
-        elif odoo_product.product_tmpl_id.tracking == 'lot' and line.series_name:
-            self._set_lot_id_or_name_to_update_dict(new_item, env, line.series_name, odoo_product.id)
-        self._add_line_location_to_line_update_dict(env, odoo_doc, line, new_item)
-        odoo_doc.move_line_ids_without_package.create(new_item)
-
-    def _has_valid_bound_move_line(self, line: ClvDocLineWrapper) -> bool:
-        """
-        Does line contains valid bound line uid value
-        @param line: Inventory API line
-        @return:
-        """
-        return line.bound_document_line_uid.isdigit()
-
     def _trunc_list_length(self, list, length: int):
         """
         Local routing to truncate list
@@ -555,40 +456,3 @@ class DocumentStockPickingImplBase:
         """
         while len(list) > length:
             list.pop()
-
-    def _get_quantity_done(self, env: OdooEnvWrapper, odoo_line):
-        if env.odoo_version >= 17:
-            if odoo_line.picked:
-                return odoo_line.quantity
-            return 0
-        return odoo_line.qty_done
-
-    def _get_quantity_done_name(self, env: OdooEnvWrapper):
-        if env.odoo_version >= 17:
-            return 'quantity'
-        return 'qty_done'
-
-    def _get_product_uom_qty(self, env: OdooEnvWrapper, odoo_line):
-        """
-        Returns valid reserved (expected) odoo line quantity
-        @param odoo_line: odoo document line stock.move.line
-        @return:
-        """
-        if env.odoo_version >= 17:
-            return odoo_line.quantity_product_uom
-        if env.odoo_version >= 16:
-            return odoo_line.reserved_uom_qty
-        else:
-            return odoo_line.product_uom_qty
-
-    def _get_product_uom_qty_name(self, env: OdooEnvWrapper):
-        """
-        Returns the name of the odoo document line reserved (expected) field
-        @return:
-        """
-        if env.odoo_version >= 17:
-            return 'quantity_product_uom'
-        if env.odoo_version >= 16:
-            return 'reserved_uom_qty'
-        else:
-            return 'product_uom_qty'
@@ -4,6 +4,9 @@ from typing import Union, Tuple, List, Any
 
 from .common_utils import CommonUtils
 from .model_converter import ModelConverter
+from .ndjson_stream import NdjsonStream
+from ..utils.continuation_token import ContinuationToken
+from ..utils.lot_resolver import LotResolver
 from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
 from ..wrappers.clv_doc_wrapper import ClvDocWrapper
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
@@ -13,6 +16,9 @@ try:
 except ImportError:
     from ..custom.default import after_get_document, after_get_document_descriptions
 
+# Default number of expected lines returned by one page of getDocumentExpectedLines
+EXPECTED_LINES_PAGE_SIZE = 1000
+
 
 class DocumentStockTakingImpl:
     """
@@ -28,7 +34,8 @@ class DocumentStockTakingImpl:
             document_type_name: str,
             offset: Union[int, None],
             limit: Union[int, None],
-            request_count: Union[bool, None]):
+            request_count: Union[bool, None],
+            continuation_token: Union[str, None] = None):
 
         result = {}
         if request_count:
@@ -36,6 +43,9 @@ class DocumentStockTakingImpl:
             return result
 
         result['result'] =  after_get_document_descriptions(env, {}, self._generate_inv_adj_doc_descriptions(env))
+        if continuation_token is not None:
+            # All stocktaking documents are returned by one page
+            result['continuationToken'] = ''
 
         return result
 
@@ -44,21 +54,67 @@ class DocumentStockTakingImpl:
             env: OdooEnvWrapper,
             search_mode: str,
             search_code: str,
-            document_type_name: str):
+            document_type_name: str,
+            paged_lines: bool = False):
 
-        stock_taking_id = CommonUtils.decode_stock_taking_id(search_code)
-        warehouse_id = stock_taking_id
+        warehouse = self._find_warehouse_by_code(env, search_code)
+        if warehouse:
+            return self._generate_inv_adj_doc(warehouse, env, paged_lines)
 
-        found_warehouses = env['stock.warehouse'].search([
-            ('active', '=', True),
-            ('company_id.active', '=', True),
-            ('id', '=', warehouse_id)
-        ])
+        return None
+
+    def get_expected_lines(
+            self,
+            env: OdooEnvWrapper,
+            search_code: str,
+            location_id: Union[int, None],
+            limit: Union[int, None],
+            continuation_token: Union[str, None]):
+        """
+        Returns the page of expected lines of the document returned by getDocument with paged lines
+        @param env: Environment
+        @param search_code: id of the document
+        @param location_id: only lines of this location and its children are returned (all lines if not set)
+        @param limit: the maximum number of lines in the page
+        @param continuation_token: token of the page (the first page if not set)
+        @return: Dictionary with lines and the token of the next page (empty string if it is the last page)
+        """
+        warehouse = self._find_warehouse_by_code(env, search_code)
+        if not warehouse:
+            raise RuntimeError('Unknown or inactive warehouse id')
 
-        if found_warehouses and len(found_warehouses) > 0:
-            warehouse = found_warehouses[0]
-            return self._generate_inv_adj_doc(warehouse, env)
+        cursor = ContinuationToken.decode(continuation_token) or {}
+        limit = limit or EXPECTED_LINES_PAGE_SIZE
+        doc_id = CommonUtils.encode_stock_taking_id(warehouse.id)
+        expected_lines, last_quant_id = self._read_expected_lines(env, warehouse, doc_id, location_id,
+                                                                  cursor.get('id'), limit)
+        return {
+            'result': expected_lines,
+            'continuationToken': ContinuationToken.encode({'id': last_quant_id} if len(expected_lines) >= limit else None)
+        }
+
+    def stream_expected_lines(
+            self,
+            env: OdooEnvWrapper,
+            search_code: str,
+            location_id: Union[int, None],
+            limit: Union[int, None],
+            continuation_token: Union[str, None]) -> NdjsonStream:
+        """
+        Returns expected lines of the document as NDJSON stream
+        """
+        return NdjsonStream(env,
+                            lambda page_env, page_token, page_limit:
+                            self.get_expected_lines(page_env, search_code, location_id, page_limit, page_token),
+                            0,
+                            limit,
+                            False,
+                            continuation_token)
 
+    # noinspection PyMethodMayBeStatic
+    def get_document_fingerprint(self, env: OdooEnvWrapper, search_mode: str, search_code: str,
+                                 document_type_name: str):
+        # Stock-taking document is generated from the current stock, it is always sent
         return None
 
     def set_document(self, env: OdooEnvWrapper, doc, device_info):
@@ -130,7 +186,7 @@ class DocumentStockTakingImpl:
 
         return descriptions
 
-    def _generate_inv_adj_doc(self, warehouse, env: OdooEnvWrapper):
+    def _generate_inv_adj_doc(self, warehouse, env: OdooEnvWrapper, paged_lines: bool = False):
         # Odoo does not have any specific document for stock taking process,
         # therefore we generate fake inventory adjustment document for each Odoo warehouse.
         scan_locations = env.storage_locations_enabled \
@@ -154,48 +210,90 @@ class DocumentStockTakingImpl:
             'sourceDocumentType': 'StockTaking'
         }
 
-        stock_quants = env['stock.quant'].search([
+        if paged_lines:
+            # Expected lines are requested by pages with getDocumentExpectedLines
+            doc['expectedLines'] = []
+            doc['expectedLinesContinuationToken'] = ''
+        else:
+            doc['expectedLines'] = self._read_expected_lines(env, warehouse, doc['id'], None, None, None)[0]
+        doc['actualLines'] = []
+
+        return {'document': after_get_document(env, {}, doc)}
+
+    def _read_expected_lines(self, env: OdooEnvWrapper, warehouse, doc_id: str, location_id: Union[int, None],
+                             after_quant_id: Union[int, None], limit: Union[int, None]) -> Tuple[List[dict], Union[int, None]]:
+        """
+        Builds expected lines from the quants of the warehouse ordered by id.
+        Only the needed columns are read: quants by one query, then products, units and lots of the page.
+        @return: expected lines and id of the last read quant
+        """
+        domain_filter = [
             ('warehouse_id', '=', warehouse.id),
-            ('location_id.active', '=', True)
-        ])
+            ('location_id.active', '=', True),
+            # Quants with no stock, which were not counted, are skipped
+            '|', '|',
+            ('quantity', '>', 0),
+            ('inventory_quantity_set', '=', True),
+            ('inventory_quantity', '>', 0)
+        ]
+        if location_id:
+            domain_filter.append(('location_id', 'child_of', location_id))
+        if after_quant_id:
+            domain_filter.append(('id', '>', after_quant_id))
+
+        stock_quants = env['stock.quant'].search_read(
+            domain_filter, ['product_id', 'product_uom_id', 'location_id', 'lot_id', 'quantity', 'inventory_quantity'],
+            limit=limit, order='id', load=None)
+        if not stock_quants:
+            return [], None
+
+        products = {row['id']: row for row in env['product.product'].browse(
+            list({quant['product_id'] for quant in stock_quants})).read(['name', 'barcode', 'tracking'], load=None)}
+        uom_names = {row['id']: row['name'] for row in env['uom.uom'].browse(
+            list({quant['product_uom_id'] for quant in stock_quants if quant['product_uom_id']})).read(['name'])}
+        lot_ids = list({quant['lot_id'] for quant in stock_quants if quant['lot_id']})
+        lot_names = {row['id']: row['name'] for row in env.lots.browse(lot_ids).read(['name'])} if lot_ids else {}
 
         expected_lines = []
-        actual_lines = []
-
         for stock_quant in stock_quants:
-            if stock_quant.quantity <= 0 and not stock_quant.inventory_quantity_set and stock_quant.inventory_quantity <= 0:
-                continue
-
+            product = products[stock_quant['product_id']]
             expected_line = {
-                'uid': self._model_converter.clear_to_str(stock_quant.id),
-                'inventoryItemId': self._model_converter.clear_to_str(stock_quant.product_id.id),
-                'expectedQuantity': self._model_converter.clear_to_str(stock_quant.quantity),
-                'actualQuantity': self._model_converter.clear_to_str(stock_quant.inventory_quantity),
-                'unitOfMeasureId': self._model_converter.clear_to_str(stock_quant.product_uom_id.id),
-                'inventoryItemName': self._model_converter.clear_to_str(stock_quant.product_id.name),
-                'inventoryItemBarcode': self._model_converter.clear_to_str(stock_quant.product_id.barcode),
-                'unitOfMeasureName': self._model_converter.clear_to_str(stock_quant.product_uom_id.name),
+                'uid': self._model_converter.clear_to_str(stock_quant['id']),
+                'inventoryItemId': self._model_converter.clear_to_str(stock_quant['product_id']),
+                'expectedQuantity': self._model_converter.clear_to_str(stock_quant['quantity']),
+                'actualQuantity': self._model_converter.clear_to_str(stock_quant['inventory_quantity']),
+                'unitOfMeasureId': self._model_converter.clear_to_str(stock_quant['product_uom_id']),
+                'inventoryItemName': self._model_converter.clear_to_str(product['name']),
+                'inventoryItemBarcode': self._model_converter.clear_to_str(product['barcode']),
+                'unitOfMeasureName': self._model_converter.clear_to_str(uom_names.get(stock_quant['product_uom_id'])),
                 'registrationDate': str(),
-                'documentId': self._model_converter.clear_to_str(doc['id']),
+                'documentId': self._model_converter.clear_to_str(doc_id),
                 'lastChangeDate': str(),
                 'price': str(),
                 'purchasePrice': str(),
                 'sourceDocumentId': str(),
-                'firstStorageId': self._model_converter.clear_to_str(stock_quant.location_id.id)
+                'firstStorageId': self._model_converter.clear_to_str(stock_quant['location_id'])
             }
 
-            if stock_quant.tracking == 'serial':
-                expected_line['serialNumber'] = self._model_converter.clear_to_str(stock_quant.lot_id.name)
-            elif stock_quant.tracking == 'lot':
-                expected_line['seriesId'] = self._model_converter.clear_to_str(stock_quant.lot_id.id)
-                expected_line['seriesName'] = self._model_converter.clear_to_str(stock_quant.lot_id.name)
+            if product['tracking'] == 'serial':
+                expected_line['serialNumber'] = self._model_converter.clear_to_str(lot_names.get(stock_quant['lot_id']))
+            elif product['tracking'] == 'lot':
+                expected_line['seriesId'] = self._model_converter.clear_to_str(stock_quant['lot_id'])
+                expected_line['seriesName'] = self._model_converter.clear_to_str(lot_names.get(stock_quant['lot_id']))
 
             expected_lines.append(expected_line)
 
-        doc['expectedLines'] = expected_lines
-        doc['actualLines'] = actual_lines
+        return expected_lines, stock_quants[-1]['id']
 
-        return {'document': after_get_document(env, {}, doc)}
+    # noinspection PyMethodMayBeStatic
+    def _find_warehouse_by_code(self, env: OdooEnvWrapper, search_code: str):
+        warehouse_id = CommonUtils.decode_stock_taking_id(search_code)
+        found_warehouses = env['stock.warehouse'].search([
+            ('active', '=', True),
+            ('company_id.active', '=', True),
+            ('id', '=', warehouse_id)
+        ], limit=1)
+        return found_warehouses[0] if found_warehouses else None
 
     def _set_inv_adj_doc(self, doc: ClvDocWrapper, device_info, warehouse, env: OdooEnvWrapper):
 
@@ -203,141 +301,220 @@ class DocumentStockTakingImpl:
         rewrite_all_stock = doc.rewrite_all_stock
         rewrite_counted = doc.rewrite_counted
 
-        modified_stock_ids = []
+        count_date = datetime.now()
+        company_id = warehouse.company_id.id
+        modified_quants = []
         if doc.actual_lines:
             expiration_dates_enabled = env.expiration_dates_tracking_enabled
             grouped_actual_lines = self._group_actual_lines(doc.actual_lines, expiration_dates_enabled)
 
+            # Locations, quants and lots of the whole document are read in advance,
+            # the lines are applied to their copies and saved by batched operations after that
+            warehouse_location_ids = self._get_warehouse_location_ids(
+                env, warehouse, {group_key[0] for group_key in grouped_actual_lines if group_key[0]})
+            quants_by_key = self._load_warehouse_quants(
+                env, warehouse, {group_key[1] for group_key in grouped_actual_lines},
+                warehouse_location_ids | {warehouse.lot_stock_id.id})
+            lot_resolver = LotResolver(env, company_id)
+            lot_resolver.prefetch((group_key[3], group_key[1]) for group_key in grouped_actual_lines if group_key[3])
+
             for group_key, actual_qty in grouped_actual_lines.items():
 
                 location_id, product_id, uom_id, lot_name, expiration_date = group_key
 
                 if location_id:
-                    if env['stock.location'].search_count([('id', '=', location_id), ('warehouse_id', '=', warehouse.id)]) < 1:
+                    if location_id not in warehouse_location_ids:
                         raise RuntimeError('Document contains actual line with location of another warehouse')
                 else:
                     location_id = warehouse.lot_stock_id.id
 
-                domain_filter = [
-                    ('product_id.id', '=', product_id),
-                    ('product_uom_id.id', '=', uom_id),
-                    ('location_id.id', '=', location_id),
-                    ('warehouse_id.id', '=', warehouse.id),
-                    ('company_id.id', '=', warehouse.company_id.id)
-                ]
-
-                if lot_name:
-                    domain_filter.append(('lot_id.name', '=', lot_name))
-
-                found_stock_quants = env['stock.quant'].search(domain_filter, limit=1)
-                if found_stock_quants and len(found_stock_quants) > 0:
-                    existing_stock_quant = found_stock_quants[0]
+                candidates = quants_by_key.setdefault((location_id, product_id, uom_id), [])
+                existing_stock_quant = self._find_quant(candidates, lot_name)
+                if existing_stock_quant is not None:
 
                     # In case 'RewriteAllStock' option is disabled and 'stock.quant' line was not modified and was not scanned then skip it
-                    if not existing_stock_quant.inventory_quantity_set and not rewrite_all_stock and actual_qty == 0:
+                    if not existing_stock_quant['inventory_quantity_set'] and not rewrite_all_stock and actual_qty == 0:
                         continue
 
                     inventory_qty = actual_qty
                     if not rewrite_counted:
-                        inventory_qty = inventory_qty + existing_stock_quant.inventory_quantity
+                        inventory_qty = inventory_qty + existing_stock_quant['inventory_quantity']
 
-                    values = {
-                        'inventory_quantity': inventory_qty,
-                        'inventory_quantity_set': True,
-                        'last_count_date': datetime.now()
-                    }
-                    existing_stock_quant.write(values)
-                    if existing_stock_quant.id not in modified_stock_ids:
-                        modified_stock_ids.append(existing_stock_quant.id)
+                    existing_stock_quant['inventory_quantity'] = inventory_qty
+                    existing_stock_quant['inventory_quantity_set'] = True
+                    if not existing_stock_quant['modified']:
+                        existing_stock_quant['modified'] = True
+                        modified_quants.append(existing_stock_quant)
                     continue
 
                 new_stock_quant = {
-                    'product_id': product_id,
-                    'product_uom_id': uom_id,
+                    'id': None,
                     'location_id': location_id,
-                    'quantity': 0,
+                    'product_id': product_id,
+                    'uom_id': uom_id,
+                    'lot_name': lot_name,
+                    'lot_id': None,
                     'inventory_quantity': actual_qty,
                     'inventory_quantity_set': True,
-                    'last_count_date': datetime.now(),
-                    'warehouse_id': warehouse.id,
-                    'company_id': warehouse.company_id.id
+                    'modified': True
                 }
 
                 if lot_name:
-                    found_lots = env.lots.search([
-                        ('product_id', '=', product_id),
-                        ('name', '=', lot_name),
-                        '|',
-                        ('company_id', '=', warehouse.company_id.id),
-                        ('company_id', '=', False)
-                    ], limit=1)
-                    if found_lots and len(found_lots) > 0:
-                        existing_lot = found_lots[0]
-                        new_stock_quant['lot_id'] = existing_lot.id
-                    else:
-                        new_lot = {
-                            'product_id': product_id,
-                            'name': lot_name,
-                            'company_id': warehouse.company_id.id
-                        }
-
-                        # At the current moment, the use of expiration dates is not supported in the Warehouse 15.
-                        # There is implementation only for one specific case - when we inventory new batches with an expiration date
-                        if expiration_dates_enabled and expiration_date:
-                            new_lot['expiration_date'] = expiration_date
-                            new_lot['use_expiration_date'] = True
-
-                        new_lot = env.lots.create(new_lot)
-                        new_stock_quant['lot_id'] = new_lot.id
-
-                new_stock_quant = env['stock.quant'].create(new_stock_quant)
-                if new_stock_quant.id not in modified_stock_ids:
-                    modified_stock_ids.append(new_stock_quant.id)
+                    new_lot = {}
+
+                    # At the current moment, the use of expiration dates is not supported in the Warehouse 15.
+                    # There is implementation only for one specific case - when we inventory new batches with an expiration date
+                    if expiration_dates_enabled and expiration_date:
+                        new_lot['expiration_date'] = expiration_date
+                        new_lot['use_expiration_date'] = True
+
+                    new_stock_quant['lot_id'] = lot_resolver.resolve(lot_name, product_id, new_lot)
+
+                candidates.append(new_stock_quant)
+                modified_quants.append(new_stock_quant)
+
+            lot_resolver.flush()
+            self._save_quants(env, warehouse, modified_quants, count_date)
+
+        modified_stock_ids = [quant['id'] for quant in modified_quants]
 
         if rewrite_all_stock:
             stock_quants = env['stock.quant'].search([
                 ('id', 'not in', modified_stock_ids),
                 ('location_id.active', '=', True),
                 ('warehouse_id.id', '=', warehouse.id),
-                ('company_id.id', '=', warehouse.company_id.id)
+                ('company_id.id', '=', company_id)
             ])
 
-            for stock_quant in stock_quants:
-                stock_quant.write({
-                    'inventory_quantity': 0 if rewrite_counted else stock_quant.inventory_quantity,
+            if rewrite_counted:
+                stock_quants.write({
+                    'inventory_quantity': 0,
                     'inventory_quantity_set': True,
-                    'last_count_date': datetime.now()
+                    'last_count_date': count_date
                 })
+            else:
+                # Counted quantities are kept, so the quants are written by groups with the same quantity
+                quant_ids_by_qty = {}
+                for stock_quant in stock_quants.read(['inventory_quantity']):
+                    quant_ids_by_qty.setdefault(stock_quant['inventory_quantity'], []).append(stock_quant['id'])
+                for inventory_qty, quant_ids in quant_ids_by_qty.items():
+                    env['stock.quant'].browse(quant_ids).write({
+                        'inventory_quantity': inventory_qty,
+                        'inventory_quantity_set': True,
+                        'last_count_date': count_date
+                    })
+
+        if auto_apply_inventory_adjustment and modified_stock_ids:
+            inventory_context = {f'inventory_name': self._generate_completed_inv_adj_doc_name(doc, device_info)}
+            stock_quants = env['stock.quant'].browse(modified_stock_ids).with_context(inventory_context)
+            if isinstance(stock_quants.action_apply_inventory(), dict):
+                # Odoo returns the wizard without applying anything if some tracked products have no lots,
+                # so the quants are applied one by one to skip only those ones (as they were skipped before)
+                for stock_quant in stock_quants:
+                    stock_quant.action_apply_inventory()
+
+    # noinspection PyMethodMayBeStatic
+    def _get_warehouse_location_ids(self, env: OdooEnvWrapper, warehouse, location_ids: set) -> set:
+        """
+        Returns ids of the passed locations which belong to the warehouse
+        """
+        if not location_ids:
+            return set()
+        return set(env['stock.location'].search([('id', 'in', list(location_ids)),
+                                                 ('warehouse_id', '=', warehouse.id)]).ids)
 
-        if auto_apply_inventory_adjustment:
-            for stock_quant_id in modified_stock_ids:
-                stock_quant = env['stock.quant'].search([('id', '=', stock_quant_id)], limit=1)[0]
-                stock_quant \
-                    .with_context({f'inventory_name': self._generate_completed_inv_adj_doc_name(doc, device_info)}) \
-                    .action_apply_inventory()
+    # noinspection PyMethodMayBeStatic
+    def _load_warehouse_quants(self, env: OdooEnvWrapper, warehouse, product_ids: set, location_ids: set) -> dict:
+        """
+        Reads quants of the products in the locations of the warehouse by one query
+        @return: lists of the quants (ordered by id) by (location id, product id, uom id)
+        """
+        quants = env['stock.quant'].search_read([
+            ('product_id', 'in', list(product_ids)),
+            ('location_id', 'in', list(location_ids)),
+            ('warehouse_id', '=', warehouse.id),
+            ('company_id', '=', warehouse.company_id.id)
+        ], ['location_id', 'product_id', 'product_uom_id', 'lot_id', 'inventory_quantity', 'inventory_quantity_set'],
+            order='id')
+
+        lot_ids = list({quant['lot_id'][0] for quant in quants if quant['lot_id']})
+        lot_names = {lot['id']: lot['name'] for lot in env.lots.browse(lot_ids).read(['name'])} if lot_ids else {}
+
+        quants_by_key = {}
+        for quant in quants:
+            key = (quant['location_id'][0], quant['product_id'][0],
+                   quant['product_uom_id'][0] if quant['product_uom_id'] else None)
+            quants_by_key.setdefault(key, []).append({
+                'id': quant['id'],
+                'lot_name': lot_names.get(quant['lot_id'][0]) if quant['lot_id'] else None,
+                'inventory_quantity': quant['inventory_quantity'],
+                'inventory_quantity_set': quant['inventory_quantity_set'],
+                'modified': False
+            })
+        return quants_by_key
+
+    @staticmethod
+    def _find_quant(candidates: List[dict], lot_name: Union[str, None]) -> Union[dict, None]:
+        # The first quant is taken as search(limit=1) did, the lot is not checked if the line has no lot
+        for quant in candidates:
+            if not lot_name or quant['lot_name'] == lot_name:
+                return quant
+        return None
 
     # noinspection PyMethodMayBeStatic
+    def _save_quants(self, env: OdooEnvWrapper, warehouse, quants: List[dict], count_date: datetime) -> None:
+        """
+        Creates new quants by one batched create and writes counted quantities of the existing ones
+        grouped by quantity. Ids of the created quants are set to the passed dictionaries.
+        """
+        existing_quants = [quant for quant in quants if quant['id'] is not None]
+        new_quants = [quant for quant in quants if quant['id'] is None]
+        if new_quants:
+            vals_list = []
+            for quant in new_quants:
+                vals = {
+                    'product_id': quant['product_id'],
+                    'product_uom_id': quant['uom_id'],
+                    'location_id': quant['location_id'],
+                    'quantity': 0,
+                    'inventory_quantity': quant['inventory_quantity'],
+                    'inventory_quantity_set': True,
+                    'last_count_date': count_date,
+                    'warehouse_id': warehouse.id,
+                    'company_id': warehouse.company_id.id
+                }
+                if quant['lot_id'] is not None:
+                    vals['lot_id'] = LotResolver.get_id(quant['lot_id'])
+                vals_list.append(vals)
+
+            for quant, created_quant in zip(new_quants, env['stock.quant'].create(vals_list)):
+                quant['id'] = created_quant.id
+
+        quant_ids_by_qty = {}
+        for quant in existing_quants:
+            quant_ids_by_qty.setdefault(quant['inventory_quantity'], []).append(quant['id'])
+        for inventory_qty, quant_ids in quant_ids_by_qty.items():
+            env['stock.quant'].browse(quant_ids).write({
+                'inventory_quantity': inventory_qty,
+                'inventory_quantity_set': True,
+                'last_count_date': count_date
+            })
+
+    def get_actual_line_group_key(self, env: OdooEnvWrapper, actual_line: ClvDocLineWrapper) -> tuple:
+        """
+        Returns the key of actual lines which quantities are summed up by document processing
+        (used to pre-aggregate lines of upload sessions)
+        @param env: Environment
+        @param actual_line: actual line of the document
+        """
+        return self._get_actual_line_group_key(actual_line, env.expiration_dates_tracking_enabled)
+
     def _group_actual_lines(self, actual_lines: List[ClvDocLineWrapper], fill_expiration_dates: bool) -> dict[Tuple[int|None, int, int, str|None, datetime|bool], float]:
         result = {}
 
         if actual_lines:
             for actual_line in actual_lines:
-                product_id = int(actual_line.inventory_item_id)
-                uom_id = int(actual_line.unit_of_measure_id)
-
-                location_id = None
-                if actual_line.from_location_id:
-                    location_id = int(actual_line.from_location_id)
-
-                lot_name = None
-                if actual_line.serial_number:
-                    lot_name = actual_line.serial_number
-                elif actual_line.series_name:
-                    lot_name = actual_line.series_name
-
-                expiration_date = fill_expiration_dates and actual_line.expiration_date
-
-                group_key = (location_id, product_id, uom_id, lot_name, expiration_date)
+                group_key = self._get_actual_line_group_key(actual_line, fill_expiration_dates)
 
                 if group_key in result:
                     result[group_key] += actual_line.actual_quantity
@@ -346,6 +523,25 @@ class DocumentStockTakingImpl:
 
         return result
 
+    # noinspection PyMethodMayBeStatic
+    def _get_actual_line_group_key(self, actual_line: ClvDocLineWrapper, fill_expiration_dates: bool) -> Tuple[int|None, int, int, str|None, datetime|bool]:
+        product_id = int(actual_line.inventory_item_id)
+        uom_id = int(actual_line.unit_of_measure_id)
+
+        location_id = None
+        if actual_line.from_location_id:
+            location_id = int(actual_line.from_location_id)
+
+        lot_name = None
+        if actual_line.serial_number:
+            lot_name = actual_line.serial_number
+        elif actual_line.series_name:
+            lot_name = actual_line.series_name
+
+        expiration_date = fill_expiration_dates and actual_line.expiration_date
+
+        return location_id, product_id, uom_id, lot_name, expiration_date
+
     # noinspection PyMethodMayBeStatic
     def _generate_completed_inv_adj_doc_name(self, doc: ClvDocWrapper, device_info) -> str:
 
@@ -2,6 +2,8 @@ from typing import List
 
 from .item_barcode_templates_processor import ItemBarcodeTemplatesProcessor
 from .model_converter import ModelConverter
+from .ndjson_stream import NdjsonStream
+from ..utils.continuation_token import ContinuationToken
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -11,7 +13,8 @@ class InventoryImpl:
     """
     _model_converter = ModelConverter()
 
-    def get_items(self, env: OdooEnvWrapper, parent_id: str, offset, limit, request_count: bool):
+    def get_items(self, env: OdooEnvWrapper, parent_id: str, offset, limit, request_count: bool,
+                  continuation_token: str = None):
         """
         Returns the page of the inventory items (products)
         @param env: Environment
@@ -19,10 +22,15 @@ class InventoryImpl:
         @param offset: the first record index to be returned
         @param limit: the maximum number of records
         @param request_count: Need to return total number of records
+        @param continuation_token: token of the keyset pagination (offset pagination is used if it is None)
         @return:
         """
         result = {}
         result_list = []
+        next_cursor = None
+        cursor = ContinuationToken.decode(continuation_token)
+        if cursor is not None:
+            offset = 0
         template_id_for_folder = self._model_converter.get_template_id_from_folder_id(parent_id)
         if not limit:
             limit = 100
@@ -36,26 +44,25 @@ class InventoryImpl:
             if not templates or len(templates) != 1:
                 raise Exception('No such folder with id ' + template_id_for_folder + ' found')
             template = templates[0]
-            for prod in template.product_variant_ids:
-                result_list.append(self._make_inventory_item_result(
-                    self._model_converter.product_to_inventory_item(env, prod),
-                    self._model_converter.product_to_related_data(env, prod)))
+            result_list.extend(self._make_inventory_item_result_list(env, template.product_variant_ids))
         else:
             domain_filter = self._get_base_domain(env)
 
             if request_count:
                 result['totalCount'] = env['product.template'].search_count(domain_filter)
-            product_templates = env['product.template'].search(domain_filter, limit=limit, offset=offset, order='id ASC')
-            for product_template in product_templates:
-                result_list.append(self._make_inventory_item_result(
-                    self._model_converter.product_template_to_inventory_item(env, product_template),
-                    self._model_converter.product_template_to_related_data(env, product_template)))
+            product_templates = env['product.template'].search(ContinuationToken.apply_id_cursor(domain_filter, cursor),
+                                                               limit=limit, offset=offset, order='id ASC')
+            result_list.extend(self._make_inventory_item_result_list_from_templates(env, product_templates))
+            next_cursor = ContinuationToken.get_next_id_cursor(product_templates, limit, cursor)
 
         result['result'] = result_list
+        if cursor is not None:
+            result['continuationToken'] = ContinuationToken.encode(next_cursor)
 
         return result
 
-    def get_items_by_string(self, env: OdooEnvWrapper, match_str: str, offset, limit, request_count: bool):
+    def get_items_by_string(self, env: OdooEnvWrapper, match_str: str, offset, limit, request_count: bool,
+                            continuation_token: str = None):
         """
         Searches products by string match
         @param env: Environment
@@ -63,9 +70,13 @@ class InventoryImpl:
         @param offset: the first record index to be returned
         @param limit: the maximum number of records
         @param request_count: Need to return total number of records
+        @param continuation_token: token of the keyset pagination (offset pagination is used if it is None)
         @return:
         """
         result = {}
+        cursor = ContinuationToken.decode(continuation_token)
+        if cursor is not None:
+            offset = 0
 
         domain_filter = [
             ('name', 'ilike', match_str),
@@ -75,17 +86,55 @@ class InventoryImpl:
         if request_count:
             result['totalCount'] = env['product.template'].search_count(domain_filter)
 
-        product_template_ids = env['product.template'].search(domain_filter, limit=limit, offset=offset, order='id ASC')
-        result_data_list = []
-        for pt_id in product_template_ids:
-            result_data_list.append(self._make_inventory_item_result(
-                self._model_converter.product_template_to_inventory_item(env, pt_id),
-                self._model_converter.product_template_to_related_data(env, pt_id)
-            ))
-        result['result'] = result_data_list
+        product_template_ids = env['product.template'].search(ContinuationToken.apply_id_cursor(domain_filter, cursor),
+                                                              limit=limit, offset=offset, order='id ASC')
+        result['result'] = self._make_inventory_item_result_list_from_templates(env, product_template_ids)
+        if cursor is not None:
+            result['continuationToken'] = ContinuationToken.encode(
+                ContinuationToken.get_next_id_cursor(product_template_ids, limit, cursor))
 
         return result
 
+    def stream_items(self, env: OdooEnvWrapper, parent_id: str, offset, limit, request_count: bool,
+                     continuation_token: str = None) -> NdjsonStream:
+        """
+        Returns the inventory items (products) as NDJSON stream
+        @param env: Environment
+        @param parent_id: parent id for the category or None
+        @param offset: not supported in streaming mode
+        @param limit: the maximum number of records (all records if not set)
+        @param request_count: not supported in streaming mode
+        @param continuation_token: token of the keyset pagination (items are streamed from the beginning if not set)
+        @return:
+        """
+        return NdjsonStream(env,
+                            lambda page_env, page_token, page_limit:
+                            self.get_items(page_env, parent_id, 0, page_limit, False, page_token),
+                            offset,
+                            limit,
+                            request_count,
+                            continuation_token)
+
+    def stream_items_by_string(self, env: OdooEnvWrapper, match_str: str, offset, limit, request_count: bool,
+                               continuation_token: str = None) -> NdjsonStream:
+        """
+        Searches products by string match and returns them as NDJSON stream
+        @param env: Environment
+        @param match_str: string to search by
+        @param offset: not supported in streaming mode
+        @param limit: the maximum number of records (all records if not set)
+        @param request_count: not supported in streaming mode
+        @param continuation_token: token of the keyset pagination (items are streamed from the beginning if not set)
+        @return:
+        """
+        return NdjsonStream(env,
+                            lambda page_env, page_token, page_limit:
+                            self.get_items_by_string(page_env, match_str, 0, page_limit, False, page_token),
+                            offset,
+                            limit,
+                            request_count,
+                            continuation_token)
+
     def get_items_by_ids(self, env: OdooEnvWrapper, ids_list: list):
         """
         Searches products, and it's unit of measures
@@ -96,13 +145,7 @@ class InventoryImpl:
         item_ids = [id_elem['inventoryItemId'] for id_elem in ids_list]
 
         products = env['product.product'].search([('id', 'in', item_ids)])
-        result_data_list = []
-        for prod in products:
-            result_data_list.append(self._make_inventory_item_result(
-                self._model_converter.product_to_inventory_item(env, prod),
-                self._model_converter.product_to_related_data(env, prod)
-            ))
-        return {"result": result_data_list}
+        return {"result": self._make_inventory_item_result_list(env, products)}
 
     def get_items_by_search_code(self, env: OdooEnvWrapper, search_mode, search_data):
         """
@@ -121,7 +164,10 @@ class InventoryImpl:
         if not search_mode:
             search_mode = {'byId': True}
 
-        search_list = []
+        # Products are looked up in the shared barcode index, the database is queried only to read found products
+        barcode_index = env['clv_api.barcode_index']
+        search_defined = False
+        product_ids = []
 
         if 'byId' in search_mode and bool(search_mode['byId']):
             if self._model_converter.is_non_empty_str_in_dict(search_data, 'raw'):
@@ -139,35 +185,25 @@ class InventoryImpl:
                         return {'result': result}
 
                     if raw_id.isdigit():
-                        search_list.append(('id', 'in', [int(raw_id)]))
+                        search_defined = True
+                        product_ids.extend(barcode_index.get_product_ids([int(raw_id)]))
 
         if 'byBarcode' in search_mode and bool(search_mode['byBarcode']):
-            if self._model_converter.is_non_empty_str_in_dict(search_data, 'ean13'):
-                search_list.append(('barcode', '=', search_data['ean13']))
-            if self._model_converter.is_non_empty_str_in_dict(search_data, 'gtin14'):
-                search_list.append(('barcode', '=', search_data['gtin14']))
-            if self._model_converter.is_non_empty_str_in_dict(search_data, 'ean8'):
-                search_list.append(('barcode', '=', search_data['ean8']))
-            if self._model_converter.is_non_empty_str_in_dict(search_data, 'upca'):
-                search_list.append(('barcode', '=', search_data['upca']))
-            if self._model_converter.is_non_empty_str_in_dict(search_data, 'upce'):
-                search_list.append(('barcode', '=', search_data['upce']))
-            if self._model_converter.is_non_empty_str_in_dict(search_data, 'raw'):
-                search_list.append(('barcode', '=', search_data['raw']))
+            for barcode_key in ['ean13', 'gtin14', 'ean8', 'upca', 'upce', 'raw']:
+                if self._model_converter.is_non_empty_str_in_dict(search_data, barcode_key):
+                    search_defined = True
+                    product_ids.extend(barcode_index.get_product_ids_by_barcode(search_data[barcode_key]))
 
         if 'byMarking' in search_mode and bool(search_mode['byMarking']):
-            search_list.append(('default_code', '=', search_data['raw']))
+            search_defined = True
+            product_ids.extend(barcode_index.get_product_ids_by_default_code(search_data['raw']))
 
-        if len(search_list) > 1:
-            new_search_list = []
-            for i in range(0, len(search_list) - 1):
-                new_search_list.append('|')
-            new_search_list.extend(search_list)
-            search_list = new_search_list
-
-        search_list.append(('active', '=', True))
-
-        products = env['product.product'].search(search_list)
+        if not search_defined:
+            products = env['product.product'].search([('active', '=', True)])
+        elif product_ids:
+            products = env['product.product'].search([('id', 'in', list(set(product_ids)))])
+        else:
+            products = env['product.product']
         result.extend(self._make_inventory_item_result_list(env, products))
         return {"result": result}
 
@@ -178,22 +214,13 @@ class InventoryImpl:
             }
 
     def _make_inventory_item_result_list(self, env : OdooEnvWrapper, products):
-        result_data_list = []
-        for prod in products:
-            result_data_list.append(self._make_inventory_item_result(
-                self._model_converter.product_to_inventory_item(env, prod),
-                self._model_converter.product_to_related_data(env, prod)
-            ))
-        return result_data_list
+        return [self._make_inventory_item_result(inventory_item, related_data)
+                for inventory_item, related_data in self._model_converter.products_to_inventory_items(env, products)]
 
     def _make_inventory_item_result_list_from_templates(self, env : OdooEnvWrapper, product_templates):
-        result_data_list = []
-        for prod_template in product_templates:
-            result_data_list.append(self._make_inventory_item_result(
-                self._model_converter.product_template_to_inventory_item(env, prod_template),
-                self._model_converter.product_template_to_related_data(env, prod_template)
-            ))
-        return result_data_list
+        return [self._make_inventory_item_result(inventory_item, related_data)
+                for inventory_item, related_data
+                in self._model_converter.product_templates_to_inventory_items(env, product_templates)]
 
     def _get_base_domain(self, env: OdooEnvWrapper) -> List:
         domain = [('active', '=', True)]
@@ -1,5 +1,6 @@
 from .common_utils import CommonUtils
 from .model_converter import ModelConverter
+from ..utils.stock_quantity_aggregator import StockQuantityAggregator
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -29,7 +30,7 @@ class ItemBarcodeTemplatesProcessor:
     _model_converter = ModelConverter()
 
     @classmethod
-    def _search_item_by_id_and_lot(cls, env: OdooEnvWrapper, template):
+    def _search_item_by_id_and_lot(cls, env: OdooEnvWrapper, template, quantities: dict):
         """
         Returns inventory item with specified lot by values from barcode template.
         """
@@ -53,7 +54,7 @@ class ItemBarcodeTemplatesProcessor:
             return []
 
         inventory_item = cls._model_converter.product_to_inventory_item(env, found_item)
-        related_data = cls._model_converter.product_to_related_data(env, found_item)
+        related_data = cls._model_converter.product_to_related_data(env, found_item, quantities)
 
         related_data['unitOfMeasure'][0]['seriesId'] = cls._model_converter.clear_to_str(found_lot.id)
         related_data['unitOfMeasure'][0]['seriesName'] = cls._model_converter.clear_to_str(found_lot.name)
@@ -61,7 +62,7 @@ class ItemBarcodeTemplatesProcessor:
         return [{'inventoryItem': inventory_item, 'relatedData': related_data}]
 
     @classmethod
-    def _search_item_by_id(cls, env: OdooEnvWrapper, template):
+    def _search_item_by_id(cls, env: OdooEnvWrapper, template, quantities: dict):
         """
         Returns inventory item by id from parsed barcode template.
         """
@@ -80,7 +81,7 @@ class ItemBarcodeTemplatesProcessor:
             return []
 
         inventory_item = cls._model_converter.product_to_inventory_item(env, found_item)
-        related_data = cls._model_converter.product_to_related_data(env, found_item)
+        related_data = cls._model_converter.product_to_related_data(env, found_item, quantities)
 
         return [{'inventoryItem': inventory_item, 'relatedData': related_data}]
 
@@ -92,23 +93,31 @@ class ItemBarcodeTemplatesProcessor:
         if not barcode_templates:
             return []
 
+        # Quantities of all items referenced by the templates are computed by one query
+        item_ids = []
+        for template in barcode_templates:
+            item_id = {key.lower(): value for key, value in (template or {}).items()}.get('inventoryItemId'.lower())
+            if isinstance(item_id, str) and item_id.isdigit():
+                item_ids.append(int(item_id))
+        quantities = StockQuantityAggregator.get_quantities(env, env['product.product'].browse(item_ids).exists().ids)
+
         result = []
         for template in barcode_templates:
-            items = cls._search_by_template(env, template)
+            items = cls._search_by_template(env, template, quantities)
             result.extend(items)
 
         return result
 
     @classmethod
-    def _search_by_template(cls, env: OdooEnvWrapper, barcode_template):
+    def _search_by_template(cls, env: OdooEnvWrapper, barcode_template, quantities: dict):
         if not barcode_template:
             return []
 
         normalized_template = {key.lower(): value for key, value in barcode_template.items()}
 
         if 'inventoryItemId'.lower() in normalized_template and 'seriesName'.lower() in normalized_template:
-            return cls._search_item_by_id_and_lot(env, normalized_template)
+            return cls._search_item_by_id_and_lot(env, normalized_template, quantities)
         elif 'inventoryItemId'.lower() in normalized_template:
-            return cls._search_item_by_id(env, normalized_template)
+            return cls._search_item_by_id(env, normalized_template, quantities)
 
         return []
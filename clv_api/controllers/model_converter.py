@@ -1,4 +1,6 @@
 from .common_utils import CommonUtils
+from ..utils.move_line_matching_engine import MoveLineMatchingEngine
+from ..utils.stock_quantity_aggregator import StockQuantityAggregator
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 FOLDER_ID_PREFIX = 'folder_'
@@ -65,31 +67,126 @@ class ModelConverter:
             'unitOfMeasureId': str(prod.uom_id.id),
         })
 
-    def product_to_related_data(self, env: OdooEnvWrapper, prod):
+    def product_to_related_data(self, env: OdooEnvWrapper, prod, quantities: dict = None):
         """
         Create related data from the product (fills only unit of measure array)
         @param env:
         @param prod:
+        @param quantities: preloaded on hand quantities by product id
         @return:
         """
-        return {'unitOfMeasure': self.product_to_unit_of_measure(env, prod)}
+        return {'unitOfMeasure': self.product_to_unit_of_measure(env, prod, quantities)}
 
-    def product_to_unit_of_measure(self, env: OdooEnvWrapper, prod):
+    def product_to_unit_of_measure(self, env: OdooEnvWrapper, prod, quantities: dict = None):
         """
         Converts base uom of the product to UnitOfMeasure object
         @param env:
         @param prod:
+        @param quantities: preloaded on hand quantities by product id (computed for the product if not passed)
         @return:
         """
         packaging = []
         if prod.uom_id:
+            if quantities is None or prod.id not in quantities:
+                quantities = StockQuantityAggregator.get_quantities(env, [prod.id])
             packaging.append({
                 'id': str(prod.uom_id.id),
                 'inventoryItemId': str(prod.id),
                 'name': prod.uom_id.name,
                 'unitsQuantity': 1,
                 'price': 1 * prod.lst_price,
-                'stockQuantity': prod.qty_available,
+                'stockQuantity': quantities[prod.id],
+            })
+        return packaging
+
+    def products_to_inventory_items(self, env: OdooEnvWrapper, products):
+        """
+        Converts products to the list of (InventoryItem, related data) pairs.
+        Fields of all products are read at once, so the number of queries does not depend on the number of products
+        @param env:
+        @param products: product.product recordset
+        @return:
+        """
+        if not products:
+            return []
+
+        rows = products.read(['name', 'barcode', 'default_code', 'tracking', 'uom_id', 'lst_price'], load=None)
+        uom_ids = list({row['uom_id'] for row in rows if row['uom_id']})
+        uom_names = {uom['id']: uom['name'] for uom in env['uom.uom'].browse(uom_ids).read(['name'])}
+        quantities = StockQuantityAggregator.get_quantities(env, products.ids)
+
+        # The names are already read, so the overridable hook does not produce queries
+        names = {prod.id: self._get_product_name(prod) for prod in products}
+
+        result = []
+        for row in rows:
+            result.append((self._product_row_to_inventory_item(row, names[row['id']]),
+                           {'unitOfMeasure': self._product_row_to_unit_of_measure(row, uom_names, quantities)}))
+        return result
+
+    def product_templates_to_inventory_items(self, env: OdooEnvWrapper, prod_tmpls):
+        """
+        Converts product templates to the list of (InventoryItem, related data) pairs
+        (the batch version of product_template_to_inventory_item and product_template_to_related_data).
+        @param env:
+        @param prod_tmpls: product.template recordset
+        @return:
+        """
+        if not prod_tmpls:
+            return []
+
+        tmpl_rows = prod_tmpls.read(['name', 'barcode', 'product_variant_count', 'product_variant_ids', 'uom_id'],
+                                    load=None)
+        variant_ids = [row['product_variant_ids'][0] for row in tmpl_rows if row['product_variant_count'] == 1]
+        variants = dict(zip(variant_ids,
+                            self.products_to_inventory_items(env, env['product.product'].browse(variant_ids))))
+
+        result = []
+        for row in tmpl_rows:
+            if row['product_variant_count'] == 1:
+                result.append(variants[row['product_variant_ids'][0]])
+            else:
+                result.append(({
+                    'id': FOLDER_ID_PREFIX + str(row['id']),
+                    'name': row['name'],
+                    'barcode': row['barcode'] or "",
+                    'isFolder': True,
+                    'unitOfMeasureId': str(row['uom_id'] or False),
+                }, {'unitOfMeasure': []}))
+        return result
+
+    def _product_row_to_inventory_item(self, row: dict, name: str):
+        """
+        Converts product fields read by products_to_inventory_items to the InventoryItem object
+        @param row: product fields
+        @param name: product name returned by _get_product_name
+        """
+        return self._clear_output_dict({
+            'id': str(row['id']),
+            'name': name,
+            'barcode': row['barcode'] or "",
+            'marking': self.clear_to_str(row['default_code']),
+            'isFolder': False,
+            'withSerialNumber': row['tracking'] == 'serial',
+            'withSeries': row['tracking'] == 'lot',
+            'seriesKey': str(row['id']),
+            'unitOfMeasureId': str(row['uom_id'] or False),
+        })
+
+    # noinspection PyMethodMayBeStatic
+    def _product_row_to_unit_of_measure(self, row: dict, uom_names: dict, quantities: dict):
+        """
+        Converts product fields read by products_to_inventory_items to UnitOfMeasure objects
+        """
+        packaging = []
+        if row['uom_id']:
+            packaging.append({
+                'id': str(row['uom_id']),
+                'inventoryItemId': str(row['id']),
+                'name': uom_names[row['uom_id']],
+                'unitsQuantity': 1,
+                'price': 1 * row['lst_price'],
+                'stockQuantity': quantities[row['id']],
             })
         return packaging
 
@@ -181,6 +278,22 @@ class ModelConverter:
 
         return self._clear_output_dict(vals)
 
+    def stock_pickings_to_doc_descriptions(self, env: OdooEnvWrapper, picks, document_type_name) -> list:
+        """
+        Fills InventoryAPI Document (header) objects of the page of odoo stock.picking documents.
+        Warehouses and child locations of all the documents are resolved in advance,
+        so the number of queries does not depend on the number of documents.
+        @param env: Odoo Environment object.
+        @param picks: odoo documents
+        @param document_type_name: the type of the Inventory API documents
+        @return: list of document headers
+        """
+        if picks:
+            self.cutils.prefetch_document_warehouses(env, picks)
+            if env.storage_locations_enabled:
+                self._prefetch_warehouses_contain_locations(env, picks)
+        return [self.stock_picking_to_doc_description(env, pick, document_type_name) for pick in picks]
+
     def _stock_picking_get_scan_locations(self, env: OdooEnvWrapper, pick):
         """
         True if we need to scan locations on mobile device
@@ -188,30 +301,75 @@ class ModelConverter:
         if not env.storage_locations_enabled:
             return False
 
-        doc_type = self.cutils.get_document_type_info_by_document(pick)
+        doc_type = self.cutils.get_document_type_info_by_document(env, pick)
         if doc_type.can_ignore_scan_locations:
-            route = self.cutils.get_warehouse_route_steps_by_doc(pick.env, pick)
+            route = self.cutils.get_warehouse_route_steps_by_doc(env, pick)
             if route == "two_steps" or route == "pick_ship":
                 return False
 
-        if not self._if_warehouse_contains_locations(pick):
+        if not self._if_warehouse_contains_locations(env, pick):
             return False
 
         return pick.scan_locations
 
-    def _if_warehouse_contains_locations(self, pick):
+    def _if_warehouse_contains_locations(self, env: OdooEnvWrapper, pick):
         """
         True if document location contains any children, False otherwise
         """
-        doc_location = self.cutils.get_doc_main_location(pick)
-        child_location_filter = []
-        self.cutils.append_company_filter(child_location_filter, pick.company_id.id)
-        child_location_filter.append(('complete_name', '=like', doc_location.complete_name + '/%'))
-        return len(pick.env['stock.location'].search(child_location_filter, limit=1)) == 1
+        def compute():
+            doc_location = self.cutils.get_doc_main_location(env, pick)
+            child_location_filter = []
+            self.cutils.append_company_filter(child_location_filter, pick.company_id.id)
+            child_location_filter.append(('complete_name', '=like', doc_location.complete_name + '/%'))
+            return len(pick.env['stock.location'].search(child_location_filter, limit=1)) == 1
+
+        return env.memo.get_or_compute(('warehouse_contains_locations', pick.id), compute)
+
+    def _prefetch_warehouses_contain_locations(self, env: OdooEnvWrapper, picks) -> None:
+        """
+        Checks by one query whether main locations of the documents have child locations
+        and memoizes results for _if_warehouse_contains_locations
+        """
+        location_companies = {}
+        for pick in picks:
+            doc_location = self.cutils.get_doc_main_location(env, pick)
+            if doc_location:
+                location_companies[pick.id] = (doc_location.id, pick.company_id.id or None)
+        if not location_companies:
+            return
+
+        locations = env['stock.location']
+        if env.odoo_version >= 16:
+            locations.flush_model(['complete_name', 'company_id', 'active'])
+        else:
+            locations.flush(['complete_name', 'company_id', 'active'])
+
+        pairs = set(location_companies.values())
+        values_sql = ', '.join(['(%s::int, %s::int)'] * len(pairs))
+        params = [value for pair in pairs for value in pair]
+        env.cr.execute(f"""
+            SELECT doc_location.location_id, doc_location.company_id
+            FROM (VALUES {values_sql}) AS doc_location(location_id, company_id)
+            JOIN {locations._table} AS parent ON parent.id = doc_location.location_id
+            WHERE EXISTS (
+                SELECT 1 FROM {locations._table} AS child
+                WHERE child.active
+                    AND child.complete_name LIKE parent.complete_name || '/%%'
+                    AND (doc_location.company_id IS NULL
+                        OR child.company_id = doc_location.company_id
+                        OR child.company_id IS NULL)
+            )
+        """, params)
+        pairs_with_children = set(env.cr.fetchall())
+
+        for pick_id, pair in location_companies.items():
+            env.memo.put(('warehouse_contains_locations', pick_id), pair in pairs_with_children)
 
     def stock_picking_to_actual_lines(self, env: OdooEnvWrapper, pick, ignore_zero_done: bool):
         """
-        Converts stock.picking document to actual lines array (InventoryAPI object)
+        Converts stock.picking document to actual lines array (InventoryAPI object).
+        Fields of all lines, their moves, products and lots are read at once,
+        so the number of queries does not depend on the number of lines
         @param env: Odoo Environment object.
         @param pick: stock.oicking document
         @param ignore_zero_done: ignore zero qty_done lines or not
@@ -220,47 +378,47 @@ class ModelConverter:
         vals = []
         if not pick:
             return vals
-        if not pick.move_line_ids_without_package:
+        move_lines = pick.move_line_ids_without_package
+        if not move_lines:
             return vals
-        for line in pick.move_line_ids_without_package:
-            if ignore_zero_done and self._get_actual_quantity(env, line) <= 0:
+
+        quantity_name = MoveLineMatchingEngine.get_quantity_done_name(env)
+        fields = ['move_id', 'product_id', 'lot_id', 'lot_name', 'write_date', quantity_name]
+        if env.odoo_version >= 17:
+            fields.append('picked')
+        rows = move_lines.read(fields, load=None)
+        move_ids = list({row['move_id'] for row in rows if row['move_id']})
+        move_quantities = {move['id']: move['product_uom_qty']
+                           for move in env['stock.move'].browse(move_ids).read(['product_uom_qty'], load=None)}
+        products = self._read_line_products(env, {row['product_id'] for row in rows})
+        lot_ids = list({row['lot_id'] for row in rows if row['lot_id']})
+        lot_names = {lot['id']: lot['name'] for lot in env.lots.search_read([('id', 'in', lot_ids)], ['name'])} \
+            if lot_ids else {}
+
+        for row in rows:
+            actual_quantity = self._get_actual_row_quantity(env, row, quantity_name)
+            if ignore_zero_done and actual_quantity <= 0:
                 continue
-            line_product = line.product_id
+            product = products[row['product_id']]
             # noinspection SpellCheckingInspection
-            adding_line = {
-                'uid': self.clear_to_str(line.id),
-                'bindedDocumentLineUid': self.clear_to_str(line.move_id.id),
-                'inventoryItemId': self.clear_to_str(line_product.id),
-                'expectedQuantity': self.clear_to_str(line.move_id.product_uom_qty),
-                'actualQuantity': self.clear_to_str(self._get_actual_quantity(env, line)),
-                'unitOfMeasureId': self._get_prop(line_product, 'uom_id', 'id'),
-                'inventoryItemName': line_product.name,
-                'inventoryItemBarcode': self.clear_to_str(line_product.barcode),
-                'unitOfMeasureName': self._get_prop(line_product, 'uom_id', 'name'),
-                'registrationDate': self.clear_to_str(line_product.create_date),
-                'documentId': self.clear_to_str(line.picking_id.id),
-                'lastChangeDate': self.clear_to_str(line.write_date),
-                'price': self.clear_to_str(line.product_id.lst_price),
-                'purchasePrice': self.clear_to_str(line.product_id.standard_price),
-                'sourceDocumentId': line.picking_id.origin,
-            }
-            if line_product.product_tmpl_id.tracking == 'serial':
-                if line.lot_id:
-                    adding_line['serialNumber'] = self.clear_to_str(line.lot_id.name)
-                else:
-                    adding_line['serialNumber'] = self.clear_to_str(line.lot_name)
-            elif line_product.product_tmpl_id.tracking == 'lot':
-                if line.lot_id:
-                    adding_line['lot'] = self.clear_to_str(line.lot_id.name)
-                else:
-                    adding_line['lot'] = self.clear_to_str(line.lot_name)
+            adding_line = self._line_row_to_document_line(pick, row, product, {
+                'bindedDocumentLineUid': self.clear_to_str(row['move_id']),
+                'expectedQuantity': self.clear_to_str(move_quantities.get(row['move_id'])),
+                'actualQuantity': self.clear_to_str(actual_quantity),
+            })
+            lot_name = lot_names.get(row['lot_id']) if row['lot_id'] else row['lot_name']
+            if product['tracking'] == 'serial':
+                adding_line['serialNumber'] = self.clear_to_str(lot_name)
+            elif product['tracking'] == 'lot':
+                adding_line['lot'] = self.clear_to_str(lot_name)
 
             vals.append(self._clear_output_dict(adding_line))
         return vals
 
     def stock_picking_to_expected_lines(self, env: OdooEnvWrapper, pick):
         """
-        Converts stock.picking odoo object to expected lines (InventoryAPI)
+        Converts stock.picking odoo object to expected lines (InventoryAPI).
+        Fields of all moves and their products are read at once
         @param env: Odoo Environment object.
         @param pick:
         @return:
@@ -268,28 +426,66 @@ class ModelConverter:
         vals = []
         if not pick:
             return vals
-        if not pick.move_ids_without_package:
+        moves = pick.move_ids_without_package
+        if not moves:
             return vals
-        for line in pick.move_ids_without_package:
-            line_product = line.product_id
-            vals.append(self._clear_output_dict({
-                'uid': self.clear_to_str(line.id),
-                'inventoryItemId': self.clear_to_str(line_product.id),
-                'expectedQuantity': self.clear_to_str(line.product_uom_qty),
-                'actualQuantity': self.clear_to_str(self._get_actual_quantity(env, line)),
-                'unitOfMeasureId': self._get_prop(line_product, 'uom_id', 'id'),
-                'inventoryItemName': line_product.name,
-                'inventoryItemBarcode': self.clear_to_str(line_product.barcode),
-                'unitOfMeasureName': self._get_prop(line_product, 'uom_id', 'name'),
-                'registrationDate': self.clear_to_str(line_product.create_date),
-                'documentId': self.clear_to_str(line.picking_id.id),
-                'lastChangeDate': self.clear_to_str(line.write_date),
-                'price': self.clear_to_str(line.product_id.lst_price),
-                'purchasePrice': self.clear_to_str(line.product_id.standard_price),
-                'sourceDocumentId': line.picking_id.origin,
-            }))
+
+        quantity_name = 'quantity' if env.odoo_version >= 17 else 'quantity_done'
+        fields = ['product_id', 'product_uom_qty', 'write_date', quantity_name]
+        if env.odoo_version >= 17:
+            fields.append('picked')
+        rows = moves.read(fields, load=None)
+        products = self._read_line_products(env, {row['product_id'] for row in rows})
+
+        for row in rows:
+            product = products[row['product_id']]
+            vals.append(self._clear_output_dict(self._line_row_to_document_line(pick, row, product, {
+                'expectedQuantity': self.clear_to_str(row['product_uom_qty']),
+                'actualQuantity': self.clear_to_str(self._get_actual_row_quantity(env, row, quantity_name)),
+            })))
         return vals
 
+    # noinspection PyMethodMayBeStatic
+    def _read_line_products(self, env: OdooEnvWrapper, product_ids) -> dict:
+        """
+        Reads fields of the document lines products (prices are computed for all products at once)
+        @return: product fields with 'uom_name' by product id
+        """
+        product_ids = [product_id for product_id in product_ids if product_id]
+        rows = env['product.product'].browse(product_ids).read(
+            ['name', 'barcode', 'uom_id', 'create_date', 'tracking', 'lst_price', 'standard_price'], load=None)
+        uom_ids = list({row['uom_id'] for row in rows if row['uom_id']})
+        uom_names = {uom['id']: uom['name'] for uom in env['uom.uom'].browse(uom_ids).read(['name'])}
+        for row in rows:
+            row['uom_name'] = uom_names.get(row['uom_id'])
+        return {row['id']: row for row in rows}
+
+    def _line_row_to_document_line(self, pick, row: dict, product: dict, quantities: dict) -> dict:
+        """
+        Converts fields of the move or move line and its product to the document line (InventoryAPI)
+        @param pick: stock.picking document of the line
+        @param row: fields of the move or move line
+        @param product: fields of the product read by _read_line_products
+        @param quantities: quantity fields of the line
+        @return:
+        """
+        line = {
+            'uid': self.clear_to_str(row['id']),
+            'inventoryItemId': self.clear_to_str(product['id']),
+            'unitOfMeasureId': self.clear_to_str(product['uom_id']) if product['uom_id'] else None,
+            'inventoryItemName': product['name'],
+            'inventoryItemBarcode': self.clear_to_str(product['barcode']),
+            'unitOfMeasureName': self.clear_to_str(product['uom_name']) if product['uom_id'] else None,
+            'registrationDate': self.clear_to_str(product['create_date']),
+            'documentId': self.clear_to_str(pick.id),
+            'lastChangeDate': self.clear_to_str(row['write_date']),
+            'price': self.clear_to_str(product['lst_price']),
+            'purchasePrice': self.clear_to_str(product['standard_price']),
+            'sourceDocumentId': pick.origin,
+        }
+        line.update(quantities)
+        return line
+
     def convert_table_rows(self, odoo_rows, api_to_odoo_field_map: dict):
         """
         Default plain odoo's rows convertor to result list
@@ -324,6 +520,83 @@ class ModelConverter:
             'barcode': barcode
         }
 
+    def convert_odoo_warehouse_to_location_row(self, odoo_warehouse):
+        """
+        Converts 'stock.warehouse' object to 'TableLocationRow' object (warehouse is a group of its locations).
+        """
+        return {
+            'id': CommonUtils.convert_warehouse_id_from_odoo_to_clv(odoo_warehouse.id),
+            'name': self.clear_to_str(odoo_warehouse.name),
+            'isGroup': bool(odoo_warehouse.lot_stock_id.id),
+            'notSelectable': True,
+            'parentId': self.clear_to_str(odoo_warehouse.view_location_id.location_id.id)
+        }
+
+    def convert_odoo_location_to_location_row(self, env: OdooEnvWrapper, odoo_location, odoo_warehouses):
+        """
+        Converts 'stock.location' object to 'TableLocationRow' object.
+        @param env: Odoo Environment object.
+        @param odoo_location: converting location
+        @param odoo_warehouses: warehouses returned as rows of the table (view locations are placed into them)
+        """
+        parent_id = None
+        if odoo_location.location_id:
+            parent_id = odoo_location.location_id.id
+
+        if odoo_location.usage == 'view':
+            if odoo_location.warehouse_id:
+                if odoo_location.warehouse_id in odoo_warehouses:
+                    parent_id = CommonUtils.convert_warehouse_id_from_odoo_to_clv(odoo_location.warehouse_id.id)
+
+        barcode = odoo_location.complete_name
+        if odoo_location.barcode:
+            barcode = odoo_location.barcode
+
+        not_selectable = not odoo_location.active \
+            or odoo_location.usage in ['view'] \
+            or (env.w15_settings.allow_only_lowest_level_locations and len(odoo_location.child_ids) > 0)
+
+        return {
+            'id': self.clear_to_str(odoo_location.id),
+            'name': self.clear_to_str(odoo_location.complete_name),
+            'barcode': self.clear_to_str(barcode),
+            'isGroup': len(odoo_location.child_ids) > 0,
+            'notSelectable': not_selectable,
+            'parentId': self.clear_to_str(parent_id)
+        }
+
+    def convert_odoo_warehouse_to_warehouses_line_row(self, odoo_warehouse, locations_enabled: bool):
+        """
+        Converts 'stock.warehouse' object to 'TableWarehousesLinesRow' object.
+        @param odoo_warehouse: converting warehouse
+        @param locations_enabled: storage locations are used
+        """
+        return {
+            'id': CommonUtils.convert_warehouse_id_from_odoo_to_clv(odoo_warehouse.id),
+            'name': self.clear_to_str(odoo_warehouse.name),
+            'code': self.clear_to_str(odoo_warehouse.code),
+            'barcode': '',
+            'parentId': '',
+            'isFolder': False,
+            'addressable': locations_enabled and bool(odoo_warehouse.lot_stock_id.child_ids),
+            'search': CommonUtils.generate_search_string([odoo_warehouse.name, odoo_warehouse.code])
+        }
+
+    # noinspection PyMethodMayBeStatic
+    def convert_odoo_product_to_inventory_row(self, odoo_product, stock_quantity: float):
+        """
+        Converts 'product.product' object to 'TableInventoryRow' object.
+        @param odoo_product: converting product
+        @param stock_quantity: on hand quantity of the product
+        """
+        return {
+            'id': str(odoo_product.id),
+            'name': str(odoo_product.name),
+            'stockquantity': stock_quantity,
+            'withserialnumber': odoo_product.tracking == 'serial',
+            'withseries': odoo_product.tracking == 'lot'
+        }
+
     def convert_odoo_partner_to_customers_vendors_row(self, odoo_partner):
         """
         Converts 'res.partner' object to 'TableCustomersVendorsRow' object.
@@ -447,13 +720,17 @@ class ModelConverter:
             obj = getattr(obj, prop)
         return self.clear_to_str(obj)
 
-    def _get_actual_quantity(self, env: OdooEnvWrapper, odoo_line):
+    # noinspection PyMethodMayBeStatic
+    def _get_actual_row_quantity(self, env: OdooEnvWrapper, row: dict, quantity_name: str):
+        """
+        Returns done quantity of the move or move line fields read with 'picked' field (Odoo 17+)
+        """
         if env.odoo_version >= 17:
-            if odoo_line.picked:
-                return odoo_line.quantity
+            if row['picked']:
+                return row[quantity_name]
             return 0
 
-        return odoo_line.quantity_done
+        return row[quantity_name]
 
     _SOURCE_DOC_TYPE_MAPPING = {
         'receiving': {
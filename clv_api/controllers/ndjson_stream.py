@@ -0,0 +1,107 @@
+import json
+import logging
+from contextlib import ExitStack
+from typing import Callable, Iterator, Optional
+
+from odoo import api
+from odoo.release import version_info
+from odoo.tools import json_default
+
+from ..utils.continuation_token import ContinuationToken
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+# Number of records fetched from the database by one page of the stream
+STREAM_CHUNK_SIZE = 500
+
+NDJSON_MIME_TYPE = 'application/x-ndjson'
+
+
+class NdjsonStream:
+    """
+    Result of the endpoint which is sent as chunked NDJSON response (one JSON object per line).
+    Rows are fetched page by page (keyset pagination) while the response is being sent,
+    so the worker memory does not depend on the number of streamed rows.
+    The last line of the response is an object with 'continuationToken' of the next rows
+    (empty string if all the rows are sent), or an object with 'error' if the streaming failed.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self,
+                 env: OdooEnvWrapper,
+                 fetch_page: Callable[[OdooEnvWrapper, str, int], dict],
+                 offset,
+                 limit,
+                 request_count: bool,
+                 continuation_token: Optional[str]):
+        """
+        @raise RuntimeError: If passed parameters are not supported in streaming mode
+        @param env: Environment of the request
+        @param fetch_page: function returning the page of rows (dictionary with 'result' and 'continuationToken')
+        by environment, continuation token and the maximum number of rows
+        @param offset: offset of the first row (not supported, continuation token must be used)
+        @param limit: the maximum number of streamed rows, all rows are streamed if not set
+        @param request_count: need to return total number of records (not supported)
+        @param continuation_token: token of the first streamed row, the rows are streamed from the beginning if not set
+        """
+        if offset:
+            raise RuntimeError('Offset is not supported in streaming mode, use continuation token instead')
+        if request_count:
+            raise RuntimeError('Total count is not supported in streaming mode')
+        # Malformed token is reported before the response is started
+        ContinuationToken.decode(continuation_token)
+
+        self._registry = env.registry
+        self._uid = env.uid
+        self._context = dict(env.context)
+        self._fetch_page = fetch_page
+        self._limit = limit
+        self._continuation_token = continuation_token or ''
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """
+        Generates lines of the response.
+        The request transaction is finished when the response is sent, so rows are read in a separate cursor.
+        """
+        with ExitStack() as stack:
+            if version_info[0] < 15:
+                stack.enter_context(api.Environment.manage())
+            cr = stack.enter_context(self._registry.cursor())
+            env = OdooEnvWrapper(api.Environment(cr, self._uid, self._context), version_info[0])
+            try:
+                yield from self._iter_row_lines(env)
+            except Exception as e:
+                self._logger.exception('Streaming of the response failed')
+                yield self._dump_line({'error': str(e)})
+
+    def _iter_row_lines(self, env: OdooEnvWrapper) -> Iterator[bytes]:
+        token = self._continuation_token
+        streamed_count = 0
+        while True:
+            chunk_limit = STREAM_CHUNK_SIZE
+            if self._limit:
+                chunk_limit = min(chunk_limit, self._limit - streamed_count)
+
+            page = self._fetch_page(env, token, chunk_limit)
+            rows = page.get('result') or []
+            for row in rows:
+                yield self._dump_line(row)
+            streamed_count += len(rows)
+            token = page.get('continuationToken') or ''
+
+            if not token or not rows or (self._limit and streamed_count >= self._limit):
+                break
+            # Records of the streamed page are not needed anymore
+            self._invalidate_cache(env)
+
+        yield self._dump_line({'continuationToken': token})
+
+    @staticmethod
+    def _invalidate_cache(env: OdooEnvWrapper) -> None:
+        if env.odoo_version >= 16:
+            env.invalidate_all()
+        else:
+            env.cache.invalidate()
+
+    @staticmethod
+    def _dump_line(value) -> bytes:
+        return json.dumps(value, default=json_default).encode('utf-8') + b'\n'
@@ -1,4 +1,5 @@
 from .model_converter import ModelConverter
+from .ndjson_stream import NdjsonStream
 from .tables_contacts import TableContactsProcessor
 from .tables_customers_vendors import TableCustomersVendorsProcessor
 from .tables_inventory import TableInventoryProcessor
@@ -26,7 +27,8 @@ class TablesImpl:
         'contacts': TableContactsProcessor()
     }
 
-    def get_rows(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool):
+    def get_rows(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                 continuation_token: str = None):
         """
         Returns the page of rows depends on passed query
         @param env: Environment
@@ -35,11 +37,63 @@ class TablesImpl:
         @param offset: first record index to return
         @param limit: the maximum number of records to return
         @param request_count: need to return total number of records in query
+        @param continuation_token: token of the keyset pagination (offset pagination is used if it is None)
         @return:
         """
         
         key = query['from'].lower()
         if key in self._table_processor:
-            return self._table_processor[key].get_rows(env, query, device_info, offset, limit, request_count)
+            return self._table_processor[key].get_rows(env, query, device_info, offset, limit, request_count,
+                                                       continuation_token)
         else:
             return {"result": []}
+
+    def get_fingerprint(self, env: OdooEnvWrapper, query, device_info):
+        """
+        Returns version fingerprint of the table rows (None if the table does not support conditional responses)
+        @param env: Environment
+        @param query: Inventory API query object
+        @param device_info: Inventory API DeviceInfo
+        @return:
+        """
+        key = query['from'].lower()
+        if key in self._table_processor:
+            return self._table_processor[key].get_fingerprint(env, query, device_info)
+        return None
+
+    def stream_rows(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                    continuation_token: str = None) -> NdjsonStream:
+        """
+        Returns rows depends on passed query as NDJSON stream
+        @param env: Environment
+        @param query: Inventory API query object
+        @param device_info: Inventory API DeviceInfo
+        @param offset: not supported in streaming mode
+        @param limit: the maximum number of records to return (all records if not set)
+        @param request_count: not supported in streaming mode
+        @param continuation_token: token of the keyset pagination (rows are streamed from the beginning if not set)
+        @return:
+        """
+        return NdjsonStream(env,
+                            lambda page_env, page_token, page_limit:
+                            self.get_rows(page_env, query, device_info, 0, page_limit, False, page_token),
+                            offset,
+                            limit,
+                            request_count,
+                            continuation_token)
+
+    def get_changes(self, env: OdooEnvWrapper, query, device_info, sync_token: str, limit):
+        """
+        Returns rows of the table created, modified or deleted since passed sync token
+        @param env: Environment
+        @param query: Inventory API query object
+        @param device_info: Inventory API DeviceInfo
+        @param sync_token: token returned by the previous request (empty string to get initial token)
+        @param limit: the maximum number of processed changes
+        @return:
+        """
+        key = query['from'].lower()
+        if key in self._table_processor:
+            return self._table_processor[key].get_changes(env, query, device_info, sync_token, limit)
+        else:
+            return {'fullSyncRequired': True, 'upserts': [], 'deletes': [], 'hasMore': False, 'syncToken': ''}
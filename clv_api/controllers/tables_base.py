@@ -1,12 +1,17 @@
 from abc import abstractmethod
-from typing import List
+from typing import List, Optional, Tuple
 
 from .model_converter import ModelConverter
 from .query_converter import QueryConverter
 from .common_utils import CommonUtils
+from ..utils.continuation_token import ContinuationToken
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
+# Default maximum number of change journal entries processed by one request
+DEFAULT_CHANGES_LIMIT = 1000
+
+
 class TableProcessorBase:
     """
     Base table request processor
@@ -15,7 +20,11 @@ class TableProcessorBase:
     _query_converter = QueryConverter()
     cutils = CommonUtils()
 
-    def get_rows(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool):
+    # Odoo models which changes are tracked by the change journal to synchronize the table by delta
+    _change_log_models: List[str] = []
+
+    def get_rows(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                 continuation_token: str = None):
         """
         Returns the page of rows depends on passed query
         @param env: Environment
@@ -24,17 +33,141 @@ class TableProcessorBase:
         @param offset: first record index to return
         @param limit: the maximum number of records to return
         @param request_count: need to return total number of records in query
+        @param continuation_token: token of the keyset pagination, empty string for the first page
+        (offset pagination is used if it is None)
         @return:
         """
-        res_list = self._get_rows_int(env, query, device_info, offset, limit, request_count)
+        cursor = ContinuationToken.decode(continuation_token)
+        if cursor is not None:
+            offset = 0
+        res_list = self._get_rows_int(env, query, device_info, offset, limit, request_count, cursor=cursor)
         result = {}
         if res_list[0]:
             result['totalCount'] = res_list[0]
         result['result'] = res_list[1]
+        if cursor is not None:
+            if len(res_list) > 2:
+                result['continuationToken'] = ContinuationToken.encode(res_list[2])
+            else:
+                # Only the count is returned, the client continues paging from the same position
+                result['continuationToken'] = continuation_token
         return result
 
+    def get_changes(self, env: OdooEnvWrapper, query, device_info, sync_token: str, limit):
+        """
+        Returns rows created, modified or deleted since passed sync token
+        @param env: Environment
+        @param query: Inventory API query object
+        @param device_info: Inventory API DeviceInfo
+        @param sync_token: token returned by the previous request (empty string to get initial token)
+        @param limit: the maximum number of processed changes
+        @return: upserted rows, ids of deleted rows and the token of the next request.
+        'fullSyncRequired' is True if the whole table has to be reloaded (before applying the next changes).
+        """
+        change_log = env['clv_api.change_log'].sudo()
+        res_models = self._get_change_log_models(env)
+        if not limit:
+            limit = DEFAULT_CHANGES_LIMIT
+
+        position = ContinuationToken.decode(sync_token) or {}
+        if not res_models \
+                or 'transactionId' not in position \
+                or change_log.is_position_expired((position['transactionId'], position['id'])):
+            return {
+                'fullSyncRequired': True,
+                'upserts': [],
+                'deletes': [],
+                'hasMore': False,
+                'syncToken': self._encode_sync_token(change_log.get_initial_position())
+            }
+
+        entries, next_position = change_log.read_changes(res_models,
+                                                         (position['transactionId'], position['id']),
+                                                         limit)
+
+        # the last operation of the record defines its state
+        operations_by_model = {}
+        for entry in entries:
+            operations_by_model.setdefault(entry['res_model'], {})[entry['res_id']] = entry['operation']
+
+        upserts = []
+        deletes = []
+        for res_model, operations in operations_by_model.items():
+            upsert_ids = [res_id for res_id, operation in operations.items() if operation == 'upsert']
+            found_ids = set()
+            if upsert_ids:
+                for res_id, row in self._get_rows_by_ids(env, query, device_info, res_model, upsert_ids):
+                    found_ids.add(res_id)
+                    upserts.append(row)
+            # records which do not exist or do not match the table filter anymore are deleted from the device
+            deletes.extend(self._get_row_id(res_model, res_id) for res_id in operations if res_id not in found_ids)
+
+        return {
+            'fullSyncRequired': False,
+            'upserts': upserts,
+            'deletes': deletes,
+            'hasMore': len(entries) == limit,
+            'syncToken': self._encode_sync_token(next_position)
+        }
+
+    # noinspection PyMethodMayBeStatic
+    def get_fingerprint(self, env: OdooEnvWrapper, query, device_info) -> Optional[List]:
+        """
+        Returns cheap version fingerprint of the records the table rows are built from.
+        It is used as ETag of the response, so it has to change whenever the rows may change.
+        @param env: Environment
+        @param query: Inventory API query object
+        @param device_info: Inventory API DeviceInfo
+        @return: json-serializable fingerprint or None if conditional responses are not supported by the table
+        """
+        return None
+
+    @staticmethod
+    def _get_models_fingerprint(env: OdooEnvWrapper, res_models: List[str]) -> List:
+        """
+        Returns the max 'write_date' and the count of all the records (including archived) of each passed model
+        @param env: Environment
+        @param res_models: names of the models
+        """
+        fingerprint = []
+        for res_model in res_models:
+            env.cr.execute(f"SELECT max(write_date), count(*) FROM {env[res_model]._table}")
+            max_write_date, count = env.cr.fetchone()
+            fingerprint.append([res_model, max_write_date and max_write_date.isoformat(), count])
+        return fingerprint
+
+    def _get_change_log_models(self, env: OdooEnvWrapper) -> List[str]:
+        """
+        Returns names of the Odoo models which changes are tracked for the table
+        """
+        return self._change_log_models
+
+    def _get_rows_by_ids(self, env: OdooEnvWrapper, query, device_info, res_model: str, ids: List[int]) -> List[Tuple]:
+        """
+        Returns rows of the records with passed ids which match the table query
+        @param env: Environment
+        @param query: Inventory API query object
+        @param device_info: Inventory API DeviceInfo
+        @param res_model: model of the records
+        @param ids: ids of the records
+        @return: list of (record id, row) pairs
+        """
+        return []
+
+    # noinspection PyMethodMayBeStatic
+    def _get_row_id(self, res_model: str, res_id: int) -> str:
+        """
+        Returns id of the table row corresponding to the record
+        """
+        return str(res_id)
+
+    @staticmethod
+    def _encode_sync_token(position: Tuple[int, int]) -> str:
+        return ContinuationToken.encode({'transactionId': position[0], 'id': position[1]})
+
     @abstractmethod
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool) -> List:
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None) -> List:
         """
         Returns the page of rows depends on passed query
         @param env: Environment
@@ -43,7 +176,8 @@ class TableProcessorBase:
         @param offset: first record index to return
         @param limit: the maximum number of records to return
         @param request_count: need to return total number of records in query
-        @return:
+        @param cursor: sort key of the last record of the previous page (None for offset pagination)
+        @return: total number of records, rows and optionally the cursor of the next page
         """
         pass
 
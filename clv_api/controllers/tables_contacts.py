@@ -2,6 +2,7 @@ from typing import List
 
 from .field_info import FieldInfo
 from .tables_base import TableProcessorBase
+from ..utils.continuation_token import ContinuationToken
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -65,7 +66,8 @@ class TableContactsProcessor(TableProcessorBase):
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool) -> List:
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None) -> List:
         where_root = query.get('whereTreeRoot')
 
         domain_filter = []
@@ -78,6 +80,7 @@ class TableContactsProcessor(TableProcessorBase):
             contacts_count = env.partners.search_count(domain_filter)
             return [contacts_count, None]
 
+        domain_filter = ContinuationToken.apply_id_cursor(domain_filter, cursor)
         partners = env.partners.search(domain_filter, limit=limit, offset=offset, order='id ASC')
 
         contacts = []
@@ -85,7 +88,7 @@ class TableContactsProcessor(TableProcessorBase):
             contact = self._convert_odoo_partner_to_contact(partner)
             contacts.append(contact)
 
-        return [None, contacts]
+        return [None, contacts, ContinuationToken.get_next_id_cursor(partners, limit, cursor)]
 
     def _convert_odoo_partner_to_contact(self, partner):
         return {
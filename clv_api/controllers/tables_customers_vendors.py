@@ -1,7 +1,8 @@
-from typing import List
+from typing import List, Tuple
 
 from .field_info import FieldInfo
 from .tables_base import TableProcessorBase
+from ..utils.continuation_token import ContinuationToken
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -52,27 +53,41 @@ class TableCustomersVendorsProcessor(TableProcessorBase):
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool) -> List:
-        where_root = query.get('whereTreeRoot')
+    _change_log_models = ['res.partner']
 
-        domain_filter = []
-
-        if where_root:
-            additional_filter = self._query_converter.convert_api_where_expression_to_domain_filter(where_root, self._api_to_odoo_map)
-            additional_filter = self._modify_domain_query(env, additional_filter)
-            domain_filter.extend(additional_filter)
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None) -> List:
+        domain_filter = self._get_domain_filter(env, query)
 
         if request_count:
             customers_vendors_count = env.partners.search_count(domain_filter)
             return [customers_vendors_count, None]
 
+        domain_filter = ContinuationToken.apply_id_cursor(domain_filter, cursor)
         partners = env.partners.search(domain_filter, limit=limit, offset=offset, order='id ASC')
 
         customers_vendors = []
         for partner in partners:
             customers_vendors.append(self._model_converter.convert_odoo_partner_to_customers_vendors_row(partner))
 
-        return [None, customers_vendors]
+        return [None, customers_vendors, ContinuationToken.get_next_id_cursor(partners, limit, cursor)]
+
+    def _get_rows_by_ids(self, env: OdooEnvWrapper, query, device_info, res_model: str, ids: List[int]) -> List[Tuple]:
+        partners = env.partners.search(self._get_domain_filter(env, query) + [('id', 'in', ids)])
+        return [(partner.id, self._model_converter.convert_odoo_partner_to_customers_vendors_row(partner))
+                for partner in partners]
+
+    def _get_domain_filter(self, env: OdooEnvWrapper, query):
+        where_root = query.get('whereTreeRoot')
+
+        domain_filter = []
+
+        if where_root:
+            additional_filter = self._query_converter.convert_api_where_expression_to_domain_filter(where_root, self._api_to_odoo_map)
+            additional_filter = self._modify_domain_query(env, additional_filter)
+            domain_filter.extend(additional_filter)
+
+        return domain_filter
 
     # noinspection PyMethodMayBeStatic
     def _modify_domain_query(self, env, domain_filter):
@@ -1,7 +1,9 @@
-from typing import List
+from typing import List, Tuple
 
 from .field_info import FieldInfo
 from .tables_base import TableProcessorBase
+from ..utils.continuation_token import ContinuationToken
+from ..utils.stock_quantity_aggregator import StockQuantityAggregator
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -22,41 +24,51 @@ class TableInventoryProcessor(TableProcessorBase):
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool) -> List:
-        where_root = query.get('whereTreeRoot')
+    _change_log_models = ['product.product']
 
-        domain_filter = [
-            ('active', '=', True),
-            ('detailed_type', '=', 'product')
-        ]
-
-        if where_root:
-            additional_filter = self._query_converter.convert_api_where_expression_to_domain_filter(where_root, self._api_to_odoo_map)
-            additional_filter = self._replace_specific_filters(additional_filter)
-            domain_filter.extend(additional_filter)
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None) -> List:
+        domain_filter = self._get_domain_filter(env, query)
 
         result = [None, None]
 
         if request_count:
             result[0] = len(env['product.product'].search(domain_filter, limit=limit, offset=offset, order='id ASC'))
 
-        items = env['product.product'].search(domain_filter, limit=limit, offset=offset, order='id ASC')
+        items = env['product.product'].search(ContinuationToken.apply_id_cursor(domain_filter, cursor),
+                                              limit=limit, offset=offset, order='id ASC')
+        quantities = StockQuantityAggregator.get_quantities(env, items.ids)
 
         rows = []
         for item in items:
-            row = {
-                'id': str(item.id),
-                'name': str(item.name),
-                'stockquantity': item.qty_available,
-                'withserialnumber': item.tracking == 'serial',
-                'withseries': item.tracking == 'lot'
-            }
-            rows.append(row)
+            rows.append(self._model_converter.convert_odoo_product_to_inventory_row(item, quantities[item.id]))
 
         result[1] = rows
+        result.append(ContinuationToken.get_next_id_cursor(items, limit, cursor))
 
         return result
 
+    def _get_rows_by_ids(self, env: OdooEnvWrapper, query, device_info, res_model: str, ids: List[int]) -> List[Tuple]:
+        items = env['product.product'].search(self._get_domain_filter(env, query) + [('id', 'in', ids)])
+        quantities = StockQuantityAggregator.get_quantities(env, items.ids)
+        return [(item.id, self._model_converter.convert_odoo_product_to_inventory_row(item, quantities[item.id]))
+                for item in items]
+
+    def _get_domain_filter(self, env: OdooEnvWrapper, query):
+        where_root = query.get('whereTreeRoot')
+
+        domain_filter = [
+            ('active', '=', True),
+            ('detailed_type', '=', 'product')
+        ]
+
+        if where_root:
+            additional_filter = self._query_converter.convert_api_where_expression_to_domain_filter(where_root, self._api_to_odoo_map)
+            additional_filter = self._replace_specific_filters(env, additional_filter)
+            domain_filter.extend(additional_filter)
+
+        return domain_filter
+
     @staticmethod
     def _convert_with_series_filter(value: tuple) -> tuple:
         if value[2]:
@@ -73,12 +85,15 @@ class TableInventoryProcessor(TableProcessorBase):
         inverted_comparison = '!=' if value[1] == '=' else '='
         return 'tracking', inverted_comparison, 'serial'
 
-    def _replace_specific_filters(self, domain_filter):
+    def _replace_specific_filters(self, env: OdooEnvWrapper, domain_filter):
         result = []
         for item in domain_filter:
             filter_element = item
             if isinstance(filter_element, tuple):
-                if filter_element[0].lower() == 'withseries':
+                if filter_element[0] == 'qty_available':
+                    # 'qty_available' is not stored, the condition is checked by aggregated stock quantities
+                    filter_element = StockQuantityAggregator.get_product_filter(env, filter_element[1], filter_element[2])
+                elif filter_element[0].lower() == 'withseries':
                     filter_element = self._convert_with_series_filter(filter_element)
                 elif filter_element[0].lower() == 'withserialnumber':
                     filter_element = self._convert_with_serial_number_filter(filter_element)
@@ -4,6 +4,7 @@ from typing import List, Tuple, Any
 from .common_utils import CommonUtils
 from .field_info import FieldInfo
 from .tables_base import TableProcessorBase
+from ..utils.continuation_token import ContinuationToken
 from ..utils.domain_transformer import DomainTransformerBuilder, Transformations
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
@@ -45,6 +46,8 @@ class TableLocationsProcessor(TableProcessorBase):
         FieldInfo(api_name_arg='parentId'.lower(), api_type_arg=str, odoo_name_arg='parent_id', odoo_type_arg=str, odoo_null_value_equivalent_arg='-1')
     ]
 
+    _change_log_models = ['stock.warehouse', 'stock.location']
+
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
@@ -68,7 +71,8 @@ class TableLocationsProcessor(TableProcessorBase):
         builder.add_transformation_for_field('located_in', warehouse_located_in_transformation)
         self._warehouses_domain_transformer = builder.build()
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool):
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None):
         where_root = query.get('whereTreeRoot')
 
         # pick_doc = self.cutils.get_odoo_doc_from_device_info(env, device_info)
@@ -77,52 +81,76 @@ class TableLocationsProcessor(TableProcessorBase):
 
         # self.cutils.append_company_filter_by_doc(additional_domain, pick_doc)
 
-        # location_parent_path = self.cutils.get_location_parent_path_from_document(pick_doc)
+        # location_parent_path = self.cutils.get_location_parent_path_from_document(env, pick_doc)
         # if location_parent_path:
         #     additional_domain.append(('parent_path', '=like', location_parent_path + '%'))
 
         if request_count:
             return [self._get_clv_locations_count(env, additional_domain), None]
 
-        return [None, self._get_clv_locations(env, additional_domain, limit, offset)]
+        rows, next_cursor = self._get_clv_locations(env, additional_domain, limit, offset, cursor)
+        return [None, rows, next_cursor]
 
     def _get_clv_locations_count(self, env: OdooEnvWrapper, additional_domain) -> int:
         warehouses_domain = []
         warehouses_domain.extend(self._warehouses_domain_transformer.transform(env, additional_domain))
         warehouses_count = env.warehouses.search_count(warehouses_domain)
 
-        locations_domain = [
-            '|',
-            ('active', '=', True),
-            ('active', '=', False),
-            '|',
-            ('company_id', '=', False),
-            ('company_id.active', '=', True),
-            '|',
-            ('warehouse_id', '=', False),
-            ('warehouse_id.active', '=', True)
-        ]
-        locations_domain.extend(self._locations_domain_transformer.transform(env, additional_domain))
+        locations_domain = self._get_locations_domain_filter(env, additional_domain)
         locations_count = env['stock.location'].search_count(locations_domain)
 
         return warehouses_count + locations_count
 
-    def _get_clv_locations(self, env: OdooEnvWrapper, additional_domain, limit, offset):
+    def _get_clv_locations(self, env: OdooEnvWrapper, additional_domain, limit, offset, cursor: dict = None):
         result = []
 
         warehouses_domain = []
         warehouses_domain.extend(self._warehouses_domain_transformer.transform(env, additional_domain))
-        warehouses = env.warehouses.search(warehouses_domain, limit=limit, offset=offset, order='id ASC')
+        if cursor and cursor.get('warehousesEnd'):
+            warehouses = env['stock.warehouse']
+        else:
+            warehouses_domain = ContinuationToken.apply_id_cursor(warehouses_domain, cursor, 'warehouseId')
+            warehouses = env.warehouses.search(warehouses_domain, limit=limit, offset=offset, order='id ASC')
 
         for warehouse in warehouses:
-            result.append({
-                'id': CommonUtils.convert_warehouse_id_from_odoo_to_clv(warehouse.id),
-                'name': self._model_converter.clear_to_str(warehouse.name),
-                'isGroup': bool(warehouse.lot_stock_id.id),
-                'notSelectable': True,
-                'parentId': self._model_converter.clear_to_str(warehouse.view_location_id.location_id.id)
-            })
+            result.append(self._model_converter.convert_odoo_warehouse_to_location_row(warehouse))
+
+        locations_domain_filter = self._get_locations_domain_filter(env, additional_domain)
+        locations_domain_filter = ContinuationToken.apply_id_cursor(locations_domain_filter, cursor, 'locationId')
+        locations = env['stock.location'].search(locations_domain_filter, limit=limit, offset=offset, order='id ASC')
+
+        for location in locations:
+            result.append(self._model_converter.convert_odoo_location_to_location_row(env, location, warehouses))
+
+        return result, self._get_next_cursor(warehouses, locations, limit, cursor)
+
+    def get_fingerprint(self, env: OdooEnvWrapper, query, device_info):
+        # Rows depend on warehouses and their storage locations
+        return self._get_models_fingerprint(env, ['stock.warehouse', 'stock.location'])
+
+    def _get_rows_by_ids(self, env: OdooEnvWrapper, query, device_info, res_model: str, ids: List[int]) -> List[Tuple]:
+        additional_domain = self._query_converter.convert_api_where_expression_to_domain_filter(
+            query.get('whereTreeRoot'), self._api_to_odoo_map)
+        warehouses_domain = self._warehouses_domain_transformer.transform(env, additional_domain)
 
+        if res_model == 'stock.warehouse':
+            warehouses = env.warehouses.search(warehouses_domain + [('id', 'in', ids)])
+            return [(warehouse.id, self._model_converter.convert_odoo_warehouse_to_location_row(warehouse))
+                    for warehouse in warehouses]
+
+        locations = env['stock.location'].search(self._get_locations_domain_filter(env, additional_domain)
+                                                 + [('id', 'in', ids)])
+        warehouses = env.warehouses.search(warehouses_domain + [('id', 'in', locations.warehouse_id.ids)])
+        return [(location.id, self._model_converter.convert_odoo_location_to_location_row(env, location, warehouses))
+                for location in locations]
+
+    # noinspection PyMethodMayBeStatic
+    def _get_row_id(self, res_model: str, res_id: int) -> str:
+        if res_model == 'stock.warehouse':
+            return CommonUtils.convert_warehouse_id_from_odoo_to_clv(res_id)
+        return str(res_id)
+
+    def _get_locations_domain_filter(self, env: OdooEnvWrapper, additional_domain):
         locations_domain_filter = [
             '|',
             ('active', '=', True),
@@ -135,36 +163,20 @@ class TableLocationsProcessor(TableProcessorBase):
             ('warehouse_id.active', '=', True)
         ]
         locations_domain_filter.extend(self._locations_domain_transformer.transform(env, additional_domain))
-        locations = env['stock.location'].search(locations_domain_filter, limit=limit, offset=offset, order='id ASC')
-
-        for location in locations:
-            parent_id = None
-            if location.location_id:
-                parent_id = location.location_id.id
-
-            if location.usage == 'view':
-                if location.warehouse_id:
-                    if location.warehouse_id in warehouses:
-                        parent_id = CommonUtils.convert_warehouse_id_from_odoo_to_clv(location.warehouse_id.id)
-
-            barcode = location.complete_name
-            if location.barcode:
-                barcode = location.barcode
-
-            not_selectable = not location.active \
-                or location.usage in ['view'] \
-                or (env.w15_settings.allow_only_lowest_level_locations and len(location.child_ids) > 0)
-
-            result.append({
-                'id': self._model_converter.clear_to_str(location.id),
-                'name': self._model_converter.clear_to_str(location.complete_name),
-                'barcode': self._model_converter.clear_to_str(barcode),
-                'isGroup': len(location.child_ids) > 0,
-                'notSelectable': not_selectable,
-                'parentId': self._model_converter.clear_to_str(parent_id)
-            })
-
-        return result
+        return locations_domain_filter
+
+    # noinspection PyMethodMayBeStatic
+    def _get_next_cursor(self, warehouses, locations, limit, cursor: dict):
+        """
+        Returns the cursor of the next page. Warehouses and locations are paged independently.
+        """
+        if cursor is None or not limit or (len(warehouses) < limit and len(locations) < limit):
+            return None
+        return {
+            'warehouseId': warehouses[-1].id if warehouses else cursor.get('warehouseId'),
+            'warehousesEnd': len(warehouses) < limit,
+            'locationId': locations[-1].id if locations else cursor.get('locationId')
+        }
 
 
 def location_barcode_transformation(env: OdooEnvWrapper, domain_element: Tuple[str, str, Any]) -> list:
@@ -1,8 +1,9 @@
 import datetime
-from typing import List
+from typing import List, Tuple
 
 from .field_info import FieldInfo
 from .tables_base import TableProcessorBase
+from ..utils.continuation_token import ContinuationToken
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -57,7 +58,27 @@ class TableSeriesProcessor(TableProcessorBase):
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool):
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None):
+        domain_filter = self._get_domain_filter(env, query, device_info)
+
+        if request_count:
+            rows_count = env.lots.search_count(domain_filter)
+            return [rows_count, None]
+
+        domain_filter = ContinuationToken.apply_id_cursor(domain_filter, cursor)
+        series = env.lots.search(domain_filter, limit=limit, offset=offset, order='id ASC')
+        rows = [self._model_converter.convert_odoo_lot_to_series(s) for s in series]
+        return [None, rows, ContinuationToken.get_next_id_cursor(series, limit, cursor)]
+
+    def _get_change_log_models(self, env: OdooEnvWrapper) -> List[str]:
+        return [env.lots._name]
+
+    def _get_rows_by_ids(self, env: OdooEnvWrapper, query, device_info, res_model: str, ids: List[int]) -> List[Tuple]:
+        series = env.lots.search(self._get_domain_filter(env, query, device_info) + [('id', 'in', ids)])
+        return [(s.id, self._model_converter.convert_odoo_lot_to_series(s)) for s in series]
+
+    def _get_domain_filter(self, env: OdooEnvWrapper, query, device_info):
         where_root = query.get('whereTreeRoot')
 
         domain_filter = [('product_id.product_tmpl_id.tracking', '=', 'lot')]
@@ -70,13 +91,7 @@ class TableSeriesProcessor(TableProcessorBase):
             additional_filter = self._modify_domain_query(env, additional_filter)
             domain_filter.extend(additional_filter)
 
-        if request_count:
-            rows_count = env.lots.search_count(domain_filter)
-            return [rows_count, None]
-
-        series = env.lots.search(domain_filter, limit=limit, offset=offset, order='id ASC')
-        rows = [self._model_converter.convert_odoo_lot_to_series(s) for s in series]
-        return [None, rows]
+        return domain_filter
 
     # noinspection PyMethodMayBeStatic
     def _modify_domain_query(self, env, domain_filter):
@@ -69,7 +69,8 @@ class TableStockProcessor(TableProcessorBase):
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool) -> List:
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None) -> List:
         where_root = query.get('whereTreeRoot')
 
         domain_filter = [
@@ -85,6 +86,9 @@ class TableStockProcessor(TableProcessorBase):
             rows_count = env['stock.quant'].search_count(domain_filter)
             return [rows_count, None]
         
+        if cursor:
+            domain_filter.extend(self._get_cursor_domain(cursor))
+
         # Arrange stock quantities in descending order of the write date in order to get the most recent ones first
         stock_quants = env['stock.quant'].search(domain_filter, limit=limit, offset=offset, order='write_date DESC, id ASC')
 
@@ -92,7 +96,34 @@ class TableStockProcessor(TableProcessorBase):
         for stock_quant in stock_quants:
             rows.append(self._model_converter.convert_odoo_stock_quant_to_stock_row(stock_quant))
 
-        return [None, rows]
+        return [None, rows, self._get_next_cursor(env, stock_quants, limit, cursor)]
+
+    # noinspection PyMethodMayBeStatic
+    def _get_cursor_domain(self, cursor: dict) -> list:
+        """
+        Returns keyset predicate for the 'write_date DESC, id ASC' order:
+        records written earlier or written at the same time with greater id
+        """
+        write_date = cursor['writeDate']
+        return [
+            '|',
+            ('write_date', '<', write_date),
+            '&',
+            ('write_date', '=', write_date),
+            ('id', '>', int(cursor['id']))
+        ]
+
+    # noinspection PyMethodMayBeStatic
+    def _get_next_cursor(self, env: OdooEnvWrapper, stock_quants, limit, cursor: dict):
+        """
+        Returns the sort key of the last quant of the page
+        """
+        if cursor is None or not limit or len(stock_quants) < limit:
+            return None
+        # Write date is read directly from the table to keep microseconds which are truncated by ORM
+        env.cr.execute("SELECT write_date FROM stock_quant WHERE id = %s", [stock_quants[-1].id])
+        write_date = env.cr.fetchone()[0]
+        return {'writeDate': write_date.isoformat(sep=' '), 'id': stock_quants[-1].id}
 
     # noinspection PyMethodMayBeStatic
     def _modify_domain_query(self, env, domain_filter):
@@ -1,9 +1,10 @@
 import logging
-from typing import List
+from typing import List, Tuple
 
 from .common_utils import CommonUtils
 from .field_info import FieldInfo
 from .tables_base import TableProcessorBase
+from ..utils.continuation_token import ContinuationToken
 from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
 
 
@@ -46,9 +47,45 @@ class TableWarehousesLinesProcessor(TableProcessorBase):
     def __init__(self):
         self._api_to_odoo_map = FieldInfo.create_api_to_odoo_field_map(self._mapping_fields)
 
-    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool):
-        where_root = query.get('whereTreeRoot')
+    _change_log_models = ['stock.warehouse']
+
+    def _get_rows_int(self, env: OdooEnvWrapper, query, device_info, offset, limit, request_count: bool,
+                      cursor: dict = None):
         result = [None, []]
+        domain_filter = self._get_domain_filter(env, query, device_info)
+
+        if request_count:
+            result[0] = env.warehouses.search_count(domain_filter)
+
+        warehouses = env.warehouses.search(ContinuationToken.apply_id_cursor(domain_filter, cursor),
+                                           limit=limit, offset=offset, order='id ASC')
+        locations_enabled = env.storage_locations_enabled and env.w15_settings.default_scan_locations
+
+        rows = []
+        for warehouse in warehouses:
+            rows.append(self._model_converter.convert_odoo_warehouse_to_warehouses_line_row(warehouse, locations_enabled))
+
+        result[1] = rows
+        result.append(ContinuationToken.get_next_id_cursor(warehouses, limit, cursor))
+        return result
+
+    def get_fingerprint(self, env: OdooEnvWrapper, query, device_info):
+        # Rows depend on warehouses and their storage locations
+        return self._get_models_fingerprint(env, ['stock.warehouse', 'stock.location'])
+
+    def _get_rows_by_ids(self, env: OdooEnvWrapper, query, device_info, res_model: str, ids: List[int]) -> List[Tuple]:
+        warehouses = env.warehouses.search(self._get_domain_filter(env, query, device_info) + [('id', 'in', ids)])
+        locations_enabled = env.storage_locations_enabled and env.w15_settings.default_scan_locations
+        return [(warehouse.id,
+                 self._model_converter.convert_odoo_warehouse_to_warehouses_line_row(warehouse, locations_enabled))
+                for warehouse in warehouses]
+
+    # noinspection PyMethodMayBeStatic
+    def _get_row_id(self, res_model: str, res_id: int) -> str:
+        return CommonUtils.convert_warehouse_id_from_odoo_to_clv(res_id)
+
+    def _get_domain_filter(self, env: OdooEnvWrapper, query, device_info):
+        where_root = query.get('whereTreeRoot')
         domain_filter = []
 
         # If 'deviceInfo' contains information about document
@@ -63,28 +100,7 @@ class TableWarehousesLinesProcessor(TableProcessorBase):
             domain_query_list = self._modify_domain_query(env, domain_query_list)
             domain_filter.extend(domain_query_list)
 
-        if request_count:
-            result[0] = env.warehouses.search_count(domain_filter)
-
-        warehouses = env.warehouses.search(domain_filter, limit=limit, offset=offset, order='id ASC')
-        locations_enabled = env.storage_locations_enabled and env.w15_settings.default_scan_locations
-
-        rows = []
-        for warehouse in warehouses:
-            row = {
-                'id': CommonUtils.convert_warehouse_id_from_odoo_to_clv(warehouse.id),
-                'name': self._model_converter.clear_to_str(warehouse.name),
-                'code': self._model_converter.clear_to_str(warehouse.code),
-                'barcode': '',
-                'parentId': '',
-                'isFolder': False,
-                'addressable': locations_enabled and bool(warehouse.lot_stock_id.child_ids),
-                'search': CommonUtils.generate_search_string([warehouse.name, warehouse.code])
-            }
-            rows.append(row)
-
-        result[1] = rows
-        return result
+        return domain_filter
 
     # noinspection PyMethodMayBeStatic
     def _modify_domain_query(self, env, domain_filter):
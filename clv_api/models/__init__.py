@@ -1,4 +1,16 @@
 
 from . import stock_picking
 from . import clv_api_settings
-from . import clv_connected_database_info
\ No newline at end of file
+from . import clv_settings_cache
+from . import clv_connected_database_info
+from . import clv_barcode_index
+from . import product
+from . import clv_change_log
+from . import clv_ir_http
+from . import clv_metrics_snapshot
+from . import clv_profile_run
+from . import clv_document_job
+from . import clv_set_document_result
+from . import clv_upload_session
+from . import clv_document_description
+from . import clv_document_payload
@@ -23,6 +23,11 @@ class ResConfigSettings(models.TransientModel):
     clv_scan_serials_on_allocation = fields.Boolean(string="Scan Serial Numbers during Putaway", readonly=True, default=True)
     clv_ship_expected_actual_lines = fields.Boolean(string="Send Actual Quantities")
 
+    clv_profiling_enabled = fields.Boolean(string="Request Profiling")
+    clv_profiling_user_logins = fields.Char(string="Profiled Users", help="Comma-separated logins of the users")
+    clv_profiling_device_ids = fields.Char(string="Profiled Devices", help="Comma-separated ids of the devices")
+    clv_profiling_sample_rate = fields.Float(string="Sampling Rate", help="Fraction (0..1) of profiled requests of other users and devices")
+
     def set_values(self):
         res = super(ResConfigSettings, self).set_values()
         config_params = self.env['ir.config_parameter'].sudo()
@@ -36,6 +41,15 @@ class ResConfigSettings(models.TransientModel):
         config_params.set_param('clv_api.clv_scan_serials_on_allocation', self.clv_scan_serials_on_allocation)
         config_params.set_param('clv_api.clv_ship_expected_actual_lines', self.clv_ship_expected_actual_lines)
 
+        config_params.set_param('clv_api.clv_profiling_enabled', self.clv_profiling_enabled)
+        config_params.set_param('clv_api.clv_profiling_user_logins', self.clv_profiling_user_logins or '')
+        config_params.set_param('clv_api.clv_profiling_device_ids', self.clv_profiling_device_ids or '')
+        config_params.set_param('clv_api.clv_profiling_sample_rate', self.clv_profiling_sample_rate)
+
+        self.env['clv_api.settings_cache'].invalidate_settings()
+        # Descriptions contain values depending on the settings
+        self.env['clv_api.document_description'].sudo().enqueue_all()
+
         return res
 
     def get_values(self):
@@ -55,6 +69,11 @@ class ResConfigSettings(models.TransientModel):
         auto_backorders_value = not config_params.get_param('clv_api.clv_auto_create_backorders')
         scan_serials_on_allocation_value = config_params.get_param('clv_api.clv_scan_serials_on_allocation')
         ship_expected_actual_lines_value = config_params.get_param('clv_api.clv_ship_expected_actual_lines')
+        profiling_enabled_value = config_params.get_param('clv_api.clv_profiling_enabled')
+        try:
+            profiling_sample_rate = float(config_params.get_param('clv_api.clv_profiling_sample_rate') or 0.0)
+        except ValueError:
+            profiling_sample_rate = 0.0
 
         res.update(
             clv_warehouse15_connected=warehouse15_connected,
@@ -63,7 +82,11 @@ class ResConfigSettings(models.TransientModel):
             clv_allow_only_lowest_level_locations=bool(value_only_lowest_locs),
             clv_auto_create_backorders=bool(auto_backorders_value),
             clv_scan_serials_on_allocation=bool(scan_serials_on_allocation_value),
-            clv_ship_expected_actual_lines=bool(ship_expected_actual_lines_value)
+            clv_ship_expected_actual_lines=bool(ship_expected_actual_lines_value),
+            clv_profiling_enabled=bool(profiling_enabled_value) and profiling_enabled_value.lower() == 'true',
+            clv_profiling_user_logins=config_params.get_param('clv_api.clv_profiling_user_logins') or '',
+            clv_profiling_device_ids=config_params.get_param('clv_api.clv_profiling_device_ids') or '',
+            clv_profiling_sample_rate=profiling_sample_rate
         )
 
         return res
@@ -76,6 +99,7 @@ class ResConfigSettings(models.TransientModel):
             connected = config_params.get_param('clv_api.clv_warehouse15_connected').lower() == 'true'
 
         config_params.set_param('clv_api.clv_check_connection_failed', not connected)
+        self.env['clv_api.settings_cache'].invalidate_settings()
 
         self.update({
             'clv_warehouse15_connected': connected,
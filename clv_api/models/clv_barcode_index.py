@@ -0,0 +1,132 @@
+import threading
+
+from odoo import models, api
+from odoo.release import version_info
+
+# Database sequence incremented after each committed modification of the indexed product fields
+_INDEX_SEQUENCE = 'clv_api_barcode_index_seq'
+
+
+class BarcodeIndex(models.AbstractModel):
+    """
+    In-memory index of products by barcode, internal reference (default_code) and template (folder).
+    The index is cached per database in each worker and rebuilt after any product modification.
+    Invalidation reaches other workers through the sequence stored in the database:
+    it is incremented after the modifying transaction is committed, and each worker rebuilds the index
+    when the sequence value differs from the value its index was built for.
+    """
+    _name = 'clv_api.barcode_index'
+    _description = 'Cleverence products barcode index'
+
+    # (sequence value, index) by database name
+    _indexes = {}
+    _lock = threading.Lock()
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {_INDEX_SEQUENCE}")
+
+    @api.model
+    def get_product_ids_by_barcode(self, barcode):
+        """
+        Returns ids of active products with passed barcode
+        """
+        return self._filter_by_company(self._get_index()['barcodes'].get(barcode, ()))
+
+    @api.model
+    def get_product_ids_by_default_code(self, default_code):
+        """
+        Returns ids of active products with passed internal reference
+        """
+        return self._filter_by_company(self._get_index()['default_codes'].get(default_code, ()))
+
+    @api.model
+    def get_product_ids_by_template(self, template_id):
+        """
+        Returns ids of active variants of passed product template (folder)
+        """
+        return self._filter_by_company(self._get_index()['templates'].get(template_id, ()))
+
+    @api.model
+    def get_product_ids(self, product_ids):
+        """
+        Returns ids of existing active products from passed ones
+        """
+        return self._filter_by_company(product_ids)
+
+    @api.model
+    def invalidate_index(self):
+        """
+        Drops cached index in all workers after the current transaction is committed.
+        Until then the current transaction uses the index built from its own data.
+        """
+        cr = self.env.cr
+        if getattr(cr, '_clv_barcode_index_changed', False):
+            return
+        cr._clv_barcode_index_changed = True
+        registry = self.env.registry
+
+        def increment_sequence():
+            cr._clv_barcode_index_changed = False
+            with registry.cursor() as sequence_cr:
+                sequence_cr.execute(f"SELECT nextval('{_INDEX_SEQUENCE}')")
+
+        def reset():
+            cr._clv_barcode_index_changed = False
+
+        if version_info[0] >= 14:
+            cr.postcommit.add(increment_sequence)
+            cr.postrollback.add(reset)
+        else:
+            cr.after('commit', increment_sequence)
+            cr.after('rollback', reset)
+
+    def _filter_by_company(self, product_ids):
+        companies = self._get_index()['companies']
+        allowed_company_ids = set(self.env.companies.ids)
+        return [product_id for product_id in product_ids
+                if product_id in companies
+                and (not companies[product_id] or companies[product_id] in allowed_company_ids)]
+
+    def _get_index(self):
+        if getattr(self.env.cr, '_clv_barcode_index_changed', False):
+            # Products are modified by the current transaction, the other workers do not see them yet
+            return self._build_index(self.env)
+
+        self.env.cr.execute(f"SELECT last_value FROM {_INDEX_SEQUENCE}")
+        version = self.env.cr.fetchone()[0]
+        dbname = self.env.cr.dbname
+        with self._lock:
+            cached = self._indexes.get(dbname)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        # The new transaction sees all modifications committed before the sequence value was read
+        with self.env.registry.cursor() as index_cr:
+            index = self._build_index(api.Environment(index_cr, self.env.uid, {}))
+        with self._lock:
+            self._indexes[dbname] = (version, index)
+        return index
+
+    @staticmethod
+    def _build_index(env):
+        barcodes = {}
+        default_codes = {}
+        templates = {}
+        companies = {}
+        products = env['product.product'].sudo().search_read(
+            [('active', '=', True)], ['barcode', 'default_code', 'product_tmpl_id', 'company_id'], order='id')
+        for product in products:
+            product_id = product['id']
+            companies[product_id] = product['company_id'] and product['company_id'][0]
+            if product['barcode']:
+                barcodes.setdefault(product['barcode'], []).append(product_id)
+            if product['default_code']:
+                default_codes.setdefault(product['default_code'], []).append(product_id)
+            templates.setdefault(product['product_tmpl_id'][0], []).append(product_id)
+
+        return {
+            'barcodes': {key: tuple(value) for key, value in barcodes.items()},
+            'default_codes': {key: tuple(value) for key, value in default_codes.items()},
+            'templates': {key: tuple(value) for key, value in templates.items()},
+            'companies': companies,
+        }
@@ -0,0 +1,217 @@
+from datetime import timedelta
+from typing import List, Tuple
+
+from odoo import models, fields, api
+from odoo.release import version_info
+
+# Default number of days the journal entries are kept
+DEFAULT_RETENTION_DAYS = 30
+
+
+class ChangeLog(models.Model):
+    """
+    Journal of changes of the records used to build Inventory API tables (delta synchronization).
+    Entries are ordered by the id of the transaction which made the change, so the entries
+    of the transactions committed later than others are not skipped by devices.
+    """
+    _name = 'clv_api.change_log'
+    _description = 'Cleverence tables change journal'
+    _order = 'id'
+    _log_access = False
+
+    res_model = fields.Char(string="Model", required=True, index=True)
+    res_id = fields.Integer(string="Record ID", required=True)
+    operation = fields.Selection([('upsert', 'Created or modified'), ('delete', 'Deleted')],
+                                 string="Operation", required=True)
+    create_date = fields.Datetime(string="Created on", index=True)
+
+    def init(self):
+        # Transaction id is 64-bit value which is not supported by ORM integer fields
+        self.env.cr.execute(f"""
+            ALTER TABLE {self._table} ADD COLUMN IF NOT EXISTS transaction_id bigint;
+            CREATE INDEX IF NOT EXISTS {self._table}_transaction_id_idx ON {self._table} (transaction_id, id);
+        """)
+
+    @api.model
+    def log_changes(self, res_model: str, res_ids: List[int], operation: str) -> None:
+        """
+        Adds journal entries for changed records
+        @param res_model: model name
+        @param res_ids: ids of the changed records
+        @param operation: 'upsert' or 'delete'
+        """
+        if not res_ids:
+            return
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} (res_model, res_id, operation, create_date, transaction_id)
+            SELECT %s, unnest(%s::int[]), %s, (now() at time zone 'UTC'), txid_current()
+        """, [res_model, list(res_ids), operation])
+
+    @api.model
+    def get_initial_position(self) -> Tuple[int, int]:
+        """
+        Returns journal position before all changes which are not visible to the current transaction yet
+        """
+        return self._get_visible_transaction_id(), 0
+
+    @api.model
+    def is_position_expired(self, position: Tuple[int, int]) -> bool:
+        """
+        True if entries after passed position were removed by compaction (full synchronization is required)
+        """
+        config_params = self.env['ir.config_parameter'].sudo()
+        compacted_transaction_id = int(config_params.get_param('clv_api.change_log_compacted_transaction_id', 0))
+        compacted_id = int(config_params.get_param('clv_api.change_log_compacted_id', 0))
+        return tuple(position) < (compacted_transaction_id, compacted_id)
+
+    @api.model
+    def read_changes(self, res_models: List[str], position: Tuple[int, int], limit: int):
+        """
+        Returns committed journal entries after passed position
+        @param res_models: names of the models
+        @param position: (transaction id, entry id) of the last processed entry
+        @param limit: the maximum number of entries
+        @return: list of entries (dictionaries) and the position of the next request
+        """
+        self.env.cr.execute(f"""
+            SELECT id, transaction_id, res_model, res_id, operation
+            FROM {self._table}
+            WHERE res_model IN %s
+                AND (transaction_id, id) > (%s, %s)
+                AND transaction_id < txid_snapshot_xmin(txid_current_snapshot())
+            ORDER BY transaction_id, id
+            LIMIT %s
+        """, [tuple(res_models), position[0], position[1], limit])
+        entries = self.env.cr.dictfetchall()
+
+        if len(entries) < limit:
+            # All the changes committed before the oldest running transaction are processed
+            next_position = max(tuple(position), self.get_initial_position())
+        else:
+            next_position = (entries[-1]['transaction_id'], entries[-1]['id'])
+        return entries, next_position
+
+    @api.model
+    def _compact(self):
+        """
+        Removes superseded and outdated journal entries (executed by cron)
+        """
+        # Only the last entry of each record is required to synchronize it
+        self.env.cr.execute(f"""
+            DELETE FROM {self._table} AS old_entry
+            USING {self._table} AS new_entry
+            WHERE old_entry.res_model = new_entry.res_model
+                AND old_entry.res_id = new_entry.res_id
+                AND (old_entry.transaction_id, old_entry.id) < (new_entry.transaction_id, new_entry.id)
+        """)
+
+        config_params = self.env['ir.config_parameter'].sudo()
+        retention_days = int(config_params.get_param('clv_api.change_log_retention_days', DEFAULT_RETENTION_DAYS))
+        self.env.cr.execute(f"""
+            DELETE FROM {self._table}
+            WHERE create_date < %s
+            RETURNING transaction_id, id
+        """, [fields.Datetime.now() - timedelta(days=retention_days)])
+        deleted = self.env.cr.fetchall()
+        if deleted:
+            compacted_position = max(deleted)
+            config_params.set_param('clv_api.change_log_compacted_transaction_id', compacted_position[0])
+            config_params.set_param('clv_api.change_log_compacted_id', compacted_position[1])
+
+    def _get_visible_transaction_id(self) -> int:
+        self.env.cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return self.env.cr.fetchone()[0]
+
+
+class ChangeLogMixin(models.AbstractModel):
+    """
+    Writes changes of the records to the change journal
+    """
+    _name = 'clv_api.change_log.mixin'
+    _description = 'Cleverence tables change journal mixin'
+
+    # Only writes of these fields are journaled (None - writes of any fields)
+    _clv_tracked_fields = None
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(ChangeLogMixin, self).create(vals_list)
+        records._clv_log_changes('upsert')
+        return records
+
+    def write(self, vals):
+        res = super(ChangeLogMixin, self).write(vals)
+        if self._clv_tracked_fields is None or any(name in vals for name in self._clv_tracked_fields):
+            self._clv_log_changes('upsert')
+        return res
+
+    def unlink(self):
+        self._clv_log_changes('delete')
+        return super(ChangeLogMixin, self).unlink()
+
+    def _clv_log_changes(self, operation: str) -> None:
+        """
+        Adds journal entries for the records
+        @param operation: 'upsert' or 'delete'
+        """
+        self.env['clv_api.change_log'].sudo().log_changes(self._name, self.ids, operation)
+
+
+class StockLocation(models.Model):
+    _name = 'stock.location'
+    _inherit = ['stock.location', 'clv_api.change_log.mixin']
+
+
+class StockWarehouse(models.Model):
+    _name = 'stock.warehouse'
+    _inherit = ['stock.warehouse', 'clv_api.change_log.mixin']
+
+
+class StockLot(models.Model):
+    _name = 'stock.lot' if version_info[0] >= 16 else 'stock.production.lot'
+    _inherit = [_name, 'clv_api.change_log.mixin']
+
+
+class ResPartner(models.Model):
+    _name = 'res.partner'
+    _inherit = ['res.partner', 'clv_api.change_log.mixin']
+
+    # Fields of the CustomersVendors table
+    _clv_tracked_fields = ('name', 'ref', 'vat', 'parent_id', 'active', 'customer_rank', 'supplier_rank')
+
+    def write(self, vals):
+        if 'parent_id' in vals:
+            # 'isFolder' of the previous parents may change
+            self.env['clv_api.change_log'].sudo().log_changes(self._name, self.parent_id.ids, 'upsert')
+        return super(ResPartner, self).write(vals)
+
+    def _clv_log_changes(self, operation: str) -> None:
+        # 'isFolder' of the parent depends on its children
+        self.env['clv_api.change_log'].sudo().log_changes(self._name, (self | self.parent_id).ids, operation)
+
+
+class ProductProduct(models.Model):
+    _name = 'product.product'
+    _inherit = ['product.product', 'clv_api.change_log.mixin']
+
+
+class ProductTemplate(models.Model):
+    _name = 'product.template'
+    _inherit = ['product.template', 'clv_api.change_log.mixin']
+
+    def _clv_log_changes(self, operation: str) -> None:
+        # Inventory table contains product variants
+        variants = self.with_context(active_test=False).product_variant_ids
+        self.env['clv_api.change_log'].sudo().log_changes('product.product', variants.ids, operation)
+
+
+class StockQuant(models.Model):
+    _name = 'stock.quant'
+    _inherit = ['stock.quant', 'clv_api.change_log.mixin']
+
+    # Reservations ('reserved_quantity') do not change the stock quantity of the products
+    _clv_tracked_fields = ('quantity', 'inventory_quantity', 'product_id', 'location_id', 'lot_id')
+
+    def _clv_log_changes(self, operation: str) -> None:
+        # Quants change the stock quantity of the products in the Inventory table
+        self.env['clv_api.change_log'].sudo().log_changes('product.product', self.product_id.ids, 'upsert')
@@ -0,0 +1,284 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+from odoo import models, fields, api
+from odoo.release import version_info
+
+from ..controllers.documents import DocumentImpl
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+# Number of queued pickings refreshed by one call
+DEFAULT_REFRESH_BATCH_SIZE = 1000
+
+
+class DocumentDescriptionQueue(models.Model):
+    """
+    Pickings which descriptions have to be refreshed. Hooks only insert rows,
+    so changing pickings does not conflict with the requests refreshing descriptions.
+    """
+    _name = 'clv_api.document_description_queue'
+    _description = 'Cleverence document description refresh queue'
+    _order = 'id'
+    _log_access = False
+
+    picking_id = fields.Integer(string="Transfer ID", required=True)
+
+    @api.model
+    def enqueue(self, picking_ids: List[int]) -> None:
+        self.env.cr.execute(f"INSERT INTO {self._table} (picking_id) SELECT unnest(%s::int[])",
+                            [list(set(picking_ids))])
+
+
+class DocumentDescription(models.Model):
+    """
+    Materialized Inventory API document descriptions (headers) of ready stock.picking documents,
+    so getDocumentDescriptions reads them by one indexed query instead of converting the pickings on each poll.
+    Changed pickings are queued by the hooks and refreshed by cron,
+    the queued pickings of the requested page are refreshed before the page is returned.
+    """
+    _name = 'clv_api.document_description'
+    _description = 'Cleverence document description'
+    _order = 'picking_id desc'
+
+    picking_id = fields.Many2one('stock.picking', string="Transfer", required=True, ondelete='cascade')
+    # Inventory API document type name in lower case
+    document_type_name = fields.Char(string="Document Type", required=True)
+    company_id = fields.Many2one('res.company', string="Company")
+    data = fields.Text(string="Description")
+
+    _sql_constraints = [
+        ('picking_unique', 'unique(picking_id)', 'Description of the transfer already exists'),
+    ]
+
+    def init(self):
+        self.env.cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self._table}_type_picking_idx
+            ON {self._table} (document_type_name, picking_id DESC)
+        """)
+        # Descriptions of the pickings existing before installation are built on the first request
+        self.env.cr.execute(f"""
+            INSERT INTO {self.env['clv_api.document_description_queue']._table} (picking_id)
+            SELECT id FROM stock_picking WHERE state = 'assigned'
+                AND NOT EXISTS (SELECT 1 FROM {self._table} WHERE picking_id = stock_picking.id)
+        """)
+
+    @api.model
+    def enqueue(self, picking_ids: List[int]) -> None:
+        """
+        Queues the pickings to refresh their descriptions
+        """
+        if picking_ids:
+            self.env['clv_api.document_description_queue'].sudo().enqueue(picking_ids)
+
+    @api.model
+    def enqueue_all(self) -> None:
+        """
+        Queues all ready pickings and the pickings having descriptions (e.g. after settings change)
+        """
+        self.env.cr.execute(f"""
+            INSERT INTO {self.env['clv_api.document_description_queue']._table} (picking_id)
+            SELECT id FROM stock_picking WHERE state = 'assigned'
+            UNION
+            SELECT picking_id FROM {self._table}
+        """)
+
+    @api.model
+    def claim_queued(self, limit: int = DEFAULT_REFRESH_BATCH_SIZE,
+                     picking_ids: Optional[List[int]] = None) -> List[int]:
+        """
+        Removes queued pickings from the queue and returns their ids.
+        Pickings claimed by concurrent requests are skipped.
+        @param limit: the maximum number of claimed queue rows
+        @param picking_ids: only these pickings are claimed (None - any queued pickings)
+        """
+        queue_table = self.env['clv_api.document_description_queue']._table
+        where = ''
+        params = []
+        if picking_ids is not None:
+            where = 'WHERE picking_id = ANY(%s)'
+            params.append(list(picking_ids))
+        self.env.cr.execute(f"""
+            DELETE FROM {queue_table}
+            WHERE id IN (SELECT id FROM {queue_table} {where} ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED)
+            RETURNING picking_id
+        """, params + [limit])
+        return list({row[0] for row in self.env.cr.fetchall()})
+
+    @api.model
+    def store(self, picking_ids: List[int], descriptions: Dict[int, Tuple[str, Optional[int], dict]]) -> None:
+        """
+        Replaces descriptions of the refreshed pickings
+        @param picking_ids: ids of all refreshed pickings (descriptions of the pickings which are not ready are removed)
+        @param descriptions: (document type name, company id, description) by picking id
+        """
+        removed_ids = [picking_id for picking_id in picking_ids if picking_id not in descriptions]
+        if removed_ids:
+            self.env.cr.execute(f"DELETE FROM {self._table} WHERE picking_id IN %s", [tuple(removed_ids)])
+
+        for picking_id, (document_type_name, company_id, description) in descriptions.items():
+            self.env.cr.execute(f"""
+                INSERT INTO {self._table} (picking_id, document_type_name, company_id, data,
+                    create_date, write_date, create_uid, write_uid)
+                VALUES (%s, %s, %s, %s, (now() at time zone 'UTC'), (now() at time zone 'UTC'), %s, %s)
+                ON CONFLICT (picking_id) DO UPDATE SET document_type_name = EXCLUDED.document_type_name,
+                    company_id = EXCLUDED.company_id, data = EXCLUDED.data, write_date = EXCLUDED.write_date
+            """, [picking_id, document_type_name, company_id, json.dumps(description), self.env.uid, self.env.uid])
+
+    @api.model
+    def read_page(self, document_type_name: str, company_ids: List[int], offset, limit,
+                  before_picking_id: Optional[int]) -> List[Tuple[int, dict]]:
+        """
+        Returns descriptions of the document type ordered by picking id descending
+        @param document_type_name: Inventory API document type name
+        @param company_ids: allowed companies
+        @param offset: offset of the page
+        @param limit: the maximum number of descriptions
+        @param before_picking_id: descriptions of the pickings with lower ids are returned (keyset pagination)
+        @return: list of (picking id, description)
+        """
+        query, params = self._get_page_query(document_type_name, company_ids, before_picking_id)
+        query = f"SELECT picking_id, data FROM {self._table} WHERE {query} ORDER BY picking_id DESC"
+        if limit:
+            query += ' LIMIT %s'
+            params.append(limit)
+        if offset:
+            query += ' OFFSET %s'
+            params.append(offset)
+        self.env.cr.execute(query, params)
+        return [(picking_id, json.loads(data)) for picking_id, data in self.env.cr.fetchall()]
+
+    @api.model
+    def read_count(self, document_type_name: str, company_ids: List[int]) -> int:
+        """
+        Returns number of descriptions of the document type
+        """
+        query, params = self._get_page_query(document_type_name, company_ids, None)
+        self.env.cr.execute(f"SELECT count(*) FROM {self._table} WHERE {query}", params)
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def read_picking_ids(self, document_type_name: str, company_ids: List[int]) -> List[int]:
+        """
+        Returns ids of the pickings having descriptions of the document type
+        """
+        query, params = self._get_page_query(document_type_name, company_ids, None)
+        self.env.cr.execute(f"SELECT picking_id FROM {self._table} WHERE {query}", params)
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def _get_page_query(self, document_type_name: str, company_ids: List[int], before_picking_id: Optional[int]):
+        query = "document_type_name = %s AND (company_id IS NULL OR company_id IN %s)"
+        params = [document_type_name.lower(), tuple(company_ids) or (0,)]
+        if before_picking_id:
+            query += " AND picking_id < %s"
+            params.append(before_picking_id)
+        return query, params
+
+    @api.model
+    def refresh_queued(self, picking_ids: List[int]) -> bool:
+        """
+        Refreshes descriptions of the passed pickings if they are queued
+        @return: True if any descriptions were refreshed
+        """
+        if not picking_ids:
+            return False
+        env = OdooEnvWrapper(self.env, version_info[0])
+        return DocumentImpl().refresh_document_descriptions(env, picking_ids=picking_ids)
+
+    @api.model
+    def _refresh_all_queued(self):
+        """
+        Refreshes descriptions of all queued pickings (executed by cron)
+        """
+        env = OdooEnvWrapper(self.env, version_info[0])
+        while DocumentImpl().refresh_document_descriptions(env):
+            pass
+
+    @api.model
+    def _rebuild(self):
+        """
+        Rebuilds all descriptions (executed by cron, can also be run manually)
+        """
+        self.env.cr.execute(f"DELETE FROM {self._table}")
+        self.enqueue_all()
+        self._refresh_all_queued()
+
+
+class StockPicking(models.Model):
+    _inherit = 'stock.picking'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(StockPicking, self).create(vals_list)
+        self.env['clv_api.document_description'].enqueue(records.ids)
+        return records
+
+    def _write(self, vals):
+        # '_write' is called by 'write' and by the recomputation of stored fields (e.g. 'state')
+        res = super(StockPicking, self)._write(vals)
+        self.env['clv_api.document_description'].enqueue(self.ids)
+        return res
+
+
+class StockPickingType(models.Model):
+    _inherit = 'stock.picking.type'
+
+    def write(self, vals):
+        res = super(StockPickingType, self).write(vals)
+        if 'sequence_code' in vals or 'warehouse_id' in vals:
+            self._clv_enqueue_pickings([('picking_type_id', 'in', self.ids)])
+        return res
+
+    def _clv_enqueue_pickings(self, domain_filter) -> None:
+        pickings = self.env['stock.picking'].sudo().search(domain_filter + [('state', '=', 'assigned')])
+        self.env['clv_api.document_description'].enqueue(pickings.ids)
+
+
+class StockLocationDescriptions(models.Model):
+    _inherit = 'stock.location'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(StockLocationDescriptions, self).create(vals_list)
+        records._clv_enqueue_pickings()
+        return records
+
+    def write(self, vals):
+        # 'scanLocations' depends on whether the main location of the document has active child locations
+        structure_changed = any(name in vals for name in ('active', 'location_id', 'company_id'))
+        if structure_changed:
+            self._clv_enqueue_pickings()
+        res = super(StockLocationDescriptions, self).write(vals)
+        if structure_changed or 'name' in vals:
+            self._clv_enqueue_pickings()
+        return res
+
+    def unlink(self):
+        self._clv_enqueue_pickings()
+        return super(StockLocationDescriptions, self).unlink()
+
+    def _clv_enqueue_pickings(self) -> None:
+        """
+        Queues ready pickings of the locations and their parent locations
+        (allocation documents are also selected by the name of the source location)
+        """
+        location_ids = {int(location_id) for location in self.sudo()
+                        for location_id in (location.parent_path or '').split('/') if location_id}
+        location_ids.update(self.ids)
+        if not location_ids:
+            return
+        pickings = self.env['stock.picking'].sudo().search(['|', ('location_id', 'in', list(location_ids)),
+                                                            ('location_dest_id', 'in', list(location_ids)),
+                                                            ('state', '=', 'assigned')])
+        self.env['clv_api.document_description'].enqueue(pickings.ids)
+
+
+class StockWarehouseDescriptions(models.Model):
+    _inherit = 'stock.warehouse'
+
+    def write(self, vals):
+        res = super(StockWarehouseDescriptions, self).write(vals)
+        if any(name in vals for name in ('name', 'reception_steps', 'delivery_steps')):
+            pickings = self.env['stock.picking'].sudo().search([('picking_type_id.warehouse_id', 'in', self.ids),
+                                                                ('state', '=', 'assigned')])
+            self.env['clv_api.document_description'].enqueue(pickings.ids)
+        return res
@@ -0,0 +1,218 @@
+import json
+import logging
+from datetime import timedelta
+
+from psycopg2 import errorcodes, OperationalError
+
+from odoo import models, fields, api
+from odoo.release import version_info
+from odoo.tools import config
+
+from ..controllers.documents import DocumentImpl
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+_logger = logging.getLogger(__name__)
+
+# The maximum number of attempts to process the job failed by concurrent transactions
+DEFAULT_MAX_ATTEMPTS = 5
+# Delay before the first retry in seconds, it is doubled on each next attempt
+DEFAULT_RETRY_DELAY = 30
+# The maximum number of jobs processed by one cron worker run
+DEFAULT_JOBS_BATCH_SIZE = 10
+# Running jobs are considered abandoned (the worker was killed) after this time in seconds,
+# it is always kept above the time limit of cron workers
+DEFAULT_RUNNING_TIMEOUT = 3600
+
+# Errors of concurrent transactions, the job is retried after them
+_RETRYABLE_ERROR_CODES = (
+    errorcodes.SERIALIZATION_FAILURE,
+    errorcodes.DEADLOCK_DETECTED,
+    errorcodes.LOCK_NOT_AVAILABLE,
+)
+
+
+class DocumentJob(models.Model):
+    """
+    Finished document submitted by the device for asynchronous processing (setDocument in async mode).
+    Jobs are processed by cron workers, each job in its own transaction.
+    """
+    _name = 'clv_api.document_job'
+    _description = 'Cleverence document processing job'
+    _order = 'id'
+
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ], string="State", required=True, default='pending', index=True)
+    user_id = fields.Many2one('res.users', string="User", required=True, ondelete='cascade')
+    company_ids = fields.Char(string="Allowed Companies")
+    document_type_name = fields.Char(string="Document Type")
+    document_name = fields.Char(string="Document")
+    device_id = fields.Char(string="Device ID")
+    payload = fields.Text(string="Payload")
+    attempts = fields.Integer(string="Attempts", default=0)
+    next_attempt_date = fields.Datetime(string="Next Attempt", index=True)
+    started_date = fields.Datetime(string="Started")
+    finished_date = fields.Datetime(string="Finished")
+    error = fields.Text(string="Error")
+
+    @api.model
+    def enqueue(self, env: OdooEnvWrapper, doc, device_info):
+        """
+        Stores the document to be processed by cron workers
+        @param env: Environment of the request
+        @param doc: Inventory API document
+        @param device_info: Inventory API DeviceInfo
+        @return: created job
+        """
+        if doc is None:
+            raise RuntimeError('Document is null')
+
+        job = self.sudo().create({
+            'user_id': env.uid,
+            'company_ids': json.dumps(env.companies.ids),
+            'document_type_name': doc.get('documentTypeName'),
+            'document_name': doc.get('name') or doc.get('id'),
+            'device_id': device_info.get('deviceId') if device_info else None,
+            'payload': json.dumps({'document': doc, 'deviceInfo': device_info}),
+            'next_attempt_date': fields.Datetime.now()
+        })
+        self._trigger_workers()
+        return job
+
+    def get_status(self) -> dict:
+        """
+        Returns state of the job (Inventory API object)
+        """
+        self.ensure_one()
+        return {
+            'jobId': str(self.id),
+            'state': self.state,
+            'attempts': self.attempts,
+            'error': self.error or None,
+            'createDate': fields.Datetime.to_string(self.create_date),
+            'startedDate': fields.Datetime.to_string(self.started_date) if self.started_date else None,
+            'finishedDate': fields.Datetime.to_string(self.finished_date) if self.finished_date else None
+        }
+
+    @api.model
+    def _process_jobs(self, limit: int = DEFAULT_JOBS_BATCH_SIZE):
+        """
+        Processes pending jobs (executed by cron workers).
+        Several workers can run simultaneously, each job is claimed by one of them.
+        """
+        config_params = self.env['ir.config_parameter'].sudo()
+        max_attempts = int(config_params.get_param('clv_api.document_job_max_attempts', DEFAULT_MAX_ATTEMPTS))
+        retry_delay = int(config_params.get_param('clv_api.document_job_retry_delay', DEFAULT_RETRY_DELAY))
+        running_timeout = self._get_running_timeout()
+
+        self._fail_abandoned_jobs(max_attempts, running_timeout)
+        for _ in range(limit):
+            job = self._claim_job(max_attempts, running_timeout)
+            if not job:
+                break
+            self._process_job(job, max_attempts, retry_delay)
+
+    @api.model
+    def _get_running_timeout(self) -> int:
+        """
+        Returns time in seconds after which the running job is considered abandoned.
+        The value of 'clv_api.document_job_running_timeout' parameter is raised above the time limit
+        of cron workers, so the job which is still processed is never claimed again.
+        """
+        timeout = int(self.env['ir.config_parameter'].sudo().get_param('clv_api.document_job_running_timeout',
+                                                                       DEFAULT_RUNNING_TIMEOUT))
+        time_limit = config.get('limit_time_real_cron') or -1
+        if time_limit < 0:
+            time_limit = config.get('limit_time_real') or 0
+        return max(timeout, int(time_limit) * 2)
+
+    def _fail_abandoned_jobs(self, max_attempts: int, running_timeout: int) -> None:
+        """
+        Marks as failed the abandoned running jobs which have no attempts left
+        (e.g. the document which kills the worker by memory or time limit)
+        """
+        self.env.cr.execute(f"""
+            UPDATE {self._table}
+            SET state = 'failed', finished_date = %s, error = %s, write_date = %s
+            WHERE id IN (
+                SELECT id FROM {self._table}
+                WHERE state = 'running' AND started_date < %s AND attempts >= %s
+                FOR UPDATE SKIP LOCKED
+            )
+        """, [fields.Datetime.now(), 'The worker was stopped while processing the document',
+              fields.Datetime.now(), fields.Datetime.now() - timedelta(seconds=running_timeout), max_attempts])
+        self.env.cr.commit()
+
+    def _claim_job(self, max_attempts: int, running_timeout: int):
+        """
+        Marks the next pending job as running and commits it, so other workers skip it.
+        The job row stays locked until the job is finished, so it is not claimed again while it is processed.
+        @param max_attempts: abandoned running jobs are claimed again only if they have attempts left
+        @param running_timeout: time in seconds after which the running job is considered abandoned
+        @return: claimed job or empty recordset
+        """
+        now = fields.Datetime.now()
+        self.env.cr.execute(f"""
+            SELECT id FROM {self._table}
+            WHERE (state = 'pending' AND (next_attempt_date IS NULL OR next_attempt_date <= %s))
+                OR (state = 'running' AND started_date < %s AND attempts < %s)
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, [now, now - timedelta(seconds=running_timeout), max_attempts])
+        row = self.env.cr.fetchone()
+        if not row:
+            return self.browse()
+
+        job = self.browse(row[0])
+        job.write({'state': 'running', 'attempts': job.attempts + 1, 'started_date': now, 'error': False})
+        self.env.cr.commit()
+        self.env.cr.execute(f"SELECT id FROM {self._table} WHERE id = %s FOR UPDATE", [job.id])
+        return job
+
+    def _process_job(self, job, max_attempts: int, retry_delay: int) -> None:
+        """
+        Processes the document of the job in a separate transaction and stores the result
+        """
+        payload = json.loads(job.payload or '{}')
+        context = dict(self.env.context, allowed_company_ids=json.loads(job.company_ids or '[]'))
+        try:
+            with self.pool.cursor() as job_cr:
+                job_env = api.Environment(job_cr, job.user_id.id, context)
+                DocumentImpl().set_document(OdooEnvWrapper(job_env, version_info[0]),
+                                            payload.get('document'),
+                                            payload.get('deviceInfo'))
+        except OperationalError as e:
+            if e.pgcode in _RETRYABLE_ERROR_CODES and job.attempts < max_attempts:
+                # Concurrent transaction changed the same records, retrying later
+                delay = retry_delay * 2 ** (job.attempts - 1)
+                _logger.info('Document job %s failed by concurrent update, retrying in %s s', job.id, delay)
+                job.write({
+                    'state': 'pending',
+                    'next_attempt_date': fields.Datetime.now() + timedelta(seconds=delay),
+                    'error': str(e)
+                })
+            else:
+                _logger.warning('Document job %s failed', job.id, exc_info=True)
+                job.write({'state': 'failed', 'finished_date': fields.Datetime.now(), 'error': str(e)})
+        except Exception as e:
+            _logger.warning('Document job %s failed', job.id, exc_info=True)
+            job.write({'state': 'failed', 'finished_date': fields.Datetime.now(), 'error': str(e)})
+        else:
+            job.write({'state': 'done', 'finished_date': fields.Datetime.now(), 'error': False})
+        self.env.cr.commit()
+
+    @api.model
+    def _trigger_workers(self):
+        """
+        Requests cron workers to process the jobs as soon as possible
+        """
+        if version_info[0] < 15:
+            return
+        for xml_id in ('clv_api.ir_cron_process_document_jobs', 'clv_api.ir_cron_process_document_jobs_2'):
+            cron = self.env.ref(xml_id, raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from typing import Optional
+
+from odoo import models, fields, api
+
+# Shared cached documents not requested for this time are removed, in hours
+DEFAULT_PAYLOAD_TTL = 72
+
+
+class DocumentPayload(models.Model):
+    """
+    Shared tier of the getDocument payload cache (see DocumentPayloadCache), enabled by
+    'clv_api.document_cache_shared' parameter. Only the latest version of each picking is kept.
+    """
+    _name = 'clv_api.document_payload'
+    _description = 'Cleverence cached document'
+
+    picking_id = fields.Many2one('stock.picking', string="Transfer", required=True, ondelete='cascade')
+    version = fields.Char(string="Version", required=True)
+    data = fields.Text(string="Document")
+
+    _sql_constraints = [
+        ('picking_unique', 'unique(picking_id)', 'Cached document of the transfer already exists'),
+    ]
+
+    @api.model
+    def get_payload(self, picking_id: int, version: str) -> Optional[str]:
+        """
+        Returns JSON of the cached document or None if there is no document of this version
+        """
+        self.env.cr.execute(f"SELECT data FROM {self._table} WHERE picking_id = %s AND version = %s",
+                            [picking_id, version])
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    @api.model
+    def store_payload(self, picking_id: int, version: str, data: str) -> None:
+        """
+        Replaces cached document of the picking
+        """
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} (picking_id, version, data, create_date, write_date, create_uid, write_uid)
+            VALUES (%s, %s, %s, (now() at time zone 'UTC'), (now() at time zone 'UTC'), %s, %s)
+            ON CONFLICT (picking_id) DO UPDATE SET version = EXCLUDED.version, data = EXCLUDED.data,
+                write_date = EXCLUDED.write_date
+        """, [picking_id, version, data, self.env.uid, self.env.uid])
+
+    @api.model
+    def _cleanup(self):
+        """
+        Removes expired cached documents (executed by cron)
+        """
+        try:
+            ttl = int(self.env['ir.config_parameter'].sudo().get_param('clv_api.document_payload_ttl',
+                                                                       DEFAULT_PAYLOAD_TTL))
+        except ValueError:
+            ttl = DEFAULT_PAYLOAD_TTL
+        expired_date = fields.Datetime.now() - timedelta(hours=ttl)
+        self.env.cr.execute(f"DELETE FROM {self._table} WHERE write_date < %s", [expired_date])
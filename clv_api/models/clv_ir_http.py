@@ -0,0 +1,17 @@
+from odoo import models
+from odoo.http import request
+from odoo.release import version_info
+
+from ..controllers.clv_api_endpoint import is_clv_api_endpoint, decompress_request_body
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+
+    @classmethod
+    def _pre_dispatch(cls, rule, args):
+        # Since Odoo 16 json body is parsed after pre-dispatching, so compressed body can be replaced here.
+        # In the older versions the body is parsed when the request object is created.
+        if version_info[0] >= 16 and is_clv_api_endpoint(rule.endpoint):
+            decompress_request_body(request)
+        return super(IrHttp, cls)._pre_dispatch(rule, args)
@@ -0,0 +1,98 @@
+import json
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+from ..utils.endpoint_metrics import EndpointMetrics
+from ..utils.response_compressor import ResponseCompressor
+
+# Snapshots not updated for this time in seconds belong to stopped workers
+DEFAULT_SNAPSHOT_TTL = 3600
+
+# (pid, unique name) of the current process, the name is regenerated in forked workers
+_worker_name = (None, None)
+
+
+class MetricsSnapshot(models.Model):
+    """
+    Metrics of Inventory API endpoints flushed by each worker process,
+    so the metrics can be summed across the workers of prefork server.
+    Snapshots of the stopped (recycled) workers are ignored after 'clv_api.metrics_snapshot_ttl' seconds
+    and removed by cron.
+    """
+    _name = 'clv_api.metrics_snapshot'
+    _description = 'Cleverence endpoints metrics snapshot'
+
+    worker = fields.Char(string="Worker", required=True, index=True)
+    data = fields.Text(string="Metrics")
+
+    _sql_constraints = [
+        ('worker_unique', 'unique(worker)', 'Metrics snapshot of the worker already exists'),
+    ]
+
+    @api.model
+    def flush_worker_metrics(self):
+        """
+        Stores metrics of the current worker process
+        """
+        data = json.dumps({
+            'endpoints': EndpointMetrics.get_series(),
+            'compression': ResponseCompressor.get_stats()
+        })
+        worker = self._get_worker_name()
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} (worker, data, create_date, write_date, create_uid, write_uid)
+            VALUES (%s, %s, (now() at time zone 'UTC'), (now() at time zone 'UTC'), %s, %s)
+            ON CONFLICT (worker) DO UPDATE SET data = EXCLUDED.data, write_date = EXCLUDED.write_date
+        """, [worker, data, self.env.uid, self.env.uid])
+
+    @api.model
+    def get_merged_metrics(self):
+        """
+        Returns metrics summed across all the workers (the current worker metrics are taken from the memory)
+        @return: endpoints series and compression stats by endpoints
+        """
+        current_worker = self._get_worker_name()
+        endpoints = [EndpointMetrics.get_series()]
+        compression = [ResponseCompressor.get_stats()]
+        live_date = fields.Datetime.now() - timedelta(seconds=self._get_snapshot_ttl())
+        for snapshot in self.search_read([('worker', '!=', current_worker), ('write_date', '>=', live_date)], ['data']):
+            snapshot_data = json.loads(snapshot['data'] or '{}')
+            endpoints.append(snapshot_data.get('endpoints', []))
+            compression.append(snapshot_data.get('compression', {}))
+
+        merged_compression = {}
+        for stats_by_endpoint in compression:
+            for endpoint, stats in stats_by_endpoint.items():
+                target = merged_compression.setdefault(endpoint, dict.fromkeys(stats, 0))
+                for name, value in stats.items():
+                    target[name] = target.get(name, 0) + value
+
+        return EndpointMetrics.merge(endpoints), merged_compression
+
+    @api.model
+    def _cleanup(self):
+        """
+        Removes snapshots of the stopped workers (executed by cron)
+        """
+        expired_date = fields.Datetime.now() - timedelta(seconds=self._get_snapshot_ttl())
+        self.env.cr.execute(f"DELETE FROM {self._table} WHERE write_date < %s", [expired_date])
+
+    def _get_snapshot_ttl(self) -> int:
+        try:
+            return int(self.env['ir.config_parameter'].sudo().get_param('clv_api.metrics_snapshot_ttl',
+                                                                       DEFAULT_SNAPSHOT_TTL))
+        except ValueError:
+            return DEFAULT_SNAPSHOT_TTL
+
+    @staticmethod
+    def _get_worker_name() -> str:
+        # The unique suffix keeps the snapshot of the process which pid is reused by a new worker apart
+        global _worker_name
+        pid = os.getpid()
+        if _worker_name[0] != pid:
+            _worker_name = (pid, '{}:{}:{}'.format(socket.gethostname(), pid, uuid.uuid4().hex[:8]))
+        return _worker_name[1]
@@ -0,0 +1,56 @@
+import base64
+
+from odoo import models, fields, api
+
+from ..utils.request_profiler import RequestProfiler
+
+
+class ProfileRun(models.Model):
+    """
+    Profile of Inventory API request captured in profiling mode.
+    """
+    _name = 'clv_api.profile_run'
+    _description = 'Cleverence request profile'
+    _order = 'id desc'
+
+    route = fields.Char(string="Route", required=True, index=True)
+    kind = fields.Char(string="Table or Document Type")
+    user_id = fields.Many2one('res.users', string="User", ondelete='set null')
+    device_id = fields.Char(string="Device ID", index=True)
+    failed = fields.Boolean(string="Failed")
+    duration = fields.Float(string="Duration (s)", digits=(16, 3))
+    peak_memory = fields.Integer(string="Peak Memory (bytes)")
+    sql_count = fields.Integer(string="SQL Queries")
+    pstats_file = fields.Binary(string="Profile (pstats)", attachment=True)
+    pstats_file_name = fields.Char(string="Profile File Name")
+    sql_file = fields.Binary(string="SQL Statements", attachment=True)
+    sql_file_name = fields.Char(string="SQL File Name")
+
+    @api.model
+    def create_from_profiler(self, profiler: RequestProfiler, route: str, kind: str, user_id: int,
+                             device_id: str, failed: bool):
+        """
+        Stores captured profile
+        @param profiler: finished profiler
+        @param route: path of the endpoint
+        @param kind: table name or document type name
+        @param user_id: id of the user who sent the request
+        @param device_id: id of the device which sent the request
+        @param failed: True if the request failed
+        @return: created record
+        """
+        file_prefix = 'clv_profile_{}'.format(fields.Datetime.now().strftime('%Y%m%d_%H%M%S'))
+        return self.create({
+            'route': route,
+            'kind': kind,
+            'user_id': user_id,
+            'device_id': device_id,
+            'failed': failed,
+            'duration': profiler.duration,
+            'peak_memory': profiler.peak_memory,
+            'sql_count': profiler.sql_count,
+            'pstats_file': base64.b64encode(profiler.get_pstats_dump()),
+            'pstats_file_name': file_prefix + '.pstats',
+            'sql_file': base64.b64encode(profiler.get_sql_text().encode('utf-8')),
+            'sql_file_name': file_prefix + '.sql'
+        })
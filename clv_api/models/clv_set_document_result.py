@@ -0,0 +1,74 @@
+import json
+from datetime import timedelta
+from typing import Any, Tuple
+
+from odoo import models, fields, api
+
+# How long the results of processed documents are kept, in hours
+DEFAULT_RESULT_TTL = 24
+
+
+class SetDocumentResult(models.Model):
+    """
+    Results of setDocument requests by idempotency keys, so the request retried by the device
+    after the lost response returns the stored result instead of processing the document again.
+    """
+    _name = 'clv_api.set_document_result'
+    _description = 'Cleverence processed document result'
+
+    key = fields.Char(string="Idempotency Key", required=True, index=True)
+    result = fields.Text(string="Result")
+
+    _sql_constraints = [
+        ('key_unique', 'unique(key)', 'Result of the document with this key already exists'),
+    ]
+
+    @api.model
+    def claim(self, key: str) -> Tuple[bool, Any]:
+        """
+        Reserves the key in the current transaction.
+        The row inserted by the concurrent request with the same key blocks until that request is finished.
+        If it is committed, the current transaction fails with serialization error and the request is retried
+        by Odoo, so the retry returns the stored result. If it is rolled back, the key is reserved by the current request.
+        @param key: idempotency key
+        @return: (True, None) if the key is reserved and the document has to be processed,
+                 (False, stored result) if the document has been already processed
+        """
+        expired_date = fields.Datetime.now() - timedelta(hours=self._get_result_ttl())
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} (key, result, create_date, write_date, create_uid, write_uid)
+            VALUES (%s, NULL, (now() at time zone 'UTC'), (now() at time zone 'UTC'), %s, %s)
+            ON CONFLICT (key) DO UPDATE SET result = NULL, create_date = EXCLUDED.create_date,
+                write_date = EXCLUDED.write_date
+                WHERE {self._table}.create_date < %s
+            RETURNING id
+        """, [key, self.env.uid, self.env.uid, expired_date])
+        if self.env.cr.fetchone():
+            return True, None
+
+        self.env.cr.execute(f"SELECT result FROM {self._table} WHERE key = %s", [key])
+        row = self.env.cr.fetchone()
+        return False, json.loads(row[0]) if row and row[0] else None
+
+    @api.model
+    def store_result(self, key: str, result: Any) -> None:
+        """
+        Stores the result of the document processing for the key reserved by 'claim'
+        (it is committed together with the document changes)
+        """
+        self.env.cr.execute(f"UPDATE {self._table} SET result = %s WHERE key = %s", [json.dumps(result), key])
+
+    @api.model
+    def _cleanup(self):
+        """
+        Removes expired results (executed by cron)
+        """
+        expired_date = fields.Datetime.now() - timedelta(hours=self._get_result_ttl())
+        self.env.cr.execute(f"DELETE FROM {self._table} WHERE create_date < %s", [expired_date])
+
+    def _get_result_ttl(self) -> int:
+        try:
+            return int(self.env['ir.config_parameter'].sudo().get_param('clv_api.set_document_result_ttl',
+                                                                       DEFAULT_RESULT_TTL))
+        except ValueError:
+            return DEFAULT_RESULT_TTL
@@ -0,0 +1,122 @@
+from typing import Optional, Tuple
+
+from odoo import models, api, tools
+from odoo.release import version_info
+
+from ..utils.request_profiler import ProfilingSettings
+from ..utils.response_compressor import DEFAULT_COMPRESSION_LEVEL, DEFAULT_COMPRESSION_MIN_SIZE
+
+# Keys of the Warehouse 15 settings stored in 'ir.config_parameter'
+SETTINGS_KEYS = (
+    'clv_api.clv_warehouse15_connected',
+    'clv_api.clv_check_connection_failed',
+    'clv_api.clv_default_scan_locations',
+    'clv_api.clv_allow_only_lowest_level_locations',
+    'clv_api.clv_auto_create_backorders',
+    'clv_api.clv_scan_serials_on_allocation',
+    'clv_api.clv_ship_expected_actual_lines',
+)
+
+
+class SettingsCache(models.AbstractModel):
+    """
+    Process-level cache of Warehouse 15 settings and installed modules.
+    The cache is kept per registry and dropped after any change of the settings or module state.
+    Invalidation reaches other workers through the registry cache signaling stored in the database.
+    """
+    _name = 'clv_api.settings_cache'
+    _description = 'Cleverence settings cache'
+
+    @api.model
+    def get_settings(self) -> dict:
+        """
+        Returns raw values of Warehouse 15 settings by their keys
+        """
+        return dict(self._get_settings())
+
+    @api.model
+    def is_module_installed(self, module_name: str) -> bool:
+        """
+        True if the module with passed name is installed
+        """
+        return self._is_module_installed(module_name)
+
+    @api.model
+    def get_profiling_settings(self) -> Optional[ProfilingSettings]:
+        """
+        Returns settings of the requests profiling mode, None if the mode is off
+        """
+        return self._get_profiling_settings()
+
+    @api.model
+    def get_compression_settings(self) -> Tuple[int, int]:
+        """
+        Returns minimal size of the compressed response body and compression level
+        """
+        return self._get_compression_settings()
+
+    @api.model
+    def invalidate_settings(self):
+        """
+        Drops cached settings in all workers
+        """
+        if version_info[0] >= 17:
+            self.env.registry.clear_cache()
+        else:
+            self.clear_caches()
+
+    @tools.ormcache()
+    def _get_settings(self):
+        config_params = self.env['ir.config_parameter'].sudo()
+        return tuple((key, config_params.get_param(key)) for key in SETTINGS_KEYS)
+
+    @tools.ormcache()
+    def _get_profiling_settings(self):
+        config_params = self.env['ir.config_parameter'].sudo()
+        if (config_params.get_param('clv_api.clv_profiling_enabled') or '').lower() != 'true':
+            return None
+
+        user_logins = [login.strip() for login in (config_params.get_param('clv_api.clv_profiling_user_logins') or '').split(',')
+                       if login.strip()]
+        user_ids = self.env['res.users'].sudo().with_context(active_test=False).search([('login', 'in', user_logins)]).ids \
+            if user_logins else []
+        device_ids = [device_id.strip().upper()
+                      for device_id in (config_params.get_param('clv_api.clv_profiling_device_ids') or '').split(',')
+                      if device_id.strip()]
+        try:
+            sample_rate = float(config_params.get_param('clv_api.clv_profiling_sample_rate') or 0.0)
+        except ValueError:
+            sample_rate = 0.0
+
+        if not user_ids and not device_ids and sample_rate <= 0:
+            return None
+        return ProfilingSettings(frozenset(user_ids), frozenset(device_ids), min(sample_rate, 1.0))
+
+    @tools.ormcache()
+    def _get_compression_settings(self):
+        # 'ir.config_parameter' drops the cache when the parameters are changed
+        config_params = self.env['ir.config_parameter'].sudo()
+        try:
+            min_size = int(config_params.get_param('clv_api.compression_min_size', DEFAULT_COMPRESSION_MIN_SIZE))
+            level = int(config_params.get_param('clv_api.compression_level', DEFAULT_COMPRESSION_LEVEL))
+        except ValueError:
+            return DEFAULT_COMPRESSION_MIN_SIZE, DEFAULT_COMPRESSION_LEVEL
+        return min_size, min(max(level, 1), 9)
+
+    @tools.ormcache('module_name')
+    def _is_module_installed(self, module_name):
+        return self.env['ir.module.module'].sudo().search_count([
+            ('name', '=', module_name),
+            ('state', '=', 'installed')
+        ]) > 0
+
+
+class IrModuleModule(models.Model):
+    _inherit = 'ir.module.module'
+
+    def write(self, vals):
+        res = super(IrModuleModule, self).write(vals)
+        if 'state' in vals:
+            # Module is installed or uninstalled
+            self.env['clv_api.settings_cache'].invalidate_settings()
+        return res
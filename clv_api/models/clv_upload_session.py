@@ -0,0 +1,145 @@
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Iterable, Tuple
+
+from odoo import models, fields, api
+from odoo.release import version_info
+
+# Open sessions are removed after this time in hours
+DEFAULT_SESSION_TTL = 24
+
+
+class UploadSession(models.Model):
+    """
+    Document uploaded by the device in several requests (actual lines are sent by batches).
+    Lines are pre-aggregated on append, so the document is processed by the usual setDocument logic
+    over the grouped lines on commit.
+    """
+    _name = 'clv_api.upload_session'
+    _description = 'Cleverence document upload session'
+
+    state = fields.Selection([
+        ('open', 'Open'),
+        ('committed', 'Committed')
+    ], string="State", required=True, default='open')
+    user_id = fields.Many2one('res.users', string="User", required=True, ondelete='cascade')
+    document_type_name = fields.Char(string="Document Type")
+    document = fields.Text(string="Document Header")
+    device_info = fields.Text(string="Device Info")
+    received_line_count = fields.Integer(string="Received Lines", default=0)
+    line_ids = fields.One2many('clv_api.upload_session_line', 'session_id', string="Lines")
+
+    @api.model
+    def open_session(self, env, doc, device_info):
+        """
+        Creates upload session for the document
+        @param env: Environment of the request
+        @param doc: Inventory API document (actual lines are ignored)
+        @param device_info: Inventory API DeviceInfo
+        @return: created session
+        """
+        if doc is None:
+            raise RuntimeError('Document is null')
+
+        header = {name: value for name, value in doc.items() if name != 'actualLines'}
+        return self.sudo().create({
+            'user_id': env.uid,
+            'document_type_name': header.get('documentTypeName'),
+            'document': json.dumps(header),
+            'device_info': json.dumps(device_info)
+        })
+
+    def append_lines(self, grouped_lines: Iterable[Tuple[tuple, dict, float]], received_line_count: int) -> None:
+        """
+        Adds batch of actual lines to the session, quantities of the lines with the same group key are summed up
+        @param grouped_lines: (group key, representative line, summed quantity) of the batch
+        @param received_line_count: number of the lines in the batch before grouping
+        """
+        self.ensure_one()
+        self._check_open()
+        line_table = self.env['clv_api.upload_session_line']._table
+        for group_key, line, quantity in grouped_lines:
+            key_hash = hashlib.sha1(json.dumps(group_key, default=str).encode('utf-8')).hexdigest()
+            self.env.cr.execute(f"""
+                INSERT INTO {line_table} (session_id, group_key, line, quantity,
+                    create_date, write_date, create_uid, write_uid)
+                VALUES (%s, %s, %s, %s, (now() at time zone 'UTC'), (now() at time zone 'UTC'), %s, %s)
+                ON CONFLICT (session_id, group_key) DO UPDATE SET quantity = {line_table}.quantity + EXCLUDED.quantity
+            """, [self.id, key_hash, json.dumps(line), quantity, self.env.uid, self.env.uid])
+        self.env.cr.execute(f"""
+            UPDATE {self._table}
+            SET received_line_count = received_line_count + %s, write_date = (now() at time zone 'UTC')
+            WHERE id = %s
+        """, [received_line_count, self.id])
+        if version_info[0] >= 16:
+            self.invalidate_recordset(['received_line_count', 'write_date'])
+        else:
+            self.invalidate_cache(['received_line_count', 'write_date'], self.ids)
+
+    def get_line_count(self) -> int:
+        """
+        Returns number of the grouped lines stored in the session
+        """
+        self.ensure_one()
+        return self.env['clv_api.upload_session_line'].search_count([('session_id', '=', self.id)])
+
+    def build_document(self) -> Tuple[Any, Any]:
+        """
+        Returns the document with grouped actual lines and device info
+        """
+        self.ensure_one()
+        self._check_open()
+        doc = json.loads(self.document or '{}')
+        actual_lines = []
+        self.env.cr.execute(f"""
+            SELECT line, quantity FROM {self.env['clv_api.upload_session_line']._table}
+            WHERE session_id = %s ORDER BY id
+        """, [self.id])
+        for line, quantity in self.env.cr.fetchall():
+            line = json.loads(line)
+            line['actualQuantity'] = quantity
+            actual_lines.append(line)
+        doc['actualLines'] = actual_lines
+        return doc, json.loads(self.device_info or 'null')
+
+    def mark_committed(self) -> None:
+        """
+        Closes the session and removes its lines
+        """
+        self.ensure_one()
+        self.line_ids.unlink()
+        self.write({'state': 'committed'})
+
+    def _check_open(self) -> None:
+        if self.state != 'open':
+            raise RuntimeError('Upload session is already committed')
+
+    @api.model
+    def _cleanup(self):
+        """
+        Removes expired sessions (executed by cron)
+        """
+        try:
+            ttl = int(self.env['ir.config_parameter'].sudo().get_param('clv_api.upload_session_ttl', DEFAULT_SESSION_TTL))
+        except ValueError:
+            ttl = DEFAULT_SESSION_TTL
+        self.search([('write_date', '<', fields.Datetime.now() - timedelta(hours=ttl))]).unlink()
+
+
+class UploadSessionLine(models.Model):
+    """
+    Actual line of the upload session with quantity summed up over the lines of the same group
+    """
+    _name = 'clv_api.upload_session_line'
+    _description = 'Cleverence document upload session line'
+
+    session_id = fields.Many2one('clv_api.upload_session', string="Session", required=True, ondelete='cascade',
+                                 index=True)
+    group_key = fields.Char(string="Group Key", required=True)
+    line = fields.Text(string="Line")
+    quantity = fields.Float(string="Quantity")
+
+    _sql_constraints = [
+        ('group_key_unique', 'unique(session_id, group_key)', 'Line of the group already exists in the session'),
+    ]
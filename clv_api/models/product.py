@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api
+
+# Product fields stored in the barcode index
+BARCODE_INDEX_FIELDS = {'barcode', 'default_code', 'active', 'product_tmpl_id', 'company_id'}
+
+
+class ProductProduct(models.Model):
+    """
+    Extends product.product class to keep the barcode index up to date
+    """
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(ProductProduct, self).create(vals_list)
+        self.env['clv_api.barcode_index'].invalidate_index()
+        return res
+
+    def write(self, vals):
+        res = super(ProductProduct, self).write(vals)
+        if BARCODE_INDEX_FIELDS.intersection(vals):
+            self.env['clv_api.barcode_index'].invalidate_index()
+        return res
+
+    def unlink(self):
+        res = super(ProductProduct, self).unlink()
+        self.env['clv_api.barcode_index'].invalidate_index()
+        return res
+
+
+class ProductTemplate(models.Model):
+    """
+    Extends product.template class to keep the barcode index up to date
+    """
+    _inherit = 'product.template'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(ProductTemplate, self).create(vals_list)
+        self.env['clv_api.barcode_index'].invalidate_index()
+        return res
+
+    def write(self, vals):
+        res = super(ProductTemplate, self).write(vals)
+        if BARCODE_INDEX_FIELDS.intersection(vals):
+            self.env['clv_api.barcode_index'].invalidate_index()
+        return res
+
+    def unlink(self):
+        res = super(ProductTemplate, self).unlink()
+        self.env['clv_api.barcode_index'].invalidate_index()
+        return res
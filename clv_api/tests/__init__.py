@@ -0,0 +1,4 @@
+from . import test_document_payload_cache
+from . import test_move_line_matching_engine
+from . import test_set_document_idempotency
+from . import test_stock_taking_batching
@@ -0,0 +1,78 @@
+from odoo.release import version_info
+from odoo.tests.common import TransactionCase
+
+from ..controllers.common_utils import CommonUtils
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+class ClvApiTransactionCase(TransactionCase):
+    """
+    Common fixtures of clv_api tests: the main warehouse, products with different tracking and receipts
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.warehouse = cls.env.ref('stock.warehouse0')
+        cls.stock_location = cls.warehouse.lot_stock_id
+        cls.supplier_location = cls.env.ref('stock.stock_location_suppliers')
+        cls.product = cls._create_product('Clv Product')
+        cls.lot_product = cls._create_product('Clv Lot Product', 'lot')
+        cls.serial_product = cls._create_product('Clv Serial Product', 'serial')
+
+    @property
+    def clv_env(self) -> OdooEnvWrapper:
+        return OdooEnvWrapper(self.env, version_info[0])
+
+    @classmethod
+    def _create_product(cls, name: str, tracking: str = 'none'):
+        vals = {'name': name, 'tracking': tracking}
+        if version_info[0] >= 18:
+            vals.update({'type': 'consu', 'is_storable': True})
+        else:
+            vals['type'] = 'product'
+        return cls.env['product.product'].create(vals)
+
+    def _create_receipt(self, quantities):
+        """
+        Creates and reserves receipt of the main warehouse
+        @param quantities: list of (product, quantity)
+        """
+        picking = self.env['stock.picking'].create({
+            'picking_type_id': self.warehouse.in_type_id.id,
+            'location_id': self.supplier_location.id,
+            'location_dest_id': self.stock_location.id,
+        })
+        self.env['stock.move'].create([{
+            'name': product.name,
+            'picking_id': picking.id,
+            'product_id': product.id,
+            'product_uom': product.uom_id.id,
+            'product_uom_qty': quantity,
+            'location_id': self.supplier_location.id,
+            'location_dest_id': self.stock_location.id,
+        } for product, quantity in quantities])
+        picking.action_confirm()
+        picking.action_assign()
+        return picking
+
+    def _get_document_type(self, picking):
+        return CommonUtils().get_document_type_info_by_document(self.clv_env, picking)
+
+    def _flush(self):
+        if version_info[0] >= 16:
+            self.env.flush_all()
+        else:
+            self.env['base'].flush()
+
+    def _invalidate(self):
+        if version_info[0] >= 16:
+            self.env.invalidate_all()
+        else:
+            self.env['base'].invalidate_cache()
+
+    def _get_query_count(self) -> int:
+        count = getattr(self.env.cr, 'sql_log_count', None)
+        if count is None:
+            self.skipTest('The cursor does not count queries')
+        return count
@@ -0,0 +1,311 @@
+from typing import List, Optional
+
+from ..controllers.common_utils import CommonUtils
+from ..controllers.document_type_info import BusinessLocationType, DocumentTypeInfo
+from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+class LegacyMoveLineMatching:
+    """
+    Line-by-line processing of setDocument lines replaced by MoveLineMatchingEngine.
+    It searches and writes the odoo lines by separate queries for every actual line.
+    Kept as the reference for the equivalence tests and the query count benchmark of the engine.
+    """
+    _cutils = CommonUtils()
+
+    def __init__(self, env: OdooEnvWrapper, doc_type: DocumentTypeInfo, odoo_doc, with_locations: bool):
+        self._env = env
+        self._doc_type = doc_type
+        self._odoo_doc = odoo_doc
+        self._with_locations = with_locations
+
+    def process_lines(self, actual_lines: List[ClvDocLineWrapper]) -> None:
+        """
+        Applies actual lines in two stages, as setDocument did before the engine
+        """
+        not_processed = {}
+        for line in actual_lines:
+            if not self.process_line(line,
+                                     add_to_any_line=False,
+                                     add_new_line_if_not_declared=False,
+                                     assign_new_barcodes=True):
+                not_processed[line.uid] = line
+
+        for (line_uid, line) in not_processed.items():
+            self.process_line(line,
+                              add_to_any_line=True,
+                              add_new_line_if_not_declared=True,
+                              assign_new_barcodes=False)
+
+    def process_line(self,
+                     line: ClvDocLineWrapper,
+                     add_to_any_line: bool,
+                     add_new_line_if_not_declared: bool,
+                     assign_new_barcodes: bool) -> bool:
+        env = self._env
+        doc_type = self._doc_type
+        odoo_doc = self._odoo_doc
+        with_locations = self._with_locations
+
+        if line.actual_quantity == 0:
+            return False
+
+        odoo_product = env['product.product'].search([('id', '=', int(line.inventory_item_id))])
+        if not odoo_product:
+            raise RuntimeError("Product with id='{}' not found".format(line.inventory_item_id))
+
+        if assign_new_barcodes:
+            self._assign_line_barcode_to_odoo_product(odoo_product, line)
+
+        with_serial = odoo_product.product_tmpl_id.tracking == 'serial'
+        if with_serial and not line.serial_number:
+            if doc_type.generate_fake_serial_if_empty and env.w15_settings.scan_serials_on_allocation:
+                line.serial_number = CommonUtils.create_random_fake_serial_number()
+            else:
+                raise RuntimeError('No serial number specified to serial tracking odoo product.')
+
+        with_series = odoo_product.product_tmpl_id.tracking == 'lot'
+        if with_series and not line.series_name:
+            raise RuntimeError('No series specified to the line with series tracking')
+
+        # Trying to find an exactly matching line
+
+        exactly_matching_line_filter = [
+            ('picking_id', '=', odoo_doc.id),
+            ('product_id', '=', odoo_product.id),
+            ('picked', '=', False)
+        ]
+
+        if with_serial:
+            sn = line.serial_number
+            exactly_matching_line_filter.append('|')
+            exactly_matching_line_filter.append(('lot_name', '=', sn))
+            exactly_matching_line_filter.append(('lot_id.name', '=', sn))
+        elif with_series:
+            lot = line.series_name
+            exactly_matching_line_filter.append('|')
+            exactly_matching_line_filter.append(('lot_name', '=', lot))
+            exactly_matching_line_filter.append(('lot_id.name', '=', lot))
+
+        if with_locations:
+            if doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
+                exactly_matching_line_filter.append(('location_dest_id', '=', line.to_location_id))
+            elif doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
+                exactly_matching_line_filter.append(('location_id', '=', line.from_location_id))
+
+        found_lines = env['stock.move.line'].search(exactly_matching_line_filter)
+        if found_lines and len(found_lines) == 1:
+            exact_line = found_lines[0]
+            if self._get_quantity_done(exact_line) >= self._get_product_uom_qty(exact_line):
+                return True
+
+        if not found_lines and (with_serial or with_series):
+            # Trying to find lines with lot not specified
+            lot_not_specified_line_filter = [
+                ('picking_id', '=', odoo_doc.id),
+                ('product_id', '=', odoo_product.id),
+                ('lot_id', '=', False),
+                '|',
+                ('lot_name', '=', False),
+                ('lot_name', '=', ''),
+                ('picked', '=', False)
+            ]
+            found_lines = env['stock.move.line'].search(lot_not_specified_line_filter)
+
+            # Trying to fine lines with any lot and with zero qty done to replace lot
+            if not found_lines and add_to_any_line:
+                any_zero_qty_line_filter = [
+                    ('picking_id', '=', odoo_doc.id),
+                    ('product_id', '=', odoo_product.id),
+                    '|',
+                    (self._get_quantity_done_name(), '=', 0),
+                    ('picked', '=', False)
+                ]
+                found_lines = env['stock.move.line'].search(any_zero_qty_line_filter)
+        elif not found_lines:
+            if self._has_valid_bound_move_line(line):
+                found_lines = env['stock.move.line'].search([
+                    ('picking_id', '=', odoo_doc.id),
+                    ('product_id', '=', odoo_product.id),
+                    ('move_id', '=', int(line.bound_document_line_uid))
+                ])
+
+            # Trying to find any containing product line
+            if not found_lines and add_to_any_line:
+                found_lines = env['stock.move.line'].search([
+                    ('picking_id', '=', odoo_doc.id),
+                    ('product_id', '=', odoo_product.id)
+                ])
+
+        # distribute quantity per lines
+        while line.actual_quantity > 0:
+            if found_lines:
+                found_lines = found_lines.filtered(
+                    lambda odoo_line: self._get_product_uom_qty(odoo_line) > self._get_quantity_done(odoo_line)
+                )
+
+            if found_lines and with_locations:
+                location_id = False
+                if doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
+                    location_id = line.to_location_id
+                elif doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
+                    location_id = line.from_location_id
+
+                found_lines = found_lines.filtered(
+                    lambda odoo_line: self._get_odoo_line_location_id(odoo_line) == location_id
+                )
+
+            if not found_lines:
+                if not add_new_line_if_not_declared:
+                    return False
+                self._add_new_move_line(odoo_product, line)
+                break
+
+            found_line = found_lines[0]
+            less_qty = self._get_product_uom_qty(found_line) - self._get_quantity_done(found_line)
+            add_qty = min(less_qty, line.actual_quantity)
+
+            updating_dict = {
+                self._get_quantity_done_name(): self._get_quantity_done(found_line) + add_qty,
+                'picked': True,
+                'company_id': odoo_doc.company_id.id
+            }
+
+            if with_serial and \
+                    found_line.lot_name != line.serial_number and \
+                    found_line.lot_id.name != line.serial_number:
+                self._process_fake_serial_number_in_lot_storage(found_line, line)
+                self._set_lot_id_or_name_to_update_dict(updating_dict, line.serial_number, odoo_product.id)
+            elif with_series and \
+                    found_line.lot_name != line.series_name and \
+                    found_line.lot_id.name != line.series_name:
+                self._set_lot_id_or_name_to_update_dict(updating_dict, line.series_name, odoo_product.id)
+
+            if with_locations:
+                self._add_line_location_to_line_update_dict(line, updating_dict)
+
+            found_line.write(updating_dict)
+            line.actual_quantity = line.actual_quantity - add_qty
+
+            if with_serial \
+                    and line.actual_quantity > 0 \
+                    and CommonUtils.is_fake_serial_number(line.serial_number):
+                line.serial_number = CommonUtils.create_random_fake_serial_number()
+
+        return True
+
+    def _set_lot_id_or_name_to_update_dict(self, update_dict, new_lot: str, product_id: Optional[int] = None):
+        domain_filter = [('name', '=', new_lot)]
+        if product_id:
+            domain_filter.append(('product_id', '=', product_id))
+        if update_dict.get('company_id'):
+            domain_filter.extend(['|', ('company_id', '=', update_dict.get('company_id')), ('company_id', '=', False)])
+        found_lot = self._env.lots.search(domain_filter)
+        if found_lot:
+            update_dict['lot_id'] = found_lot[0].id
+        else:
+            update_dict['lot_id'] = self._env.lots.create({
+                'product_id': product_id,
+                'name': new_lot,
+                'company_id': update_dict.get('company_id') or False
+            }).id
+        update_dict['lot_name'] = None
+
+    def _process_fake_serial_number_in_lot_storage(self, odoo_line, line: ClvDocLineWrapper):
+        if not self._doc_type.can_overwrite_fake_serial_numbers:
+            return
+
+        new_serial = line.serial_number
+        if not new_serial or not odoo_line.lot_id or not CommonUtils.is_fake_serial_number(odoo_line.lot_id.name):
+            return
+
+        odoo_line.lot_id.update({'name': new_serial})
+
+    def _add_line_location_to_line_update_dict(self, line: ClvDocLineWrapper, update_dict):
+        line_storage_id = False
+        if self._doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
+            line_storage_id = line.to_location_id
+        elif self._doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
+            line_storage_id = line.from_location_id
+
+        if not line_storage_id:
+            return
+
+        line_location = self._env['stock.location'].search([('id', '=', int(line_storage_id))])
+        if not line_location:
+            return
+        line_location = line_location[0]
+
+        doc_location = self._cutils.get_doc_main_location(self._env, self._odoo_doc)
+
+        # Verify if line's first storage id corresponds to the document location
+
+        if not line_location.parent_path.startswith(doc_location.parent_path):
+            raise RuntimeError('Document location=%s does not contain line location=%s',
+                               doc_location.parent_path, line_location.parent_path)
+
+        if self._doc_type.main_location_type == BusinessLocationType.DEST:
+            update_dict['location_dest_id'] = line_location.id
+        else:
+            update_dict['location_id'] = line_location.id
+
+    def _get_odoo_line_location_id(self, odoo_line):
+        if self._doc_type.main_location_type == BusinessLocationType.DEST:
+            return odoo_line.location_dest_id.id
+        return odoo_line.location_id.id
+
+    # noinspection PyMethodMayBeStatic
+    def _assign_line_barcode_to_odoo_product(self, odoo_product, line: ClvDocLineWrapper):
+        barcode = line.barcode
+        if not barcode:
+            return
+        if odoo_product.barcode:
+            if odoo_product.barcode != barcode:
+                raise RuntimeError('Can not assign new barcode value to the product.')
+            return
+        odoo_product.write({'barcode': barcode})
+
+    def _add_new_move_line(self, odoo_product, line: ClvDocLineWrapper):
+        odoo_doc = self._odoo_doc
+        new_item = {
+            'picking_id': odoo_doc.id,
+            'product_id': odoo_product.id,
+            'product_uom_id': odoo_product.uom_id.id,
+            'location_id': odoo_doc.location_id.id,
+            'location_dest_id': odoo_doc.location_dest_id.id,
+            'picked': True,
+            self._get_quantity_done_name(): line.actual_quantity,
+            'company_id': odoo_doc.company_id.id
+        }
+        if self._has_valid_bound_move_line(line):
+            new_item['move_id'] = int(line.bound_document_line_uid)
+        if odoo_product.product_tmpl_id.tracking == 'serial' and line.serial_number:
+            self._set_lot_id_or_name_to_update_dict(new_item, line.serial_number, odoo_product.id)
+        elif odoo_product.product_tmpl_id.tracking == 'lot' and line.series_name:
+            self._set_lot_id_or_name_to_update_dict(new_item, line.series_name, odoo_product.id)
+        self._add_line_location_to_line_update_dict(line, new_item)
+        odoo_doc.move_line_ids_without_package.create(new_item)
+
+    # noinspection PyMethodMayBeStatic
+    def _has_valid_bound_move_line(self, line: ClvDocLineWrapper) -> bool:
+        return line.bound_document_line_uid.isdigit()
+
+    def _get_quantity_done(self, odoo_line):
+        if self._env.odoo_version >= 17:
+            if odoo_line.picked:
+                return odoo_line.quantity
+            return 0
+        return odoo_line.qty_done
+
+    def _get_quantity_done_name(self):
+        if self._env.odoo_version >= 17:
+            return 'quantity'
+        return 'qty_done'
+
+    def _get_product_uom_qty(self, odoo_line):
+        if self._env.odoo_version >= 17:
+            return odoo_line.quantity_product_uom
+        if self._env.odoo_version >= 16:
+            return odoo_line.reserved_uom_qty
+        return odoo_line.product_uom_qty
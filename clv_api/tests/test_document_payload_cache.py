@@ -0,0 +1,111 @@
+import uuid
+from unittest.mock import patch
+
+from odoo.tests.common import tagged
+
+from .common import ClvApiTransactionCase
+from ..controllers import documents_stock_picking_base
+from ..controllers.common_utils import CommonUtils
+from ..controllers.documents_receiving import DocumentReceivingImpl
+from ..utils.document_payload_cache import DocumentPayloadCache
+
+
+@tagged('post_install', '-at_install')
+class TestDocumentPayloadCache(ClvApiTransactionCase):
+    """
+    Checks the versioning of cached getDocument payloads
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.receiving = DocumentReceivingImpl()
+        self.picking = self._create_receipt([(self.product, 5), (self.lot_product, 3)])
+        self._flush()
+
+    def _get_version(self):
+        self._flush()
+        return DocumentPayloadCache.make_version(
+            self.receiving._get_document_version_rows(self.clv_env, self.picking))
+
+    def _backdate(self, records):
+        """
+        All modifications of the test transaction have the same write date,
+        so the modified records are moved to the past to make the following modification visible
+        """
+        self._flush()
+        self.env.cr.execute(f"UPDATE {records._table} SET write_date = write_date - interval '1 day' "
+                            f"WHERE id IN %s", [tuple(records.ids)])
+        self._invalidate()
+
+    def _get_document(self):
+        return self.receiving.get_document(self.clv_env, 'byCode',
+                                           CommonUtils.encode_stock_picking_id(self.picking.id), 'Receiving')
+
+    def test_version_tracks_payload_records(self):
+        lot = self.clv_env.lots.create({'name': 'CLV-CACHE-LOT', 'product_id': self.lot_product.id,
+                                        'company_id': self.picking.company_id.id})
+        self.picking.move_line_ids.filtered(lambda line: line.product_id == self.lot_product).write({
+            'lot_id': lot.id
+        })
+        modifications = [
+            (self.product.product_tmpl_id, {'name': 'Clv Renamed Template'}),
+            (self.product.uom_id, {'name': 'Clv Renamed Unit'}),
+            (lot, {'name': 'CLV-CACHE-LOT-2'}),
+            (self.picking.picking_type_id, {'name': 'Clv Renamed Receipts'}),
+            (self.stock_location, {'name': 'Clv Renamed Stock'}),
+        ]
+        for records, vals in modifications:
+            self._backdate(records)
+            version = self._get_version()
+            self.assertEqual(self._get_version(), version)
+            records.write(vals)
+            self.assertNotEqual(self._get_version(), version, records._name)
+
+    def test_get_or_build_builds_once_per_version(self):
+        builds = []
+
+        def build():
+            builds.append(True)
+            return {'name': 'Clv Document', 'lines': [1, 2]}
+
+        version = DocumentPayloadCache.make_version(uuid.uuid4().hex)
+        first = DocumentPayloadCache.get_or_build(self.clv_env, self.picking.id, version, build)
+        first['name'] = 'Modified by hook'
+        second = DocumentPayloadCache.get_or_build(self.clv_env, self.picking.id, version, build)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(second['name'], 'Clv Document')
+
+        DocumentPayloadCache.get_or_build(self.clv_env, self.picking.id,
+                                          DocumentPayloadCache.make_version(uuid.uuid4().hex), build)
+        self.assertEqual(len(builds), 2)
+
+    def test_hook_runs_on_cached_payload(self):
+        build_document = DocumentReceivingImpl._build_document
+        with patch.object(DocumentReceivingImpl, '_build_document', autospec=True,
+                          side_effect=build_document) as build, \
+                patch.object(documents_stock_picking_base, 'after_get_document',
+                             side_effect=lambda env, context, doc: doc) as hook:
+            first = self._get_document()['document']
+            second = self._get_document()['document']
+            self.assertEqual(second, first)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(hook.call_count, 2)
+
+            self._backdate(self.product.product_tmpl_id)
+            self._get_document()
+            self.product.product_tmpl_id.write({'name': 'Clv Renamed Template'})
+            self._flush()
+            renamed = self._get_document()['document']
+            self.assertEqual(build.call_count, 3)
+            self.assertNotEqual(renamed, first)
+
+    def test_version_rows_computed_once_per_request(self):
+        env = self.clv_env
+        search_code = CommonUtils.encode_stock_picking_id(self.picking.id)
+        version_rows = DocumentReceivingImpl._get_document_version_rows
+        with patch.object(DocumentReceivingImpl, '_get_document_version_rows', autospec=True,
+                          side_effect=version_rows) as get_version_rows:
+            fingerprint = self.receiving.get_document_fingerprint(env, 'byCode', search_code, 'Receiving')
+            self.receiving.get_document(env, 'byCode', search_code, 'Receiving')
+            self.assertEqual(get_version_rows.call_count, 1)
+            self.assertEqual(fingerprint, version_rows(self.receiving, env, self.picking))
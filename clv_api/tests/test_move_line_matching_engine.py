@@ -0,0 +1,203 @@
+import copy
+import logging
+from unittest import skipIf
+
+from odoo.release import version_info
+from odoo.tests.common import tagged
+
+from .common import ClvApiTransactionCase
+from .legacy_move_line_matching import LegacyMoveLineMatching
+from ..controllers.documents_receiving import DocumentReceivingImpl
+from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
+
+_logger = logging.getLogger(__name__)
+
+# Number of products in the picking of the query count benchmark
+BENCHMARK_LINES = 30
+
+
+@tagged('post_install', '-at_install')
+@skipIf(version_info[0] < 17, "The reference line-by-line processing requires 'picked' field of Odoo 17+")
+class TestMoveLineMatchingEngine(ClvApiTransactionCase):
+    """
+    Compares results and query counts of MoveLineMatchingEngine with the former line-by-line processing.
+    Each case builds two equal receipts, applies the same actual lines to them by both implementations
+    and compares the resulting move lines.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shelf_location = cls.env['stock.location'].create({
+            'name': 'Clv Shelf',
+            'location_id': cls.stock_location.id,
+            'usage': 'internal',
+        })
+
+    def _make_line(self, uid, product, quantity, **values):
+        line = {
+            'uid': uid,
+            'inventoryItemId': str(product.id),
+            'unitOfMeasureId': str(product.uom_id.id),
+            'actualQuantity': quantity,
+        }
+        line.update(values)
+        return line
+
+    def _apply_legacy(self, picking, lines, with_locations=False):
+        LegacyMoveLineMatching(self.clv_env, self._get_document_type(picking), picking, with_locations) \
+            .process_lines([ClvDocLineWrapper(line) for line in copy.deepcopy(lines)])
+        self._flush()
+
+    def _apply_engine(self, picking, lines, with_locations=False):
+        DocumentReceivingImpl()._process_actual_lines(
+            self.clv_env, self._get_document_type(picking), picking,
+            [ClvDocLineWrapper(line) for line in copy.deepcopy(lines)], with_locations)
+        self._flush()
+
+    def _get_move_lines_snapshot(self, picking):
+        self._invalidate()
+        return sorted(
+            (move_line.product_id.id,
+             move_line.move_id.product_id.id,
+             move_line.lot_id.name or move_line.lot_name or '',
+             move_line.quantity,
+             move_line.picked,
+             move_line.location_id.id,
+             move_line.location_dest_id.id)
+            for move_line in picking.move_line_ids
+        )
+
+    def _split_move_line(self, picking, product, quantity):
+        """
+        Moves the quantity of the product move line to the new line of the same move
+        """
+        move_line = picking.move_line_ids.filtered(lambda line: line.product_id == product)
+        move_line.write({'quantity': move_line.quantity - quantity})
+        self.env['stock.move.line'].create({
+            'move_id': move_line.move_id.id,
+            'picking_id': picking.id,
+            'product_id': product.id,
+            'product_uom_id': move_line.product_uom_id.id,
+            'location_id': move_line.location_id.id,
+            'location_dest_id': move_line.location_dest_id.id,
+            'quantity': quantity,
+        })
+
+    def _assert_equivalent(self, quantities, make_lines, with_locations=False, prepare=None):
+        legacy_picking = self._create_receipt(quantities)
+        engine_picking = self._create_receipt(quantities)
+        if prepare:
+            prepare(legacy_picking)
+            prepare(engine_picking)
+        self._apply_legacy(legacy_picking, make_lines(legacy_picking), with_locations)
+        self._apply_engine(engine_picking, make_lines(engine_picking), with_locations)
+        legacy_snapshot = self._get_move_lines_snapshot(legacy_picking)
+        self.assertEqual(self._get_move_lines_snapshot(engine_picking), legacy_snapshot)
+        return legacy_snapshot
+
+    def test_untracked_partial_and_over_quantities(self):
+        def make_lines(picking):
+            return [
+                self._make_line('1', self.product, 4),
+                self._make_line('2', self.product, 4),
+                self._make_line('3', self.product, 5),
+            ]
+
+        snapshot = self._assert_equivalent([(self.product, 10)], make_lines)
+        self.assertEqual(sum(row[3] for row in snapshot), 13)
+
+    def test_bound_lines(self):
+        def make_lines(picking):
+            move = picking.move_ids.filtered(lambda m: m.product_id == self.product)
+            return [
+                self._make_line('1', self.product, 3, bindedDocumentLineUid=str(move.id)),
+                self._make_line('2', self.product, 3, bindedDocumentLineUid=str(move.id)),
+            ]
+
+        self._assert_equivalent([(self.product, 5)], make_lines)
+
+    def test_lots(self):
+        def make_lines(picking):
+            return [
+                self._make_line('1', self.lot_product, 5, seriesName='CLV-LOT-1'),
+                self._make_line('2', self.lot_product, 3, seriesName='CLV-LOT-2'),
+                self._make_line('3', self.lot_product, 2, seriesName='CLV-LOT-1'),
+            ]
+
+        snapshot = self._assert_equivalent([(self.lot_product, 8)], make_lines)
+        self.assertEqual({row[2] for row in snapshot}, {'CLV-LOT-1', 'CLV-LOT-2'})
+
+    def test_new_lot_fills_several_lines(self):
+        def prepare(picking):
+            self._split_move_line(picking, self.lot_product, 4)
+
+        def make_lines(picking):
+            return [self._make_line('1', self.lot_product, 7, seriesName='CLV-LOT-SPLIT')]
+
+        snapshot = self._assert_equivalent([(self.lot_product, 7)], make_lines, prepare=prepare)
+        self.assertEqual([(row[2], row[3]) for row in snapshot], [('CLV-LOT-SPLIT', 3), ('CLV-LOT-SPLIT', 4)])
+
+    def test_serials(self):
+        def make_lines(picking):
+            return [
+                self._make_line(str(index), self.serial_product, 1, serialNumber='CLV-SN-%d' % index)
+                for index in range(4)
+            ]
+
+        self._assert_equivalent([(self.serial_product, 3)], make_lines)
+
+    def test_mixed_products(self):
+        def make_lines(picking):
+            return [
+                self._make_line('1', self.product, 2),
+                self._make_line('2', self.lot_product, 4, seriesName='CLV-LOT-3'),
+                self._make_line('3', self.serial_product, 1, serialNumber='CLV-SN-10'),
+                self._make_line('4', self.product, 6),
+                self._make_line('5', self.serial_product, 1, serialNumber='CLV-SN-11'),
+            ]
+
+        self._assert_equivalent([(self.product, 5), (self.lot_product, 4), (self.serial_product, 2)], make_lines)
+
+    def test_locations(self):
+        def make_lines(picking):
+            return [
+                self._make_line('1', self.product, 2, firstStorageId=str(self.shelf_location.id)),
+                self._make_line('2', self.product, 3, firstStorageId=str(self.stock_location.id)),
+                self._make_line('3', self.product, 4, firstStorageId=str(self.shelf_location.id)),
+            ]
+
+        self._assert_equivalent([(self.product, 6)], make_lines, with_locations=True)
+
+    def test_query_count_per_line(self):
+        """
+        Benchmark: queries per actual line of the engine and of the line-by-line processing
+        on the receipt of BENCHMARK_LINES products
+        """
+        products = [self._create_product('Clv Benchmark %d' % index) for index in range(BENCHMARK_LINES)]
+        quantities = [(product, 5) for product in products]
+        lines = [self._make_line(str(index), product, 5) for index, product in enumerate(products)]
+
+        legacy_picking = self._create_receipt(quantities)
+        engine_picking = self._create_receipt(quantities)
+        self._flush()
+        self._invalidate()
+
+        queries_before = self._get_query_count()
+        self._apply_legacy(legacy_picking, lines)
+        legacy_queries = self._get_query_count() - queries_before
+
+        self._invalidate()
+        queries_before = self._get_query_count()
+        self._apply_engine(engine_picking, lines)
+        engine_queries = self._get_query_count() - queries_before
+
+        _logger.info('setDocument matching of %d lines: line-by-line %d queries (%.2f per line), '
+                     'engine %d queries (%.2f per line)',
+                     len(lines),
+                     legacy_queries, legacy_queries / len(lines),
+                     engine_queries, engine_queries / len(lines))
+
+        self.assertEqual(self._get_move_lines_snapshot(engine_picking),
+                         self._get_move_lines_snapshot(legacy_picking))
+        self.assertLess(engine_queries, legacy_queries)
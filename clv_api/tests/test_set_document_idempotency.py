@@ -0,0 +1,82 @@
+import uuid
+
+from odoo.release import version_info
+from odoo.tests.common import tagged
+
+from .common import ClvApiTransactionCase
+from ..controllers.documents import DocumentImpl
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+@tagged('post_install', '-at_install')
+class TestSetDocumentIdempotency(ClvApiTransactionCase):
+    """
+    Checks that repeated setDocument requests return the stored result instead of processing the document again
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.documents = DocumentImpl()
+        self.calls = 0
+
+    def _process(self):
+        self.calls += 1
+        return {'call': self.calls}
+
+    def _make_doc(self, quantity):
+        return {
+            'id': 'clv_sp_1',
+            'documentTypeName': 'Receiving',
+            'actualLines': [{'uid': '1', 'inventoryItemId': str(self.product.id), 'actualQuantity': quantity}]
+        }
+
+    def test_replay_returns_stored_result(self):
+        key = 'clv-test:' + uuid.uuid4().hex
+
+        first = self.documents.process_idempotent(self.clv_env, key, self._process)
+        second = self.documents.process_idempotent(self.clv_env, key, self._process)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first, {'call': 1})
+        self.assertEqual(second, first)
+
+    def test_no_key_processes_every_request(self):
+        self.documents.process_idempotent(self.clv_env, None, self._process)
+        self.documents.process_idempotent(self.clv_env, None, self._process)
+
+        self.assertEqual(self.calls, 2)
+
+    def test_expired_result_is_processed_again(self):
+        key = 'clv-test:' + uuid.uuid4().hex
+        self.documents.process_idempotent(self.clv_env, key, self._process)
+
+        results = self.env['clv_api.set_document_result']
+        self.env.cr.execute(f"UPDATE {results._table} SET create_date = create_date - interval '1 year' "
+                            f"WHERE key = %s", [key])
+        result = self.documents.process_idempotent(self.clv_env, key, self._process)
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(result, {'call': 2})
+
+    def test_keys_are_scoped_by_user(self):
+        user_env = OdooEnvWrapper(self.env(user=self.env.ref('base.user_admin')), version_info[0])
+        doc = self._make_doc(1)
+        device_info = {'deviceId': 'clv-test-device'}
+
+        self.assertNotEqual(
+            self.documents.get_idempotency_key(self.clv_env, doc, device_info, 'client-key', False),
+            self.documents.get_idempotency_key(user_env, doc, device_info, 'client-key', False))
+        self.assertNotEqual(
+            self.documents.get_idempotency_key(self.clv_env, doc, device_info, None, False),
+            self.documents.get_idempotency_key(user_env, doc, device_info, None, False))
+
+    def test_key_depends_on_payload_and_mode(self):
+        device_info = {'deviceId': 'clv-test-device'}
+        key = self.documents.get_idempotency_key(self.clv_env, self._make_doc(1), device_info, None, False)
+
+        self.assertEqual(
+            self.documents.get_idempotency_key(self.clv_env, self._make_doc(1), device_info, None, False), key)
+        self.assertNotEqual(
+            self.documents.get_idempotency_key(self.clv_env, self._make_doc(2), device_info, None, False), key)
+        self.assertNotEqual(
+            self.documents.get_idempotency_key(self.clv_env, self._make_doc(1), device_info, None, True), key)
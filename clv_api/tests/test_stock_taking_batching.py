@@ -0,0 +1,94 @@
+from odoo.tests.common import tagged
+
+from .common import ClvApiTransactionCase
+from ..controllers.common_utils import CommonUtils
+from ..controllers.documents_stock_taking import DocumentStockTakingImpl
+
+
+@tagged('post_install', '-at_install')
+class TestStockTakingBatching(ClvApiTransactionCase):
+    """
+    Checks the counted quantities saved by the batched processing of stock taking documents
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.stock_taking = DocumentStockTakingImpl()
+        self.device_info = {'deviceId': 'clv-test-device', 'userId': 'clv-test-user'}
+
+    def _make_doc(self, lines, **values):
+        doc = {
+            'id': CommonUtils.encode_stock_taking_id(self.warehouse.id),
+            'documentTypeName': 'StockTaking',
+            'warehouseId': CommonUtils.convert_warehouse_id_from_odoo_to_clv(self.warehouse.id),
+            'actualLines': lines,
+        }
+        doc.update(values)
+        return doc
+
+    def _make_line(self, uid, product, quantity, **values):
+        line = {
+            'uid': uid,
+            'inventoryItemId': str(product.id),
+            'unitOfMeasureId': str(product.uom_id.id),
+            'actualQuantity': quantity,
+        }
+        line.update(values)
+        return line
+
+    def _get_quants(self, product):
+        return self.env['stock.quant'].search([('product_id', '=', product.id),
+                                               ('location_id', '=', self.stock_location.id)])
+
+    def test_lines_of_the_same_quant_are_summed(self):
+        self.env['stock.quant']._update_available_quantity(self.product, self.stock_location, 10)
+
+        self.stock_taking.set_document(self.clv_env, self._make_doc([
+            self._make_line('1', self.product, 3),
+            self._make_line('2', self.product, 4),
+        ], rewriteCounted=True), self.device_info)
+
+        quant = self._get_quants(self.product)
+        self.assertEqual(len(quant), 1)
+        self.assertEqual(quant.inventory_quantity, 7)
+        self.assertTrue(quant.inventory_quantity_set)
+        self.assertEqual(quant.quantity, 10)
+
+    def test_counted_quantity_is_accumulated(self):
+        self.env['stock.quant']._update_available_quantity(self.product, self.stock_location, 10)
+        self._get_quants(self.product).with_context(inventory_mode=True).write({
+            'inventory_quantity': 2,
+            'inventory_quantity_set': True
+        })
+
+        self.stock_taking.set_document(self.clv_env, self._make_doc([
+            self._make_line('1', self.product, 3),
+        ], rewriteCounted=False), self.device_info)
+
+        self.assertEqual(self._get_quants(self.product).inventory_quantity, 5)
+
+    def test_new_lots_and_quants(self):
+        self.stock_taking.set_document(self.clv_env, self._make_doc([
+            self._make_line('1', self.lot_product, 5, seriesName='CLV-ST-LOT-1'),
+            self._make_line('2', self.lot_product, 2, seriesName='CLV-ST-LOT-2'),
+            self._make_line('3', self.lot_product, 1, seriesName='CLV-ST-LOT-1'),
+        ], rewriteCounted=True), self.device_info)
+
+        lots = self.clv_env.lots.search([('product_id', '=', self.lot_product.id)])
+        self.assertEqual(sorted(lots.mapped('name')), ['CLV-ST-LOT-1', 'CLV-ST-LOT-2'])
+        quantities = {quant.lot_id.name: quant.inventory_quantity for quant in self._get_quants(self.lot_product)}
+        self.assertEqual(quantities, {'CLV-ST-LOT-1': 6, 'CLV-ST-LOT-2': 2})
+
+    def test_many_products_applied(self):
+        products = [self._create_product('Clv Stock Taking %d' % index) for index in range(20)]
+        for index, product in enumerate(products):
+            self.env['stock.quant']._update_available_quantity(product, self.stock_location, 10)
+
+        self.stock_taking.set_document(self.clv_env, self._make_doc([
+            self._make_line(str(index), product, index + 1) for index, product in enumerate(products)
+        ], rewriteCounted=True, autoApplyInventoryAdjustment=True), self.device_info)
+
+        for index, product in enumerate(products):
+            quant = self._get_quants(product)
+            self.assertEqual(quant.quantity, index + 1, product.name)
+            self.assertFalse(quant.inventory_quantity_set, product.name)
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from typing import Optional
+
+
+class ContinuationToken:
+    """
+    Opaque token of the keyset (cursor) pagination.
+    It contains the sort key of the last returned record, the next page starts right after it.
+    """
+
+    @staticmethod
+    def encode(cursor: Optional[dict]) -> str:
+        """
+        Converts sort key of the last returned record to the token
+        @param cursor: dictionary of sort key values (None if there are no more records)
+        @return: token string (empty string if there are no more records)
+        """
+        if not cursor:
+            return ''
+        data = json.dumps(cursor, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    @staticmethod
+    def decode(token: Optional[str]) -> Optional[dict]:
+        """
+        Converts token to the sort key of the last returned record
+        @raise RuntimeError: If the token is malformed
+        @param token: token string, empty string requests the first page
+        @return: dictionary of sort key values (empty dictionary for the first page), None if token is not passed
+        """
+        if token is None:
+            return None
+        if token == '':
+            return {}
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise RuntimeError("Invalid continuation token '{}'".format(token))
+        if not isinstance(cursor, dict):
+            raise RuntimeError("Invalid continuation token '{}'".format(token))
+        return cursor
+
+    @staticmethod
+    def apply_id_cursor(domain_filter: list, cursor: Optional[dict], key: str = 'id', descending: bool = False) -> list:
+        """
+        Adds the keyset predicate by record id to the domain filter
+        @param domain_filter: search domain ordered by id
+        @param cursor: decoded continuation token (None for offset pagination)
+        @param key: name of the cursor value
+        @param descending: records are ordered by id descending
+        @return: new domain filter
+        """
+        if not cursor or cursor.get(key) is None:
+            return domain_filter
+        return domain_filter + [('id', '<' if descending else '>', int(cursor[key]))]
+
+    @staticmethod
+    def get_next_id_cursor(records, limit, cursor: Optional[dict], key: str = 'id') -> Optional[dict]:
+        """
+        Returns the cursor of the next page for records ordered by id (None if it is the last page)
+        @param records: records of the returned page
+        @param limit: the maximum number of records in the page
+        @param cursor: decoded continuation token of the returned page (None for offset pagination)
+        @param key: name of the cursor value
+        """
+        if cursor is None or not limit or len(records) < limit:
+            return None
+        return {key: records[-1].id}
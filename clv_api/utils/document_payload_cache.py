@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from odoo.tools import json_default
+
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+# Default total size of the cached documents in one worker process
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class DocumentPayloadCache:
+    """
+    Cache of assembled getDocument payloads keyed by picking id and version.
+    The version changes with any change of the document records or settings, so entries are never invalidated,
+    the outdated ones are evicted as least recently used.
+    The first tier is the LRU of the worker process bounded by total size,
+    the optional second tier is shared by all workers ('clv_api.document_payload' model).
+    Payloads are stored as JSON text, so every hit returns a new object which can be modified by the custom hooks.
+    """
+    _logger = logging.getLogger(__name__)
+    _lock = threading.Lock()
+    _entries: 'OrderedDict[tuple, str]' = OrderedDict()
+    _size = 0
+
+    @staticmethod
+    def make_version(*values: Any) -> str:
+        """
+        Returns version string of the document built from json-serializable values
+        """
+        data = json.dumps(values, default=json_default, sort_keys=True).encode('utf-8')
+        return hashlib.sha1(data).hexdigest()
+
+    @classmethod
+    def get_or_build(cls, env: OdooEnvWrapper, picking_id: int, version: str, build: Callable[[], dict]) -> dict:
+        """
+        Returns cached payload of the document or builds and caches it
+        @param env: Environment
+        @param picking_id: id of the document
+        @param version: version of the document returned by make_version
+        @param build: function without arguments building the payload
+        """
+        key = (env.cr.dbname, picking_id, version)
+        data = cls._get_local(key)
+        if data is None:
+            shared = cls._is_shared_tier_enabled(env)
+            if shared:
+                data = env['clv_api.document_payload'].sudo().get_payload(picking_id, version)
+            if data is None:
+                data = json.dumps(build(), default=json_default)
+                if shared:
+                    cls._store_shared(env, picking_id, version, data)
+            cls._put_local(key, data, cls._get_max_bytes(env))
+        return json.loads(data)
+
+    @classmethod
+    def _get_local(cls, key: tuple) -> Optional[str]:
+        with cls._lock:
+            data = cls._entries.get(key)
+            if data is not None:
+                cls._entries.move_to_end(key)
+            return data
+
+    @classmethod
+    def _put_local(cls, key: tuple, data: str, max_bytes: int) -> None:
+        if len(data) > max_bytes:
+            return
+        with cls._lock:
+            previous = cls._entries.pop(key, None)
+            if previous is not None:
+                cls._size -= len(previous)
+            cls._entries[key] = data
+            cls._size += len(data)
+            while cls._size > max_bytes and cls._entries:
+                _, evicted = cls._entries.popitem(last=False)
+                cls._size -= len(evicted)
+
+    @classmethod
+    def _store_shared(cls, env: OdooEnvWrapper, picking_id: int, version: str, data: str) -> None:
+        # Separate transaction: concurrent requests of the same document must not fail the request transaction
+        try:
+            with env.registry.cursor() as cr:
+                env['clv_api.document_payload'].with_env(env(cr=cr)).sudo().store_payload(picking_id, version, data)
+        except Exception:
+            cls._logger.warning('Failed to store document %s in the shared cache', picking_id, exc_info=True)
+
+    @staticmethod
+    def _is_shared_tier_enabled(env: OdooEnvWrapper) -> bool:
+        value = env['ir.config_parameter'].sudo().get_param('clv_api.document_cache_shared')
+        return (value or '').lower() == 'true'
+
+    @staticmethod
+    def _get_max_bytes(env: OdooEnvWrapper) -> int:
+        try:
+            return int(env['ir.config_parameter'].sudo().get_param('clv_api.document_cache_max_bytes',
+                                                                   DEFAULT_MAX_BYTES))
+        except ValueError:
+            return DEFAULT_MAX_BYTES
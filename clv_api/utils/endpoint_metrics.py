@@ -0,0 +1,180 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .request_memo import RequestMemo
+
+# Upper bounds (in seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class EndpointMetrics:
+    """
+    In-process (per worker) metrics of Inventory API endpoints by route and table or document type:
+    request and error count, latency histogram, SQL query count and time, response size,
+    hits and misses of the request memo.
+    The lock is held only to add the values of the finished request.
+    """
+    _lock = threading.Lock()
+    _series: Dict[tuple, dict] = {}
+    _last_flush = 0.0
+
+    @staticmethod
+    def start(route: str, kind: str) -> dict:
+        """
+        Starts measurement of the request
+        @param route: path of the endpoint
+        @param kind: table name or document type name ('' if not applicable)
+        @return: measurement passed to 'finish'
+        """
+        thread = threading.current_thread()
+        memo_hits, memo_misses = RequestMemo.get_thread_counts()
+        return {
+            'route': route,
+            'kind': kind,
+            'started': time.perf_counter(),
+            'query_count': getattr(thread, 'query_count', 0),
+            'query_time': getattr(thread, 'query_time', 0.0),
+            'memo_hits': memo_hits,
+            'memo_misses': memo_misses
+        }
+
+    @classmethod
+    def finish(cls, measurement: dict, response_bytes: Optional[int], failed: bool) -> None:
+        """
+        Adds values of the finished request
+        @param measurement: value returned by 'start'
+        @param response_bytes: size of the response body (None if unknown, e.g. for streamed response)
+        @param failed: True if the request failed
+        """
+        latency = time.perf_counter() - measurement['started']
+        thread = threading.current_thread()
+        query_count = getattr(thread, 'query_count', 0) - measurement['query_count']
+        query_time = getattr(thread, 'query_time', 0.0) - measurement['query_time']
+        memo_hits, memo_misses = RequestMemo.get_thread_counts()
+
+        bucket_index = len(LATENCY_BUCKETS)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                bucket_index = index
+                break
+
+        key = (measurement['route'], measurement['kind'])
+        with cls._lock:
+            series = cls._series.get(key)
+            if series is None:
+                series = cls._series[key] = cls._create_series(*key)
+            series['requests'] += 1
+            series['errors'] += 1 if failed else 0
+            series['latencyBuckets'][bucket_index] += 1
+            series['latencySeconds'] += latency
+            series['sqlQueries'] += query_count
+            series['sqlSeconds'] += query_time
+            series['responseBytes'] += response_bytes or 0
+            series['memoHits'] += memo_hits - measurement['memo_hits']
+            series['memoMisses'] += memo_misses - measurement['memo_misses']
+
+    @classmethod
+    def get_series(cls) -> List[dict]:
+        """
+        Returns copy of the metrics collected by the current worker
+        """
+        with cls._lock:
+            return [dict(series, latencyBuckets=list(series['latencyBuckets'])) for series in cls._series.values()]
+
+    @classmethod
+    def is_flush_due(cls, interval: int) -> bool:
+        """
+        True if the metrics have to be flushed to the database (and marks them as flushed)
+        @param interval: the minimal interval between flushes in seconds, 0 disables flushing
+        """
+        if not interval:
+            return False
+        now = time.monotonic()
+        with cls._lock:
+            if now - cls._last_flush < interval:
+                return False
+            cls._last_flush = now
+        return True
+
+    @classmethod
+    def merge(cls, series_lists: Iterable[List[dict]]) -> List[dict]:
+        """
+        Sums metrics of several workers
+        @param series_lists: lists of the series returned by 'get_series' in each worker
+        """
+        merged = {}
+        for series_list in series_lists:
+            for series in series_list:
+                key = (series['route'], series['kind'])
+                target = merged.get(key)
+                if target is None:
+                    target = merged[key] = cls._create_series(*key)
+                for name in ('requests', 'errors', 'latencySeconds', 'sqlQueries', 'sqlSeconds', 'responseBytes',
+                             'memoHits', 'memoMisses'):
+                    target[name] += series.get(name, 0)
+                for index, count in enumerate(series.get('latencyBuckets', [])[:len(target['latencyBuckets'])]):
+                    target['latencyBuckets'][index] += count
+        return list(merged.values())
+
+    @staticmethod
+    def to_prometheus(series_list: List[dict]) -> str:
+        """
+        Formats metrics in Prometheus text exposition format
+        @param series_list: list of the series
+        """
+        lines = []
+        simple_metrics = (
+            ('clv_api_requests_total', 'counter', 'Number of requests', 'requests'),
+            ('clv_api_errors_total', 'counter', 'Number of failed requests', 'errors'),
+            ('clv_api_sql_queries_total', 'counter', 'Number of SQL queries', 'sqlQueries'),
+            ('clv_api_sql_seconds_total', 'counter', 'Time spent in SQL queries', 'sqlSeconds'),
+            ('clv_api_response_bytes_total', 'counter', 'Size of the response bodies', 'responseBytes'),
+            ('clv_api_memo_hits_total', 'counter', 'Number of values returned from the request memo', 'memoHits'),
+            ('clv_api_memo_misses_total', 'counter', 'Number of values computed by the request memo', 'memoMisses'),
+        )
+        for metric_name, metric_type, metric_help, field_name in simple_metrics:
+            lines.append('# HELP {} {}'.format(metric_name, metric_help))
+            lines.append('# TYPE {} {}'.format(metric_name, metric_type))
+            for series in series_list:
+                lines.append('{}{{{}}} {}'.format(metric_name, EndpointMetrics._labels(series), series[field_name]))
+
+        metric_name = 'clv_api_request_duration_seconds'
+        lines.append('# HELP {} Request latency'.format(metric_name))
+        lines.append('# TYPE {} histogram'.format(metric_name))
+        for series in series_list:
+            labels = EndpointMetrics._labels(series)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, series['latencyBuckets']):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric_name, labels, bound, cumulative))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(metric_name, labels, series['requests']))
+            lines.append('{}_sum{{{}}} {}'.format(metric_name, labels, series['latencySeconds']))
+            lines.append('{}_count{{{}}} {}'.format(metric_name, labels, series['requests']))
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _create_series(route: str, kind: str) -> dict:
+        return {
+            'route': route,
+            'kind': kind,
+            'requests': 0,
+            'errors': 0,
+            'latencyBuckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            'latencySeconds': 0.0,
+            'sqlQueries': 0,
+            'sqlSeconds': 0.0,
+            'responseBytes': 0,
+            'memoHits': 0,
+            'memoMisses': 0
+        }
+
+    @staticmethod
+    def _labels(series: dict) -> str:
+        return 'route="{}",kind="{}"'.format(EndpointMetrics._escape_label(series['route']),
+                                             EndpointMetrics._escape_label(series['kind']))
+
+    @staticmethod
+    def _escape_label(value: str) -> str:
+        return (value or '').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,163 @@
+import logging
+from typing import Iterable, Tuple, Union
+
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+class PendingLot:
+    """
+    Reference to the lot (serial number or series) which does not exist yet.
+    It is created by LotResolver.flush() and the reference receives the id of the created record.
+    """
+
+    def __init__(self, name: str, product_id: int, create_vals: dict = None):
+        self.name = name
+        self.product_id = product_id
+        self.create_vals = create_vals or {}
+        self.id = None
+
+    def __repr__(self):
+        return 'PendingLot({}, {})'.format(self.name, self.product_id)
+
+
+class LotResolver:
+    """
+    Resolves lot names (serial numbers and series) of the document to lot ids in bulk.
+    Existing lots are read with one query per document,
+    the missing ones are created and fake serial numbers are renamed by flush() with batched operations.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, env: OdooEnvWrapper, company_id: Union[int, bool]):
+        """
+        @param env: Environment
+        @param company_id: company of the document (lots of this company and shared lots are used)
+        """
+        self._env = env
+        self._company_id = company_id
+        self._lots = {}
+        self._pending_lots = []
+        self._renamed_lots = {}
+
+    def prefetch(self, keys: Iterable[Tuple[str, int]]) -> None:
+        """
+        Reads all existing lots with passed (name, product id) keys by one query
+        @param keys: pairs of the lot name and product id
+        """
+        keys = {(name, product_id) for name, product_id in keys if name and product_id}
+        keys = {key for key in keys if key not in self._lots}
+        if not keys:
+            return
+
+        domain_filter = [
+            ('name', 'in', list({name for name, _ in keys})),
+            ('product_id', 'in', list({product_id for _, product_id in keys}))
+        ]
+        if self._company_id:
+            domain_filter.extend(['|', ('company_id', '=', self._company_id), ('company_id', '=', False)])
+
+        # the first found lot is used (the same as search(limit=1) with default order)
+        for lot in self._env.lots.search_read(domain_filter, ['name', 'product_id']):
+            key = (lot['name'], lot['product_id'][0])
+            if key in keys and key not in self._lots:
+                self._lots[key] = lot['id']
+
+        self._logger.debug('Prefetched %d existing lots of %d requested', len(self._lots), len(keys))
+
+    def resolve(self, name: str, product_id: int, create_vals: dict = None) -> Union[int, PendingLot]:
+        """
+        Returns id of the existing lot or reference to the lot which will be created by flush()
+        @param name: lot name (series or serial number)
+        @param product_id: id of the lot product
+        @param create_vals: additional values of the lot if it has to be created
+        """
+        key = (name, product_id)
+        if key not in self._lots:
+            pending_lot = PendingLot(name, product_id, create_vals)
+            self._pending_lots.append(pending_lot)
+            self._lots[key] = pending_lot
+            self._logger.debug('line creating new lot = %s', name)
+        return self._lots[key]
+
+    def rename(self, lot: Union[int, PendingLot], old_name: str, product_id: int, new_name: str) -> None:
+        """
+        Renames lot (used to replace fake serial numbers). Existing lots are renamed by flush()
+        @param lot: lot id or reference to the pending lot
+        @param old_name: current name of the lot
+        @param product_id: id of the lot product
+        @param new_name: new name of the lot
+        """
+        if self._lots.get((old_name, product_id)) == lot:
+            del self._lots[(old_name, product_id)]
+        self._lots[(new_name, product_id)] = lot
+
+        if isinstance(lot, PendingLot):
+            lot.name = new_name
+        else:
+            self._renamed_lots[lot] = new_name
+
+    def flush(self) -> None:
+        """
+        Renames existing lots with one query and creates all pending lots with a single batched create.
+        """
+        if self._renamed_lots:
+            self._write_lot_names(self._renamed_lots)
+            self._renamed_lots = {}
+
+        if self._pending_lots:
+            vals_list = []
+            for pending_lot in self._pending_lots:
+                vals = {
+                    'product_id': pending_lot.product_id,
+                    'name': pending_lot.name,
+                    'company_id': self._company_id or False
+                }
+                vals.update(pending_lot.create_vals)
+                vals_list.append(vals)
+
+            created_lots = self._env.lots.create(vals_list)
+            for pending_lot, lot in zip(self._pending_lots, created_lots):
+                pending_lot.id = lot.id
+                self._lots[(pending_lot.name, pending_lot.product_id)] = lot.id
+
+            self._logger.debug('Created %d new lots', len(created_lots))
+            self._pending_lots = []
+
+    @staticmethod
+    def get_id(value):
+        """
+        Replaces reference to the pending lot with its id (other values are returned as is)
+        """
+        if isinstance(value, PendingLot):
+            if value.id is None:
+                raise RuntimeError("Lot '{}' is not created yet".format(value.name))
+            return value.id
+        return value
+
+    def _write_lot_names(self, names_by_id: dict) -> None:
+        """
+        Renames lots by one query. The records are invalidated in the cache and marked as modified,
+        python constraints of the name and the change journal are applied as by ORM write
+        """
+        lots = self._env.lots.browse(list(names_by_id))
+        if self._env.odoo_version >= 16:
+            lots.flush_recordset(['name'])
+        else:
+            lots.flush(['name'], lots)
+
+        self._env.cr.execute(f"""
+            UPDATE {lots._table} lot
+            SET name = renamed.name, write_date = (now() at time zone 'UTC'), write_uid = %s
+            FROM unnest(%s::int[], %s::varchar[]) AS renamed (id, name)
+            WHERE lot.id = renamed.id
+        """, [self._env.uid, list(names_by_id), list(names_by_id.values())])
+
+        if self._env.odoo_version >= 16:
+            lots.invalidate_recordset()
+        else:
+            lots.invalidate_cache(ids=lots.ids)
+        lots.modified(['name'])
+        lots._validate_fields(['name'])
+        self._env['clv_api.change_log'].sudo().log_changes(lots._name, lots.ids, 'upsert')
+
+        self._logger.debug('Renamed %d lots', len(names_by_id))
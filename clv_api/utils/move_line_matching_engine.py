@@ -0,0 +1,548 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from ..controllers.common_utils import CommonUtils
+from ..controllers.document_type_info import BusinessLocationType, DocumentTypeInfo
+from .lot_resolver import LotResolver
+from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+class MoveLineState:
+    """
+    In-memory snapshot of the 'stock.move.line' fields used to match actual lines of Cleverence document.
+    """
+
+    def __init__(self, row: dict, qty_done_name: str, reserved_name: str):
+        self.id = row['id']
+        self.product_id = row['product_id'] or False
+        self.move_id = row['move_id'] or False
+        self.lot_id = row['lot_id'] or False
+        self.lot_name = row['lot_name']
+        self.location_id = row['location_id'] or False
+        self.location_dest_id = row['location_dest_id'] or False
+        self.product_uom_id = row['product_uom_id'] or False
+        self.picked = row.get('picked', False)
+        self.quantity = row[qty_done_name]
+        self.reserved = row[reserved_name]
+        # values which have to be written to the odoo line on flush
+        self.pending_vals = {}
+
+
+class MoveLineMatchingEngine:
+    """
+    Matches actual lines of Cleverence document with 'stock.move.line' records of the odoo document.
+    All move lines of the document are loaded once and indexed in memory,
+    quantities are distributed in python and modifications are written back by grouped bulk operations.
+    The matching rules are the same as in the former line-by-line processing:
+    exactly matching line, line with not specified lot, line with zero quantity done,
+    bound move line and, finally, any line containing the product.
+    """
+    _logger = logging.getLogger(__name__)
+    _cutils = CommonUtils()
+
+    def __init__(self, env: OdooEnvWrapper, doc_type: DocumentTypeInfo, odoo_doc, with_locations: bool,
+                 move_ids_by_key: Optional[Dict[Tuple[int, int], int]] = None):
+        """
+        @param env: Environment
+        @param doc_type: documentTypeInfo object which describes odoo doc
+        @param odoo_doc: the odoo's document stock.picking object
+        @param with_locations: Apply location's filter to find appropriate odoo's document line?
+        @param move_ids_by_key: ids of the document moves by (product id, uom id), used to bind the lines
+        without bound line uid (the document created by the device)
+        """
+        self._env = env
+        self._doc_type = doc_type
+        self._odoo_doc = odoo_doc
+        self._with_locations = with_locations
+        self._move_ids_by_key = move_ids_by_key or {}
+        self._company_id = odoo_doc.company_id.id
+        self._qty_done_name = self.get_quantity_done_name(env)
+        self._reserved_name = self.get_product_uom_qty_name(env)
+
+        self._products = {}
+        self._locations = {}
+        self._uoms = {}
+        self._lines_by_product: Dict[int, List[MoveLineState]] = {}
+        self._line_location_names: Dict[int, set] = {}
+        self._lot_names: Dict[int, str] = {}
+        self._lot_resolver = LotResolver(env, self._company_id)
+        self._new_barcodes = {}
+        self._new_lines = []
+
+    def prepare(self, actual_lines: List[ClvDocLineWrapper]) -> None:
+        """
+        Loads products, locations and move lines required to process passed actual lines.
+        @param actual_lines: Inventory API actual lines
+        """
+        product_ids = {int(line.inventory_item_id) for line in actual_lines if line.actual_quantity != 0}
+        for product in self._env['product.product'].search([('id', 'in', list(product_ids))]):
+            self._products[product.id] = product
+
+        location_ids = set()
+        for line in actual_lines:
+            for location_id in (line.from_location_id, line.to_location_id):
+                if location_id and location_id.isdigit():
+                    location_ids.add(int(location_id))
+        if location_ids:
+            for location in self._env['stock.location'].search([('id', 'in', list(location_ids))]):
+                self._locations[location.id] = location
+
+        lot_keys = set()
+        for line in actual_lines:
+            if int(line.inventory_item_id) in self._products:
+                for lot_name in (line.serial_number, line.series_name):
+                    if lot_name:
+                        lot_keys.add((lot_name, int(line.inventory_item_id)))
+        self._lot_resolver.prefetch(lot_keys)
+
+        self._load_move_lines()
+
+    def _load_move_lines(self) -> None:
+        """
+        Reads all move lines of the document with one query and indexes them by product.
+        """
+        fields = ['product_id', 'move_id', 'lot_id', 'lot_name', 'location_id', 'location_dest_id',
+                  'product_uom_id', self._qty_done_name, self._reserved_name]
+        if self._env.odoo_version >= 17:
+            fields.append('picked')
+
+        move_lines = self._env['stock.move.line'].search([('picking_id', '=', self._odoo_doc.id)])
+        lot_ids = set()
+        line_location_ids = set()
+        uom_ids = set()
+        for row in move_lines.read(fields, load=None):
+            state = MoveLineState(row, self._qty_done_name, self._reserved_name)
+            self._lines_by_product.setdefault(state.product_id, []).append(state)
+            if state.lot_id:
+                lot_ids.add(state.lot_id)
+            line_location_ids.update([state.location_id, state.location_dest_id])
+            uom_ids.add(state.product_uom_id)
+
+        if lot_ids:
+            for lot in self._env.lots.search_read([('id', 'in', list(lot_ids))], ['name']):
+                self._lot_names[lot['id']] = lot['name']
+
+        line_location_ids.discard(False)
+        if line_location_ids:
+            for location in self._env['stock.location'].search_read([('id', 'in', list(line_location_ids))],
+                                                                    ['complete_name', 'barcode']):
+                self._line_location_names[location['id']] = {location['complete_name'], location['barcode']}
+
+        if self._env.odoo_version >= 17:
+            uom_ids.discard(False)
+            for uom in self._env['uom.uom'].browse(list(uom_ids)):
+                self._uoms[uom.id] = uom
+
+        self._logger.debug('Loaded %d move lines of document %s', len(move_lines), self._odoo_doc.name)
+
+    def process_line(self,
+                     line: ClvDocLineWrapper,
+                     add_to_any_line: bool,
+                     add_new_line_if_not_declared: bool,
+                     assign_new_barcodes: bool) -> bool:
+        """
+        The core of the processing document line. It either modifies an existing odoo's line or
+        creates new one (in memory, the changes are written by flush()).
+        @param line: Inventory API line dictionary object
+        @param add_to_any_line: Can we apply modifications to any found line?
+        @param add_new_line_if_not_declared: Can we add new line if there is no appropriate line to modify
+        @param assign_new_barcodes: Assign barcode to the odoo product if it filled in line and absent in odoo?
+        @return: False if the line (or the rest of its quantity) is not processed
+        """
+        self._log_processing_line(line)
+
+        if line.actual_quantity == 0:
+            return False
+
+        odoo_product = self._products.get(int(line.inventory_item_id))
+        if not odoo_product:
+            raise RuntimeError("Product with id='{}' not found".format(line.inventory_item_id))
+
+        self._logger.debug('Processing product:%s', odoo_product.name)
+
+        if assign_new_barcodes:
+            self._assign_line_barcode_to_odoo_product(odoo_product, line)
+
+        with_serial = odoo_product.product_tmpl_id.tracking == 'serial'
+        if with_serial and not line.serial_number:
+            if self._doc_type.generate_fake_serial_if_empty and self._env.w15_settings.scan_serials_on_allocation:
+                line.serial_number = CommonUtils.create_random_fake_serial_number()
+            else:
+                raise RuntimeError('No serial number specified to serial tracking odoo product.')
+
+        with_series = odoo_product.product_tmpl_id.tracking == 'lot'
+        if with_series and not line.series_name:
+            raise RuntimeError('No series specified to the line with series tracking')
+
+        product_lines = self._lines_by_product.get(odoo_product.id, [])
+
+        # Trying to find an exactly matching line
+
+        lot = False
+        if with_serial:
+            lot = line.serial_number
+        elif with_series:
+            lot = line.series_name
+
+        location_name = False
+        if self._with_locations:
+            if self._doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
+                location_name = line.to_location_id
+            elif self._doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
+                location_name = line.from_location_id
+
+        found_lines = [
+            state for state in product_lines
+            if not state.picked
+            and (not lot or self._has_lot_name(state, lot))
+            and (not location_name or self._has_location_name(state, location_name))
+        ]
+
+        if len(found_lines) == 1:
+            exact_line = found_lines[0]
+            if self._get_quantity_done(exact_line) >= exact_line.reserved:
+                return True
+
+        if not found_lines and (with_serial or with_series):
+            # Trying to find lines with lot not specified
+            found_lines = [
+                state for state in product_lines
+                if not state.lot_id and not state.lot_name and not state.picked
+            ]
+
+            # Trying to fine lines with any lot and with zero qty done to replace lot
+            if not found_lines and add_to_any_line:
+                found_lines = [state for state in product_lines if state.quantity == 0 or not state.picked]
+        elif not found_lines:
+            bound_move_id = self._get_bound_move_id(odoo_product, line)
+            if bound_move_id:
+                found_lines = [state for state in product_lines if state.move_id == bound_move_id]
+
+            # Trying to find any containing product line
+            if not found_lines and add_to_any_line:
+                found_lines = list(product_lines)
+
+        self._logger.debug('Found %d possible existing lines to update', len(found_lines))
+
+        # distribute quantity per lines
+        while line.actual_quantity > 0:
+            if found_lines:
+                found_lines = [state for state in found_lines if state.reserved > self._get_quantity_done(state)]
+
+            if found_lines and self._with_locations:
+                location_id = False
+                if self._doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
+                    location_id = line.to_location_id
+                elif self._doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
+                    location_id = line.from_location_id
+
+                found_lines = [state for state in found_lines if self._get_odoo_line_location_id(state) == location_id]
+
+            if not found_lines:
+                self._logger.debug('No line find to update')
+                if not add_new_line_if_not_declared:
+                    return False
+                self._logger.debug('Adding new line to the document')
+                self._add_new_move_line(odoo_product, line)
+                break
+
+            found_line = found_lines[0]
+            less_qty = found_line.reserved - self._get_quantity_done(found_line)
+            add_qty = min(less_qty, line.actual_quantity)
+            self._logger.debug('Found exact line to update id = %d, serial = %s', found_line.id, found_line.lot_name)
+            self._logger.debug('Adding quantity=%f, serial=%s, location_id=%s, location_dest_id=%s',
+                               add_qty,
+                               line.serial_number,
+                               line.from_location_id,
+                               line.to_location_id)
+
+            updating_dict = {
+                self._qty_done_name: self._get_quantity_done(found_line) + add_qty,
+                'picked': True,
+                'company_id': self._company_id
+            }
+
+            if with_serial and not self._has_lot_name(found_line, line.serial_number):
+                self._process_fake_serial_number_in_lot_storage(found_line, line)
+                self._set_lot_id_to_update_dict(updating_dict, line.serial_number, odoo_product.id)
+            elif with_series and not self._has_lot_name(found_line, line.series_name):
+                self._set_lot_id_to_update_dict(updating_dict, line.series_name, odoo_product.id)
+            else:
+                self._logger.debug('pass through odoo line lot_id = %s, lot_name = %s',
+                                   found_line.lot_id, found_line.lot_name)
+
+            if self._with_locations:
+                self._add_line_location_to_update_dict(line, updating_dict)
+
+            self._update_move_line(found_line, updating_dict)
+            line.actual_quantity = line.actual_quantity - add_qty
+
+            if line.actual_quantity > 0:
+                self._logger.debug('We have to add %f more quantity by this line', line.actual_quantity)
+
+            if with_serial \
+                    and line.actual_quantity > 0 \
+                    and CommonUtils.is_fake_serial_number(line.serial_number):
+                line.serial_number = CommonUtils.create_random_fake_serial_number()
+
+        return True
+
+    def flush(self) -> None:
+        """
+        Writes all accumulated modifications to the database.
+        Odoo lines with the same modifications are updated by a single write, new lines are created by one call.
+        Missing lots are created before and their ids are substituted into the written values.
+        """
+        for product_id, barcode in self._new_barcodes.items():
+            self._products[product_id].write({'barcode': barcode})
+
+        self._lot_resolver.flush()
+
+        grouped_updates = {}
+        for product_lines in self._lines_by_product.values():
+            for state in product_lines:
+                if state.pending_vals:
+                    vals = {name: LotResolver.get_id(value) for name, value in state.pending_vals.items()}
+                    key = tuple(sorted(vals.items()))
+                    grouped_updates.setdefault(key, []).append(state.id)
+
+        move_lines = self._env['stock.move.line']
+        for vals, line_ids in grouped_updates.items():
+            move_lines.browse(line_ids).write(dict(vals))
+
+        if self._new_lines:
+            move_lines.create([
+                {name: LotResolver.get_id(value) for name, value in vals.items()} for vals in self._new_lines
+            ])
+
+        self._logger.debug('Flushed %d updates (%d writes) and %d new lines',
+                           sum(len(ids) for ids in grouped_updates.values()),
+                           len(grouped_updates),
+                           len(self._new_lines))
+
+        # One pending lot can be set to several lines, so the names are remapped once for all of them
+        self._lot_names = {LotResolver.get_id(lot): name for lot, name in self._lot_names.items()}
+        for product_lines in self._lines_by_product.values():
+            for state in product_lines:
+                state.pending_vals = {}
+                state.lot_id = LotResolver.get_id(state.lot_id)
+        self._new_barcodes = {}
+        self._new_lines = []
+
+    def _update_move_line(self, state: MoveLineState, vals: dict) -> None:
+        """
+        Applies modifications to in-memory state of the odoo line and remembers them to be written on flush.
+        """
+        state.pending_vals.update(vals)
+        state.quantity = vals[self._qty_done_name]
+        state.picked = vals['picked']
+        if 'lot_id' in vals:
+            state.lot_id = vals['lot_id']
+            state.lot_name = vals['lot_name']
+        if 'location_id' in vals:
+            state.location_id = vals['location_id']
+        if 'location_dest_id' in vals:
+            state.location_dest_id = vals['location_dest_id']
+
+        if self._env.odoo_version >= 17:
+            # Since Odoo 17 the reserved quantity is computed from the line quantity
+            uom = self._uoms.get(state.product_uom_id)
+            product_uom = self._products[state.product_id].uom_id
+            if uom and product_uom:
+                state.reserved = uom._compute_quantity(state.quantity, product_uom, rounding_method='HALF-UP')
+            else:
+                state.reserved = state.quantity
+
+    def _has_lot_name(self, state: MoveLineState, lot_name: str) -> bool:
+        """
+        True if odoo line has lot_name or lot_id with passed name
+        """
+        return state.lot_name == lot_name or (bool(state.lot_id) and self._lot_names.get(state.lot_id) == lot_name)
+
+    def _has_location_name(self, state: MoveLineState, location_name: str) -> bool:
+        """
+        True if odoo line location (depends on the document type) matches passed value.
+        The line location is compared by the rules used by odoo to compare many2one field with a string value
+        (by name search of the location).
+        """
+        location_id = self._get_odoo_line_location_id(state)
+        return location_name in self._line_location_names.get(location_id, ())
+
+    def _get_odoo_line_location_id(self, state: MoveLineState):
+        """
+        Returns expected ood's line location id (depends on the document type).
+        """
+        if self._doc_type.main_location_type == BusinessLocationType.DEST:
+            return state.location_dest_id
+        return state.location_id
+
+    def _set_lot_id_to_update_dict(self, update_dict, new_lot: str, product_id: int) -> None:
+        """
+        Sets either existing or new (created on flush) lot to update dict
+        @param update_dict: update dictionary or the odoo line
+        @param new_lot: new lot name (series or serial number)
+        @param product_id: id of the lot product
+        """
+        lot = self._lot_resolver.resolve(new_lot, product_id)
+        self._lot_names[lot] = new_lot
+        update_dict['lot_id'] = lot
+        update_dict['lot_name'] = None
+
+    def _process_fake_serial_number_in_lot_storage(self, state: MoveLineState, line: ClvDocLineWrapper) -> None:
+        """
+        Processes case when current odoo line contains fake serial number.
+        It replaces lots and serial table storage.
+        @param state: odoo line
+        @param line: Inventory API line
+        """
+        if not self._doc_type.can_overwrite_fake_serial_numbers:
+            return
+
+        new_serial = line.serial_number
+        old_serial = self._lot_names.get(state.lot_id) if state.lot_id else False
+        if not new_serial or not state.lot_id or not CommonUtils.is_fake_serial_number(old_serial):
+            return
+
+        self._logger.debug('fake serial number ' + str(old_serial) + ' updating to ' + new_serial)
+        self._lot_resolver.rename(state.lot_id, old_serial, state.product_id, new_serial)
+        self._lot_names[state.lot_id] = new_serial
+
+    def _add_line_location_to_update_dict(self, line: ClvDocLineWrapper, update_dict) -> None:
+        """
+        Adds location id to update dictionary
+        @param line: Inventory API line
+        @param update_dict: odoo's line update dictionary
+        """
+        line_storage_id = False
+        if self._doc_type.main_location_type == BusinessLocationType.DEST and line.to_location_id:
+            line_storage_id = line.to_location_id
+        elif self._doc_type.main_location_type == BusinessLocationType.SRC and line.from_location_id:
+            line_storage_id = line.from_location_id
+
+        if not line_storage_id:
+            return
+
+        line_location = self._locations.get(int(line_storage_id))
+        if not line_location:
+            return
+
+        doc_location = self._cutils.get_doc_main_location(self._env, self._odoo_doc)
+
+        # Verify if line's first storage id corresponds to the document location
+
+        if not line_location.parent_path.startswith(doc_location.parent_path):
+            raise RuntimeError('Document location=%s does not contain line location=%s',
+                               doc_location.parent_path, line_location.parent_path)
+
+        if self._doc_type.main_location_type == BusinessLocationType.DEST:
+            update_dict['location_dest_id'] = line_location.id
+        else:
+            update_dict['location_id'] = line_location.id
+
+    def _assign_line_barcode_to_odoo_product(self, odoo_product, line: ClvDocLineWrapper) -> None:
+        """
+        Assigns barcode to the odoo's product if it is not assigned yet.
+        @param odoo_product: odoo product object
+        @param line: Inventory API line
+        """
+        barcode = line.barcode
+        if not barcode:
+            return
+        product_barcode = self._new_barcodes.get(odoo_product.id) or odoo_product.barcode
+        if product_barcode:
+            if product_barcode != barcode:
+                raise RuntimeError('Can not assign new barcode value to the product.')
+            return
+        self._new_barcodes[odoo_product.id] = barcode
+
+    def _add_new_move_line(self, odoo_product, line: ClvDocLineWrapper) -> None:
+        """
+        Prepares new stock.move.line of the odoo stock.picking document
+        @param odoo_product: odoo product corresponds to adding line
+        @param line: Inventory API line object
+        """
+        new_item = {
+            'picking_id': self._odoo_doc.id,
+            'product_id': odoo_product.id,
+            'product_uom_id': odoo_product.uom_id.id,
+            'location_id': self._odoo_doc.location_id.id,
+            'location_dest_id': self._odoo_doc.location_dest_id.id,
+            'picked': True,
+            self._qty_done_name: line.actual_quantity,
+            'company_id': self._company_id
+        }
+        bound_move_id = self._get_bound_move_id(odoo_product, line)
+        if bound_move_id:
+            new_item['move_id'] = bound_move_id
+        if odoo_product.product_tmpl_id.tracking == 'serial' and line.serial_number:
+            self._set_lot_id_to_update_dict(new_item, line.serial_number, odoo_product.id)
+        elif odoo_product.product_tmpl_id.tracking == 'lot' and line.series_name:
+            self._set_lot_id_to_update_dict(new_item, line.series_name, odoo_product.id)
+        self._add_line_location_to_update_dict(line, new_item)
+        self._new_lines.append(new_item)
+
+    def _log_processing_line(self, line: ClvDocLineWrapper) -> None:
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return
+        self._logger.debug('Processing line: inventory item id = %s, inventory item name = %s, '
+                           'serial = %s, series = %s, qty = %s',
+                           line.inventory_item_id,
+                           line.inventory_item_name,
+                           line.serial_number,
+                           line.series_name,
+                           line.actual_quantity)
+
+    # noinspection PyMethodMayBeStatic
+    def _has_valid_bound_move_line(self, line: ClvDocLineWrapper) -> bool:
+        """
+        Does line contains valid bound line uid value
+        @param line: Inventory API line
+        """
+        return line.bound_document_line_uid.isdigit()
+
+    def _get_bound_move_id(self, odoo_product, line: ClvDocLineWrapper) -> Optional[int]:
+        """
+        Returns id of the move the line is bound to: by bound line uid or by the moves of the created document
+        @param odoo_product: odoo product corresponds to the line
+        @param line: Inventory API line
+        """
+        if self._has_valid_bound_move_line(line):
+            return int(line.bound_document_line_uid)
+        if self._move_ids_by_key and line.unit_of_measure_id and line.unit_of_measure_id.isdigit():
+            return self._move_ids_by_key.get((odoo_product.id, int(line.unit_of_measure_id)))
+        return None
+
+    def _get_quantity_done(self, state: MoveLineState):
+        if self._env.odoo_version >= 17:
+            if state.picked:
+                return state.quantity
+            return 0
+        return state.quantity
+
+    @staticmethod
+    def get_quantity_done_name(env: OdooEnvWrapper) -> str:
+        """
+        Returns the name of the odoo document line done quantity field
+        """
+        if env.odoo_version >= 17:
+            return 'quantity'
+        return 'qty_done'
+
+    @staticmethod
+    def get_product_uom_qty_name(env: OdooEnvWrapper) -> str:
+        """
+        Returns the name of the odoo document line reserved (expected) field
+        """
+        if env.odoo_version >= 17:
+            return 'quantity_product_uom'
+        if env.odoo_version >= 16:
+            return 'reserved_uom_qty'
+        return 'product_uom_qty'
+
+    @staticmethod
+    def get_sql_query_count(env: OdooEnvWrapper) -> Optional[int]:
+        """
+        Returns the number of queries executed by the current cursor (if it is supported)
+        """
+        return getattr(env.cr, 'sql_log_count', None)
@@ -0,0 +1,75 @@
+import threading
+from typing import Any, Callable, Hashable, Tuple
+
+# Hits and misses of all memos used by the thread, read by the endpoint metrics
+_thread_counts = threading.local()
+
+
+class RequestMemo:
+    """
+    Memoization context living as long as one Inventory API request.
+    Stores facts which are expensive to compute and do not change during the request
+    (document type, document location, warehouse, ...).
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self) -> int:
+        """
+        Number of the values returned from the memo
+        """
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Number of the values computed because they were not in the memo
+        """
+        return self._misses
+
+    @staticmethod
+    def get_thread_counts() -> Tuple[int, int]:
+        """
+        Returns the total numbers of hits and misses of all memos used by the current thread
+        """
+        return getattr(_thread_counts, 'hits', 0), getattr(_thread_counts, 'misses', 0)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Returns memoized value or computes and memoizes it
+        @param key: hashable key of the value, e.g. ('document_warehouse', picking id)
+        @param compute: function without arguments computing the value
+        @return: memoized or computed value
+        """
+        if key in self._values:
+            self._hits += 1
+            _thread_counts.hits = getattr(_thread_counts, 'hits', 0) + 1
+            return self._values[key]
+
+        self._misses += 1
+        _thread_counts.misses = getattr(_thread_counts, 'misses', 0) + 1
+        value = compute()
+        self._values[key] = value
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Memoizes value computed in advance (e.g. by one query for several documents)
+        @param key: hashable key of the value
+        @param value: the value
+        """
+        self._values[key] = value
+
+    def invalidate(self, key: Hashable = None) -> None:
+        """
+        Removes memoized value
+        @param key: key of the value, all the values are removed if None
+        """
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
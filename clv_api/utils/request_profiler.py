@@ -0,0 +1,124 @@
+import cProfile
+import marshal
+import random
+import threading
+import time
+import tracemalloc
+from typing import List, Optional, Tuple
+
+
+class ProfilingSettings:
+    """
+    Immutable settings of the requests profiling mode
+    """
+
+    def __init__(self, user_ids: frozenset, device_ids: frozenset, sample_rate: float):
+        """
+        @param user_ids: ids of profiled users
+        @param device_ids: ids of profiled devices (in upper case)
+        @param sample_rate: fraction (0..1) of profiled requests of other users and devices
+        """
+        self._user_ids = user_ids
+        self._device_ids = device_ids
+        self._sample_rate = sample_rate
+
+    def is_profiled(self, user_id: int, device_id: Optional[str]) -> bool:
+        """
+        True if the request of the user from the device has to be profiled
+        """
+        if user_id in self._user_ids:
+            return True
+        if device_id and str(device_id).upper() in self._device_ids:
+            return True
+        return self._sample_rate > 0 and random.random() < self._sample_rate
+
+
+class RequestProfiler:
+    """
+    Captures python profile (cProfile), peak memory (tracemalloc) and SQL statements of the request handler.
+    SQL statements are captured by the query hooks of the current thread (Odoo 15 and above).
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._queries: List[Tuple[float, str]] = []
+        self._started = 0.0
+        self._duration = 0.0
+        self._peak_memory = 0
+        self._tracemalloc_started = False
+        self._previous_query_hooks = None
+
+    @property
+    def duration(self) -> float:
+        """
+        Duration of the profiled code in seconds
+        """
+        return self._duration
+
+    @property
+    def peak_memory(self) -> int:
+        """
+        Peak size of memory blocks traced by tracemalloc in bytes
+        (other threads of the process also affect it if they allocate memory simultaneously)
+        """
+        return self._peak_memory
+
+    @property
+    def sql_count(self) -> int:
+        """
+        Number of SQL statements executed by the profiled code
+        """
+        return len(self._queries)
+
+    def __enter__(self):
+        # tracemalloc is process-wide, it may be already started by another profiled request
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_started = True
+        else:
+            tracemalloc.reset_peak()
+
+        thread = threading.current_thread()
+        self._previous_query_hooks = getattr(thread, 'query_hooks', None)
+        thread.query_hooks = tuple(self._previous_query_hooks or ()) + (self._query_hook,)
+
+        self._started = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._profile.disable()
+        self._duration = time.perf_counter() - self._started
+
+        thread = threading.current_thread()
+        if self._previous_query_hooks is None:
+            del thread.query_hooks
+        else:
+            thread.query_hooks = self._previous_query_hooks
+
+        self._peak_memory = tracemalloc.get_traced_memory()[1]
+        if self._tracemalloc_started:
+            tracemalloc.stop()
+        return False
+
+    def get_pstats_dump(self) -> bytes:
+        """
+        Returns profile in the format of 'pstats' module files (can be loaded by pstats.Stats or snakeviz)
+        """
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
+
+    def get_sql_text(self) -> str:
+        """
+        Returns executed SQL statements with their durations
+        """
+        return '\n\n'.join('-- {:.3f} ms\n{}'.format(delay * 1000, query) for delay, query in self._queries)
+
+    def _query_hook(self, cr, query, params, start, delay) -> None:
+        try:
+            formatted_query = cr._format(query, params)
+            if isinstance(formatted_query, bytes):
+                formatted_query = formatted_query.decode('utf-8', 'replace')
+        except Exception:
+            formatted_query = str(query)
+        self._queries.append((delay, formatted_query))
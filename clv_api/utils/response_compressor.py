@@ -0,0 +1,151 @@
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, Optional
+
+# Default minimal size of the response body (in bytes) to be compressed
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+# Default zlib compression level (1 - the fastest, 9 - the best compression)
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# zlib window bits producing the formats of 'Content-Encoding' values
+_WBITS_BY_ENCODING = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+class ResponseCompressor:
+    """
+    Compresses bodies of http-responses by the encoding negotiated with 'Accept-Encoding' header.
+    Keeps per-endpoint counters of saved bytes and CPU time spent on compression.
+    """
+    _stats_lock = threading.Lock()
+    _stats: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+        """
+        Returns supported encoding accepted by the client ('gzip' is preferred if weights are equal)
+        @param accept_encoding: value of 'Accept-Encoding' header
+        @return: 'gzip', 'deflate' or None if the response must not be compressed
+        """
+        if not accept_encoding:
+            return None
+
+        weights = {}
+        for item in accept_encoding.split(','):
+            parts = item.strip().split(';')
+            encoding = parts[0].strip().lower()
+            weight = 1.0
+            for param in parts[1:]:
+                name, _, value = param.strip().partition('=')
+                if name.strip() == 'q':
+                    try:
+                        weight = float(value)
+                    except ValueError:
+                        weight = 0.0
+            weights[encoding] = weight
+
+        best_encoding = None
+        best_weight = 0.0
+        for encoding in _WBITS_BY_ENCODING:
+            weight = weights.get(encoding, weights.get('*', 0.0))
+            if weight > best_weight:
+                best_encoding = encoding
+                best_weight = weight
+        return best_encoding
+
+    @classmethod
+    def compress(cls, endpoint: str, encoding: str, body: bytes, level: int) -> bytes:
+        """
+        Compresses the body of the response
+        @param endpoint: path of the endpoint the counters are collected for
+        @param encoding: 'gzip' or 'deflate'
+        @param body: uncompressed body
+        @param level: compression level (1-9)
+        @return: compressed body
+        """
+        started = time.thread_time()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS_BY_ENCODING[encoding])
+        compressed = compressor.compress(body) + compressor.flush()
+        cls._add_stats(endpoint, len(body), len(compressed), time.thread_time() - started)
+        return compressed
+
+    @classmethod
+    def compress_stream(cls, endpoint: str, encoding: str, chunks: Iterator[bytes], level: int) -> Iterator[bytes]:
+        """
+        Compresses the body of the streamed response chunk by chunk
+        @param endpoint: path of the endpoint the counters are collected for
+        @param encoding: 'gzip' or 'deflate'
+        @param chunks: uncompressed chunks of the body
+        @param level: compression level (1-9)
+        @return: compressed chunks
+        """
+        compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS_BY_ENCODING[encoding])
+        original_size = 0
+        compressed_size = 0
+        cpu_time = 0.0
+        try:
+            for chunk in chunks:
+                started = time.thread_time()
+                compressed = compressor.compress(chunk)
+                cpu_time += time.thread_time() - started
+                original_size += len(chunk)
+                if compressed:
+                    compressed_size += len(compressed)
+                    yield compressed
+
+            started = time.thread_time()
+            compressed = compressor.flush()
+            cpu_time += time.thread_time() - started
+            compressed_size += len(compressed)
+            yield compressed
+        finally:
+            cls._add_stats(endpoint, original_size, compressed_size, cpu_time)
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Dict[str, float]]:
+        """
+        Returns compression counters of the current process by endpoints
+        @return: dictionary {endpoint: {'responses', 'originalBytes', 'compressedBytes', 'savedBytes', 'cpuSeconds'}}
+        """
+        with cls._stats_lock:
+            return {endpoint: dict(stats) for endpoint, stats in cls._stats.items()}
+
+    @staticmethod
+    def to_prometheus(stats_by_endpoint: Dict[str, Dict[str, float]]) -> str:
+        """
+        Formats compression counters in Prometheus text exposition format
+        @param stats_by_endpoint: counters returned by 'get_stats'
+        """
+        lines = []
+        metrics = (
+            ('clv_api_compressed_responses_total', 'Number of compressed responses', 'responses'),
+            ('clv_api_compression_original_bytes_total', 'Size of the response bodies before compression', 'originalBytes'),
+            ('clv_api_compression_saved_bytes_total', 'Bytes saved by compression', 'savedBytes'),
+            ('clv_api_compression_cpu_seconds_total', 'CPU time spent on compression', 'cpuSeconds'),
+        )
+        for metric_name, metric_help, field_name in metrics:
+            lines.append('# HELP {} {}'.format(metric_name, metric_help))
+            lines.append('# TYPE {} counter'.format(metric_name))
+            for endpoint, stats in stats_by_endpoint.items():
+                escaped_endpoint = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append('{}{{route="{}"}} {}'.format(metric_name, escaped_endpoint, stats.get(field_name, 0)))
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _add_stats(cls, endpoint: str, original_size: int, compressed_size: int, cpu_time: float) -> None:
+        with cls._stats_lock:
+            stats = cls._stats.setdefault(endpoint, {
+                'responses': 0,
+                'originalBytes': 0,
+                'compressedBytes': 0,
+                'savedBytes': 0,
+                'cpuSeconds': 0.0
+            })
+            stats['responses'] += 1
+            stats['originalBytes'] += original_size
+            stats['compressedBytes'] += compressed_size
+            stats['savedBytes'] += original_size - compressed_size
+            stats['cpuSeconds'] += cpu_time
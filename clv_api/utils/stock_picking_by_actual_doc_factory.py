@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Tuple
 
 from ..controllers.common_utils import CommonUtils
 from ..wrappers.clv_doc_line_wrapper import ClvDocLineWrapper
@@ -13,6 +13,14 @@ class StockPickingByActualDocFactory:
         """
         Creates a new 'stock.picking' in Odoo based on Cleverence document created on the mobile device.
         """
+        return cls.create_with_moves(env, clv_doc)[0]
+
+    @classmethod
+    def create_with_moves(cls, env: OdooEnvWrapper, clv_doc: ClvDocWrapper) -> Tuple[object, Dict[Tuple[int, int], int]]:
+        """
+        Creates a new 'stock.picking' in Odoo based on Cleverence document created on the mobile device.
+        @return: created 'stock.picking' and ids of its moves by (product id, uom id)
+        """
 
         warehouse_id = clv_doc.warehouse_id
         if not warehouse_id:
@@ -67,6 +75,8 @@ class StockPickingByActualDocFactory:
 
         grouped_actual_quantities = cls._group_actual_quantities(clv_doc.actual_lines)
 
+        move_name = cls._generate_stock_move_name(clv_doc)
+        vals_list = []
         for group_key, quantity in grouped_actual_quantities.items():
             new_stock_move = {
                 'picking_id': stock_picking.id,
@@ -75,18 +85,22 @@ class StockPickingByActualDocFactory:
                 cls._get_planned_qty_name(env): quantity,
                 'location_id': stock_picking.location_id.id,
                 'location_dest_id': stock_picking.location_dest_id.id,
-                'name': cls._generate_stock_move_name(clv_doc),
+                'name': move_name,
                 'company_id': stock_picking.company_id.id
             }
 
             if env.odoo_version >= 17:
                 new_stock_move['picked'] = False
 
-            stock_picking.move_ids_without_package.create(new_stock_move)
+            vals_list.append(new_stock_move)
+
+        # All moves are created by one call, the order of created records is the same as the order of values
+        stock_moves = env['stock.move'].create(vals_list)
+        move_ids_by_key = {group_key: move.id for group_key, move in zip(grouped_actual_quantities, stock_moves)}
 
         stock_picking.action_assign()
 
-        return stock_picking
+        return stock_picking, move_ids_by_key
 
     @classmethod
     def _group_actual_quantities(cls, actual_lines: List[ClvDocLineWrapper]) -> dict:
@@ -0,0 +1,154 @@
+import operator
+from typing import Dict, Iterable, List, Optional
+
+from odoo.tools import float_round
+
+from ..wrappers.odoo_env_wrapper import OdooEnvWrapper
+
+
+class StockQuantityAggregator:
+    """
+    Computes on hand quantities of many products at once by one grouped query over 'stock.quant'.
+    Without warehouse and location the result is the same as 'qty_available' field of the products.
+    """
+
+    _OPERATORS = {
+        '=': operator.eq,
+        '!=': operator.ne,
+        '<': operator.lt,
+        '>': operator.gt,
+        '<=': operator.le,
+        '>=': operator.ge,
+    }
+
+    _SQL_OPERATORS = {
+        '=': '=',
+        '!=': '<>',
+        '<': '<',
+        '>': '>',
+        '<=': '<=',
+        '>=': '>=',
+    }
+
+    @classmethod
+    def get_quantities(cls,
+                       env: OdooEnvWrapper,
+                       product_ids: Iterable[int],
+                       warehouse_id: Optional[int] = None,
+                       location_id: Optional[int] = None) -> Dict[int, float]:
+        """
+        Returns on hand quantities of passed products (products without stock have zero quantity)
+        @param env: Environment
+        @param product_ids: ids of the products
+        @param warehouse_id: count only stock of this warehouse
+        @param location_id: count only stock of this location (and its children)
+        @return: dictionary product id -> quantity in the product unit of measure
+        """
+        product_ids = list(set(product_ids))
+        if not product_ids:
+            return {}
+
+        domain = [('product_id', 'in', product_ids)] + cls._get_quant_location_domain(env, warehouse_id, location_id)
+        quantities = cls._sum_quantities_by_product(env, domain)
+
+        result = {}
+        for product in env['product.product'].browse(product_ids):
+            result[product.id] = float_round(quantities.get(product.id, 0.0),
+                                             precision_rounding=product.uom_id.rounding)
+        return result
+
+    @classmethod
+    def get_product_filter(cls,
+                           env: OdooEnvWrapper,
+                           comparison: str,
+                           value,
+                           warehouse_id: Optional[int] = None,
+                           location_id: Optional[int] = None) -> tuple:
+        """
+        Converts a condition on the on hand quantity to the condition on the product id.
+        The condition is checked by the grouped query (HAVING) on the quantities rounded
+        the same way as get_quantities does, so only ids of the matching (or not matching) products are returned.
+        @param env: Environment
+        @param comparison: comparison operator ('=', '!=', '<', '>', '<=', '>=')
+        @param value: compared quantity
+        @param warehouse_id: count only stock of this warehouse
+        @param location_id: count only stock of this location (and its children)
+        @return: domain filter element of 'product.product' model
+        """
+        sql_operator = cls._SQL_OPERATORS.get(comparison)
+        if sql_operator is None:
+            raise RuntimeError("Comparison '{}' is not supported for the stock quantity".format(comparison))
+
+        value = float(value or 0.0)
+        # Products without stock have zero quantity, so if zero matches the condition
+        # the filter is built from the products which do not match it
+        zero_matches = cls._OPERATORS[comparison](0.0, value)
+        quant_domain = cls._get_quant_location_domain(env, warehouse_id, location_id)
+        product_ids = cls._get_product_ids_by_quantity(env, quant_domain, sql_operator, value, not zero_matches)
+        if zero_matches:
+            return 'id', 'not in', product_ids
+        return 'id', 'in', product_ids
+
+    @staticmethod
+    def _get_product_ids_by_quantity(env: OdooEnvWrapper, domain, sql_operator: str, value: float,
+                                     matching: bool) -> List[int]:
+        """
+        Returns ids of the products which quants rounded sum matches (or does not match) the condition
+        """
+        quants = env['stock.quant']
+        if env.odoo_version >= 16:
+            quants.flush_model(['product_id', 'location_id', 'quantity'])
+        else:
+            quants.flush(['product_id', 'location_id', 'quantity'])
+        rounding = """(
+            SELECT uom.rounding FROM product_product product
+            JOIN product_template template ON template.id = product.product_tmpl_id
+            JOIN uom_uom uom ON uom.id = template.uom_id
+            WHERE product.id = "stock_quant"."product_id"
+        )"""
+        # the same rounding as float_round of get_quantities (half away from zero)
+        having = f'ROUND(SUM("stock_quant"."quantity") / {rounding}) * {rounding} {sql_operator} %s'
+        if not matching:
+            having = f"NOT ({having})"
+        query_sql = """
+            SELECT "stock_quant"."product_id" FROM {from_clause} WHERE {where_clause}
+            GROUP BY "stock_quant"."product_id" HAVING {having}
+        """
+
+        if env.odoo_version >= 17:
+            from odoo.tools import SQL
+            query = quants._search(domain)
+            env.cr.execute(SQL(query_sql.format(from_clause='%s', where_clause='%s', having=having),
+                               query.from_clause, query.where_clause or SQL('TRUE'), value))
+        else:
+            query = quants._where_calc(domain)
+            quants._apply_ir_rules(query, 'read')
+            from_clause, where_clause, params = query.get_sql()
+            env.cr.execute(query_sql.format(from_clause=from_clause, where_clause=where_clause or 'TRUE',
+                                            having=having), params + [value])
+        return [row[0] for row in env.cr.fetchall()]
+
+    @staticmethod
+    def _get_quant_location_domain(env: OdooEnvWrapper, warehouse_id: Optional[int], location_id: Optional[int]):
+        """
+        Returns 'stock.quant' domain of the locations where stock is counted
+        """
+        if location_id:
+            return [('location_id', 'child_of', location_id)]
+        if warehouse_id:
+            warehouse = env['stock.warehouse'].browse(warehouse_id)
+            return [('location_id', 'child_of', warehouse.view_location_id.id)]
+        # the same locations as used by the 'qty_available' field
+        return env['product.product']._get_domain_locations()[0]
+
+    @staticmethod
+    def _sum_quantities_by_product(env: OdooEnvWrapper, domain) -> Dict[int, float]:
+        """
+        Sums quant quantities grouped by product with one query
+        """
+        quants = env['stock.quant']
+        if env.odoo_version >= 17:
+            return {product.id: qty for product, qty in quants._read_group(domain, ['product_id'], ['quantity:sum'])}
+
+        groups = quants.read_group(domain, ['product_id', 'quantity:sum'], ['product_id'], lazy=False)
+        return {group['product_id'][0]: group['quantity'] for group in groups}
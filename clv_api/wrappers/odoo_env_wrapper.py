@@ -1,7 +1,9 @@
 from typing import Any
 
 from .odoo_model_wrapper import OdooModelWrapper
+from .settings_snapshot import SettingsSnapshot
 from .w15_settings_wrapper import W15SettingsWrapper
+from ..utils.request_memo import RequestMemo
 
 
 class OdooEnvWrapper:
@@ -12,10 +14,12 @@ class OdooEnvWrapper:
     def __init__(self, env: Any, odoo_version: int):
         self._env = env
         self._odoo_version = odoo_version
+        self._memo = RequestMemo()
 
         # Setting None in the other fields for lazy initialization
 
         self._w15_settings_wrapper = None
+        self._settings_snapshot = None
 
         self._locations = None
         self._lots = None
@@ -46,33 +50,47 @@ class OdooEnvWrapper:
         """
         return self._odoo_version
 
+    @property
+    def memo(self) -> RequestMemo:
+        """
+        Returns memoization context of the current request.
+        """
+        return self._memo
+
     @property
     def w15_settings(self) -> W15SettingsWrapper:
         """
         Returns object providing access to the settings of Warehouse 15 module.
         """
         if self._w15_settings_wrapper is None:
-            self._w15_settings_wrapper = W15SettingsWrapper(self._env)
+            self._w15_settings_wrapper = W15SettingsWrapper(self._env, self._reset_settings_snapshot)
         return self._w15_settings_wrapper
 
+    @property
+    def settings_snapshot(self) -> SettingsSnapshot:
+        """
+        Returns immutable snapshot of Warehouse 15 settings and Odoo capabilities built once per request.
+        """
+        if self._settings_snapshot is None:
+            self._settings_snapshot = SettingsSnapshot.create(self._env, self.w15_settings)
+        return self._settings_snapshot
+
     @property
     def storage_locations_enabled(self) -> bool:
         """
         Determines if storage locations is enabled in Odoo 'stock' (Inventory) module.
         """
-        # 'stock' (Inventory) module allows enabling and disabling storage locations tracking.
-        # Here's a tricky way to define if storage locations enabled.
-        return self._env.user.has_group('stock.group_stock_multi_locations')
+        return self.settings_snapshot.storage_locations_enabled
 
     @property
     def expiration_dates_tracking_enabled(self) -> bool:
         """
         Determines if expiration dates tracking is enabled in Odoo 'stock' (Inventory) module.
         """
-        return self._env['ir.module.module'].sudo().search_count([
-            ('name', '=', 'product_expiry'),
-            ('state', '=', 'installed')
-        ]) > 0
+        return self.settings_snapshot.expiration_dates_tracking_enabled
+
+    def _reset_settings_snapshot(self) -> None:
+        self._settings_snapshot = None
 
     @property
     def locations(self) -> OdooModelWrapper:
@@ -0,0 +1,49 @@
+from typing import Any, NamedTuple
+
+
+class SettingsSnapshot(NamedTuple):
+    """
+    Immutable snapshot of Warehouse 15 settings and Odoo capabilities.
+    It is built once per request, so the values can be read in loops without database queries.
+    """
+    warehouse15_connected: bool
+    check_connection_failed: bool
+    default_scan_locations: bool
+    allow_only_lowest_level_locations: bool
+    auto_create_backorders: bool
+    scan_serials_on_allocation: bool
+    ship_expected_actual_lines: bool
+    storage_locations_enabled: bool
+    expiration_dates_tracking_enabled: bool
+
+    @classmethod
+    def create(cls, env: Any, w15_settings) -> 'SettingsSnapshot':
+        """
+        Builds the snapshot
+        @param env: Odoo Environment object
+        @param w15_settings: W15SettingsWrapper object
+        @return: SettingsSnapshot object
+        """
+        # 'stock' (Inventory) module allows enabling and disabling storage locations tracking.
+        # Here's a tricky way to define if storage locations enabled.
+        storage_locations_enabled = env.user.has_group('stock.group_stock_multi_locations')
+
+        if 'clv_api.settings_cache' in env:
+            expiration_dates_tracking_enabled = env['clv_api.settings_cache'].is_module_installed('product_expiry')
+        else:
+            expiration_dates_tracking_enabled = env['ir.module.module'].sudo().search_count([
+                ('name', '=', 'product_expiry'),
+                ('state', '=', 'installed')
+            ]) > 0
+
+        return cls(
+            warehouse15_connected=w15_settings.warehouse15_connected,
+            check_connection_failed=w15_settings.check_connection_failed,
+            default_scan_locations=w15_settings.default_scan_locations,
+            allow_only_lowest_level_locations=w15_settings.allow_only_lowest_level_locations,
+            auto_create_backorders=w15_settings.auto_create_backorders,
+            scan_serials_on_allocation=w15_settings.scan_serials_on_allocation,
+            ship_expected_actual_lines=w15_settings.ship_expected_actual_lines,
+            storage_locations_enabled=storage_locations_enabled,
+            expiration_dates_tracking_enabled=expiration_dates_tracking_enabled
+        )
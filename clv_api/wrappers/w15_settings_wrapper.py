@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Callable, Optional
 
 from ..utils.type_checker import TypeChecker
 
@@ -8,106 +8,116 @@ class W15SettingsWrapper:
     Wraps Odoo Environment object providing easy access to the settings of Warehouse 15 module.
     """
 
-    def __init__(self, env: Any):
+    def __init__(self, env: Any, on_change: Optional[Callable[[], None]] = None):
+        """
+        @param env: Odoo Environment object
+        @param on_change: function called after any setting is changed
+        """
+        self._env = env
         self._config_params = env['ir.config_parameter'].sudo()
+        self._on_change = on_change
+
+        # Raw values are read from the process-level cache once, parsed values are kept by keys
+        self._raw_values = None
+        self._values = {}
 
     @property
     def warehouse15_connected(self) -> bool:
         """
         Returns value of 'clv_api.clv_warehouse15_connected' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_warehouse15_connected'))
+        return self._get_bool_param('clv_api.clv_warehouse15_connected')
 
     @warehouse15_connected.setter
     def warehouse15_connected(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_warehouse15_connected' setting.
         """
-        self._config_params.set_param('clv_api.clv_warehouse15_connected', value)
+        self._set_param('clv_api.clv_warehouse15_connected', value)
 
     @property
     def check_connection_failed(self) -> bool:
         """
         Returns value of 'clv_api.clv_check_connection_failed' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_check_connection_failed'))
+        return self._get_bool_param('clv_api.clv_check_connection_failed')
 
     @check_connection_failed.setter
     def check_connection_failed(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_check_connection_failed' setting.
         """
-        self._config_params.set_param('clv_api.clv_check_connection_failed', value)
+        self._set_param('clv_api.clv_check_connection_failed', value)
 
     @property
     def default_scan_locations(self) -> bool:
         """
         Returns value of 'clv_api.clv_default_scan_locations' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_default_scan_locations'))
+        return self._get_bool_param('clv_api.clv_default_scan_locations')
 
     @default_scan_locations.setter
     def default_scan_locations(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_default_scan_locations' setting.
         """
-        self._config_params.set_param('clv_api.clv_default_scan_locations', value)
+        self._set_param('clv_api.clv_default_scan_locations', value)
 
     @property
     def allow_only_lowest_level_locations(self) -> bool:
         """
         Returns value of 'clv_api.clv_allow_only_lowest_level_locations' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_allow_only_lowest_level_locations'))
+        return self._get_bool_param('clv_api.clv_allow_only_lowest_level_locations')
 
     @allow_only_lowest_level_locations.setter
     def allow_only_lowest_level_locations(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_allow_only_lowest_level_locations' setting.
         """
-        self._config_params.set_param('clv_api.clv_allow_only_lowest_level_locations', value)
+        self._set_param('clv_api.clv_allow_only_lowest_level_locations', value)
 
     @property
     def auto_create_backorders(self) -> bool:
         """
         Returns value of 'clv_api.clv_auto_create_backorders' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_auto_create_backorders'))
+        return self._get_bool_param('clv_api.clv_auto_create_backorders')
 
     @auto_create_backorders.setter
     def auto_create_backorders(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_auto_create_backorders' setting.
         """
-        self._config_params.set_param('clv_api.clv_auto_create_backorders', value)
+        self._set_param('clv_api.clv_auto_create_backorders', value)
 
     @property
     def scan_serials_on_allocation(self) -> bool:
         """
         Returns value of 'clv_api.clv_scan_serials_on_allocation' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_scan_serials_on_allocation'))
+        return self._get_bool_param('clv_api.clv_scan_serials_on_allocation')
 
     @scan_serials_on_allocation.setter
     def scan_serials_on_allocation(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_scan_serials_on_allocation' setting.
         """
-        self._config_params.set_param('clv_api.clv_scan_serials_on_allocation', value)
+        self._set_param('clv_api.clv_scan_serials_on_allocation', value)
 
     @property
     def ship_expected_actual_lines(self) -> bool:
         """
         Returns value of 'clv_api.clv_ship_expected_actual_lines' setting.
         """
-        return TypeChecker.get_as_bool(self._config_params.get_param('clv_api.clv_ship_expected_actual_lines'))
+        return self._get_bool_param('clv_api.clv_ship_expected_actual_lines')
 
     @ship_expected_actual_lines.setter
     def ship_expected_actual_lines(self, value: bool) -> None:
         """
         Sets value of 'clv_api.clv_ship_expected_actual_lines' setting.
         """
-        self._config_params.set_param('clv_api.clv_ship_expected_actual_lines', value)
+        self._set_param('clv_api.clv_ship_expected_actual_lines', value)
 
     def unlink_all(self) -> None:
         """
@@ -121,3 +131,39 @@ class W15SettingsWrapper:
         self._config_params.search([('key', '=', 'clv_api.clv_auto_create_backorders')]).unlink()
         self._config_params.search([('key', '=', 'clv_api.clv_scan_serials_on_allocation')]).unlink()
         self._config_params.search([('key', '=', 'clv_api.clv_ship_expected_actual_lines')]).unlink()
+
+        self._invalidate()
+
+    def _get_bool_param(self, key: str) -> bool:
+        """
+        Returns boolean value of the setting
+        @param key: key of the setting in 'ir.config_parameter'
+        """
+        if key not in self._values:
+            if self._raw_values is None:
+                self._raw_values = self._read_raw_values()
+            raw_value = self._raw_values[key] if key in self._raw_values else self._config_params.get_param(key)
+            self._values[key] = TypeChecker.get_as_bool(raw_value)
+        return self._values[key]
+
+    def _set_param(self, key: str, value: Any) -> None:
+        """
+        Sets value of the setting and drops cached values
+        @param key: key of the setting in 'ir.config_parameter'
+        @param value: new value
+        """
+        self._config_params.set_param(key, value)
+        self._invalidate()
+
+    def _read_raw_values(self) -> dict:
+        if 'clv_api.settings_cache' in self._env:
+            return self._env['clv_api.settings_cache'].get_settings()
+        return {}
+
+    def _invalidate(self) -> None:
+        self._raw_values = None
+        self._values = {}
+        if 'clv_api.settings_cache' in self._env:
+            self._env['clv_api.settings_cache'].invalidate_settings()
+        if self._on_change:
+            self._on_change()
@@ -31,8 +31,8 @@ class StockPickingOperation(models.Model):
     def _onchange_barcode_scan(self):
         """Function to add product in line when entering a Barcode."""
         if self.barcode:
-            product = self.env['product.product'].search(
-                [('barcode', '=', self.barcode)])
+            product = self.env['stock.picking']._find_products_by_barcode(
+                self.barcode)
             self.product_id = product.id
 
     @api.onchange('product_id')
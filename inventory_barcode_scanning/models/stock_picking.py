@@ -31,8 +31,7 @@ class StockPicking(models.Model):
     def _onchange_barcode(self):
         """Function to add Quantity when entering a Barcode."""
         match = False
-        product_id = self.env['product.product'].search(
-            [('barcode', '=', self.barcode)])
+        product_id = self._find_products_by_barcode(self.barcode)
         if self.barcode and not product_id:
             warning_mess = {
                 'title': _('Warning !'),
@@ -53,3 +52,13 @@ class StockPicking(models.Model):
                                  ' "Add an item" and scan')
                 }
                 return {'warning': warning_mess}
+
+    def _find_products_by_barcode(self, barcode):
+        """Function to find products by barcode using the shared
+        barcode index when it is available."""
+        if barcode and 'clv_api.barcode_index' in self.env:
+            return self.env['product.product'].browse(
+                self.env['clv_api.barcode_index'].get_product_ids_by_barcode(
+                    barcode))
+        return self.env['product.product'].search(
+            [('barcode', '=', barcode)])